@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+""" Briques réutilisables pour la détection d'objets abandonnés (voir chapitre_6.py).
+
+    Les classes principales sont accessibles directement (abandoned_objects.Detection, ...), mais
+    leur module n'est importé qu'au premier accès : importer le paquet est presque gratuit, et une
+    dépendance optionnelle absente (freenect, clarifai, pyarrow) ne gêne que la fonction qui s'en sert.
+"""
+
+import importlib
+
+__version__ = "0.1.0"
+
+# Nom exporté -> module qui le définit
+_EXPORTS = {
+    "Detection": "detection",
+    "open_source": "sources",
+    "register_source": "sources",
+    "get_video": "sources",
+    "get_video_rgb": "sources",
+    "VideoFileSource": "sources",
+    "ImageDirectorySource": "sources",
+    "ReplaySource": "sources",
+    "create_recognizer": "recognition",
+    "register_recognizer": "recognition",
+    "EventLog": "events",
+    "Metrics": "metrics",
+    "MetricsExporter": "metrics",
+    "StreamServer": "stream",
+    "FrameBusReader": "bus",
+    "FrameBusWriter": "bus",
+    "Supervisor": "supervisor",
+    "StageTimer": "profiling",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+""" python -m abandoned_objects : voir abandoned_objects.cli.
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
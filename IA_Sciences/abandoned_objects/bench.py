@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+""" Benchmark de la classe Detection sur des scènes synthétiques rejouées.
+
+    Utilisation (depuis le dossier IA_Sciences) :
+
+        python -m abandoned_objects.bench --resolutions 320x240 640x480 --objects 1 10 50 --output bench.json
+
+    Pour chaque combinaison (résolution, largeur de réduction, nombre d'objets), on génère une scène,
+    on la rejoue aussi vite que possible dans un détecteur sans affichage, puis on relève le nombre
+    de frames par seconde et les percentiles de durée de chaque étape. Le pic de mémoire est mesuré
+    dans un second passage : tracemalloc ralentit chaque allocation et fausserait les durées.
+    Les résultats sont écrits en JSON pour pouvoir comparer plusieurs exécutions.
+
+    Les frames sont rejouées plus vite que le temps de la scène : par défaut, les 100 frames couvrent
+    40 secondes, assez pour que les objets deviennent immobiles (plus de 10 secondes) et soient
+    identifiés (par le service local FakeRecognizer).
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from .detection import Detection
+from .profiling import StageTimer
+from .sources import ReplaySource
+from .synthetic import SyntheticScene
+
+
+def _replay(frames, fps, resize_width, detection_options):
+    """ Rejoue des frames dans un nouveau détecteur sans affichage.
+        Retourne (détecteur, profiler, durée, nombre d'objets devenus immobiles).
+    """
+    source = ReplaySource(frames, fps=fps)
+    timer = StageTimer()
+    stationary = []
+
+    def on_event(event):
+        if event["type"] == "stationary":
+            stationary.append(event["id"])
+
+    # Les délais sont comptés en temps de la scène : les objets deviennent immobiles comme en direct
+    detection = Detection(source, display="headless", resize_width=resize_width, profiler=timer,
+                          clock=source.clock, on_event=on_event, **detection_options)
+    start = time.perf_counter()
+    try:
+        detection.detect_objects()
+    finally:
+        if detection.recognition is not None:
+            detection.recognition.close()
+    return detection, timer, time.perf_counter() - start, len(stationary)
+
+
+def run_benchmark(width, height, n_objects, frames=100, resize_width=500, seed=0, scene_seconds=40.0,
+                  measure_memory=True, **detection_options):
+    """ Rejoue une scène synthétique dans un détecteur sans affichage et retourne les mesures.
+        Paramètres :
+        @width, @height : dimensions des frames de la scène.
+        @n_objects : nombre d'objets qui passent dans la scène.
+        @frames : nombre de frames rejouées.
+        @resize_width : largeur de réduction des frames dans le détecteur.
+        @seed : graine de la scène.
+        @scene_seconds : durée de la scène (horloge du détecteur). Elle doit dépasser le délai au-delà
+                         duquel un objet est considéré immobile (10 secondes) pour mesurer toutes les étapes.
+        @measure_memory : True pour mesurer le pic de mémoire dans un second passage (sous tracemalloc).
+        Les autres paramètres sont transmis au constructeur de Detection. Par défaut, les objets immobiles
+        sont identifiés par le service local FakeRecognizer.
+    """
+    detection_options.setdefault("do_recognize", True)
+    detection_options.setdefault("recognizer", "fake")
+    scene = SyntheticScene(width, height, n_objects=n_objects, frames=frames, seed=seed)
+    scene_frames = list(scene)
+    fps = frames / scene_seconds
+
+    detection, timer, elapsed, found = _replay(scene_frames, fps, resize_width, detection_options)
+
+    # Second passage, identique, pour le pic de mémoire : ses durées ne sont pas gardées
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+        _replay(scene_frames, fps, resize_width, detection_options)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "width": width,
+        "height": height,
+        "resize_width": resize_width,
+        "objects": n_objects,
+        "frames": frames,
+        "scene_seconds": scene_seconds,
+        "seconds": elapsed,
+        "fps": frames / elapsed,
+        "peak_memory_bytes": peak_memory,
+        "tracked_objects": len(detection.objects),
+        "found_objects": found,
+        "stages": timer.summary(),
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la détection sur des scènes synthétiques")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution, default=[(320, 240), (640, 480)],
+                        help="dimensions des frames (LARGEURxHAUTEUR)")
+    parser.add_argument("--resize-widths", nargs="+", type=int, default=[500],
+                        help="largeurs de réduction dans le détecteur")
+    parser.add_argument("--objects", nargs="+", type=int, default=[1, 10, 50],
+                        help="nombres d'objets dans la scène")
+    parser.add_argument("--frames", type=int, default=100, help="nombre de frames par mesure")
+    parser.add_argument("--scene-seconds", type=float, default=40.0,
+                        help="durée de la scène couverte par les frames (horloge du détecteur)")
+    parser.add_argument("--recognizer", default="fake",
+                        help="service d'identification des objets immobiles (none pour ne pas identifier)")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic de mémoire (second passage)")
+    parser.add_argument("--min-object-area", type=int, default=200)
+    parser.add_argument("--blur-size", type=int, default=11)
+    parser.add_argument("--blob-mode", default="contours", choices=["contours", "components"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="fichier JSON de résultats (sinon, sortie standard)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for (width, height), resize_width, n_objects in itertools.product(args.resolutions, args.resize_widths, args.objects):
+        result = run_benchmark(width, height, n_objects,
+                               frames=args.frames,
+                               resize_width=resize_width,
+                               seed=args.seed,
+                               scene_seconds=args.scene_seconds,
+                               measure_memory=not args.no_memory,
+                               do_recognize=args.recognizer != "none",
+                               recognizer=None if args.recognizer == "none" else args.recognizer,
+                               min_object_area=args.min_object_area,
+                               blur_size=args.blur_size,
+                               blob_mode=args.blob_mode)
+        memory = "" if result["peak_memory_bytes"] is None else ", pic mémoire {0:.1f} Mo".format(
+            result["peak_memory_bytes"] / 1e6)
+        print(u"{0}x{1} -> {2}px, {3} objets : {4:.1f} fps, {5} objets immobiles{6}".format(
+            width, height, resize_width, n_objects, result["fps"], result["found_objects"], memory),
+            file=sys.stderr)
+        results.append(result)
+
+    report = {"environment": environment(), "parameters": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+""" Bus de frames en mémoire partagée : un seul processus capture, plusieurs processus lisent.
+
+    Le kinect ne peut être ouvert que par un seul processus. Avec le bus, un démon capture les frames
+    une seule fois (et les convertit une seule fois en BGR), puis les publie dans un anneau en mémoire
+    partagée (multiprocessing.shared_memory). La détection, l'affichage (chapitre_3.2.py, abandoned-objects view)
+    et la capture d'images (abandoned-objects capture) lisent alors le même flux en même temps :
+
+        abandoned-objects bus --source kinect --name kinect       # le démon
+        abandoned-objects detect --source bus:kinect               # la détection
+        abandoned-objects view --source bus:kinect:every           # l'affichage, sans sauter de frame
+
+    Organisation de la mémoire partagée :
+    - un en-tête : format des frames, nombre de slots, numéro de la dernière frame publiée, fin du flux ;
+    - pour chaque slot : numéro et moment de la frame qu'il contient ;
+    - les frames elles-mêmes, les unes après les autres.
+
+    Les lecteurs reçoivent des vues NumPy directement dans la mémoire partagée, sans copie. Comme pour
+    abandoned_objects.clips, chaque slot porte le numéro de sa frame : il vaut -1 pendant l'écriture, et un
+    lecteur peut vérifier (FrameBusReader.valid) que la frame n'a pas été réécrite pendant qu'il s'en servait.
+    Le producteur n'attend jamais les lecteurs : un lecteur trop lent perd des frames (il les compte).
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+BUS_MAGIC = 0x46425553      # "FBUS"
+BUS_VERSION = 1
+
+HEADER_DTYPE = np.dtype([("magic", "<u4"), ("version", "<u4"), ("slots", "<u4"), ("height", "<u4"),
+                         ("width", "<u4"), ("channels", "<u4"), ("closed", "<u4"), ("reserved", "<u4"),
+                         ("latest", "<i8"), ("pid", "<i8")])
+SLOT_DTYPE = np.dtype([("seq", "<i8"), ("timestamp", "<f8")])
+
+# Modes de lecture
+MODE_LATEST = "latest"      # toujours la frame la plus récente (on saute celles publiées entre deux lectures)
+MODE_EVERY = "every"        # toutes les frames, dans l'ordre, tant que le lecteur ne prend pas trop de retard
+
+# Nom du bus quand on n'en précise pas
+DEFAULT_BUS = "frames"
+
+
+def _layout(slots):
+    """ Positions (en octets) des métadonnées des slots et des frames dans la mémoire partagée.
+    """
+    slots_offset = HEADER_DTYPE.itemsize
+    frames_offset = slots_offset + slots * SLOT_DTYPE.itemsize
+    # Les frames commencent sur une limite de 64 octets (une ligne de cache)
+    frames_offset = (frames_offset + 63) // 64 * 64
+    return slots_offset, frames_offset
+
+
+def _open_untracked(name):
+    """ Ouvre une mémoire partagée existante sans l'inscrire auprès du resource tracker du processus :
+        sinon, un simple lecteur supprimerait le bus (sous le producteur) en se terminant.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Avant Python 3.13, l'inscription est automatique : on l'annule
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class _BusMemory:
+    """ Vues NumPy sur la mémoire partagée d'un bus (en-tête, slots et frames).
+    """
+
+    def _map(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+        slots = int(self.header["slots"])
+        slots_offset, frames_offset = _layout(slots)
+        self.slots = slots
+        slot_info = np.ndarray((slots,), SLOT_DTYPE, buffer=shm.buf, offset=slots_offset)
+        self.slot_seq = slot_info["seq"]
+        self.slot_time = slot_info["timestamp"]
+        self.shape = (int(self.header["height"]), int(self.header["width"]), int(self.header["channels"]))
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, buffer=shm.buf, offset=frames_offset)
+
+    def _unmap(self):
+        # Les vues doivent disparaître avant de fermer la mémoire partagée
+        self.header = self.slot_seq = self.slot_time = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Un utilisateur garde encore une vue sur une frame : la mémoire sera libérée avec elle
+            pass
+
+
+class FrameBusWriter(_BusMemory):
+    """ Côté producteur : crée le bus et y publie les frames.
+    """
+
+    def __init__(self, name, shape, slots=8):
+        """ Paramètres :
+            @name : nom du bus (nom de la mémoire partagée, par exemple "kinect").
+            @shape : forme des frames (hauteur, largeur, canaux), en uint8.
+            @slots : nombre de frames gardées dans l'anneau : un lecteur dispose d'au moins slots - 1 frames
+                     de délai pour utiliser une frame avant qu'elle ne soit réécrite.
+        """
+        if len(shape) == 2:
+            shape = tuple(shape) + (1,)
+        frame_bytes = int(np.prod(shape))
+        _, frames_offset = _layout(slots)
+        size = frames_offset + slots * frame_bytes
+
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Bus laissé par un producteur qui s'est arrêté brutalement : on le remplace
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+        header["slots"] = slots
+        header["height"], header["width"], header["channels"] = shape
+        header["closed"] = 0
+        header["latest"] = 0
+        header["pid"] = os.getpid()
+        header["version"] = BUS_VERSION
+        del header
+        self._map(shm)
+        self.slot_seq[:] = 0
+        # Le nombre magique est écrit en dernier : un lecteur n'utilise le bus qu'une fois l'en-tête complet
+        self.header["magic"] = BUS_MAGIC
+
+        self.name = name
+        self.published = 0
+
+    def publish(self, frame, timestamp=None):
+        """ Copie une frame dans le slot suivant de l'anneau et la rend visible aux lecteurs.
+        """
+        seq = int(self.header["latest"]) + 1
+        slot = seq % self.slots
+        # Le slot est marqué "en cours d'écriture" pendant la copie
+        self.slot_seq[slot] = -1
+        np.copyto(self.frames[slot], frame.reshape(self.shape))
+        self.slot_time[slot] = time.time() if timestamp is None else timestamp
+        self.slot_seq[slot] = seq
+        self.header["latest"] = seq
+        self.published += 1
+        return seq
+
+    def close(self):
+        """ Signale la fin du flux aux lecteurs et supprime le bus.
+        """
+        if self.header is None:
+            return
+        self.header["closed"] = 1
+        shm = self.shm
+        self._unmap()
+        shm.unlink()
+
+
+class FrameBusReader(_BusMemory):
+    """ Côté lecteur : lit les frames d'un bus existant. Utilisable comme source de frames (cb_get_frame de Detection).
+    """
+
+    def __init__(self, name, mode=MODE_LATEST, timeout=5.0, poll_interval=0.002):
+        """ Paramètres :
+            @name : nom du bus.
+            @mode : MODE_LATEST (la frame la plus récente) ou MODE_EVERY (toutes les frames, dans l'ordre).
+            @timeout : délai (en secondes) d'attente du bus à l'ouverture, puis de chaque frame. None pour attendre indéfiniment.
+            @poll_interval : intervalle (en secondes) entre deux consultations du numéro de la dernière frame.
+        """
+        if mode not in (MODE_LATEST, MODE_EVERY):
+            raise ValueError("Mode de lecture inconnu : {0}".format(mode))
+        self.name = name
+        self.mode = mode
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        shm = self._attach(name, timeout)
+        self._map(shm)
+        if int(self.header["version"]) != BUS_VERSION:
+            self._unmap()
+            raise ValueError("Version du bus {0} inconnue : {1}".format(name, int(self.header["version"])))
+
+        # Numéro et moment de la dernière frame lue
+        self.seq = 0
+        self.timestamp = 0.0
+        # Frames publiées mais jamais lues (en mode MODE_EVERY : frames réécrites avant d'avoir été lues)
+        self.dropped = 0
+
+    @staticmethod
+    def _attach(name, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                shm = _open_untracked(name)
+                if np.ndarray((), HEADER_DTYPE, buffer=shm.buf)["magic"] == BUS_MAGIC:
+                    return shm
+                shm.close()
+            except FileNotFoundError:
+                pass
+            if deadline is not None and time.monotonic() > deadline:
+                raise IOError("Bus de frames introuvable : {0} (le démon est-il lancé ?)".format(name))
+            time.sleep(0.05)
+
+    @property
+    def closed(self):
+        return self.header is None or bool(self.header["closed"])
+
+    def read(self, timeout=-1):
+        """ Attend une frame plus récente que la dernière lue.
+            Retourne (frame, timestamp) : frame est une vue en lecture seule dans la mémoire partagée,
+            valide tant que valid() retourne True. Retourne (None, None) à la fin du flux ou après le délai d'attente.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.closed:
+                return None, None
+            latest = int(self.header["latest"])
+            if latest > self.seq:
+                if self.mode == MODE_LATEST or self.seq == 0:
+                    seq = latest
+                else:
+                    # Les frames plus anciennes que l'anneau sont perdues ; celle qui va être réécrite aussi
+                    seq = max(self.seq + 1, latest - self.slots + 2)
+                frame, timestamp = self._slot(seq)
+                if frame is not None:
+                    if self.seq:
+                        self.dropped += seq - self.seq - 1
+                    self.seq = seq
+                    self.timestamp = timestamp
+                    return frame, timestamp
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                return None, None
+            time.sleep(self.poll_interval)
+
+    def _slot(self, seq):
+        """ Retourne (vue, moment) de la frame n°seq, (None, None) si elle est en cours de réécriture.
+        """
+        slot = seq % self.slots
+        if self.slot_seq[slot] != seq:
+            return None, None
+        timestamp = float(self.slot_time[slot])
+        frame = self.frames[slot]
+        frame.flags.writeable = False
+        return frame, timestamp
+
+    def valid(self):
+        """ Indique si la dernière frame lue est toujours intacte (elle n'a pas encore été réécrite par le producteur).
+        """
+        return self.header is not None and self.slot_seq[self.seq % self.slots] == self.seq
+
+    def __call__(self):
+        return self.read()[0]
+
+    def clock(self):
+        return self.timestamp
+
+    def stop(self):
+        if self.header is not None:
+            self._unmap()
+
+
+def publish_source(source, name, slots=8, fps=None, should_stop=None):
+    """ Boucle du démon : lit les frames d'une source et les publie sur le bus jusqu'à la fin du flux.
+        Paramètres :
+        @source : source de frames BGR (voir abandoned_objects.sources).
+        @name : nom du bus.
+        @slots : nombre de slots de l'anneau.
+        @fps : cadence maximale de publication (None : au rythme de la source).
+        @should_stop : fonction qui retourne True pour arrêter la boucle.
+        Retourne le nombre de frames publiées.
+    """
+    frame = source()
+    if frame is None:
+        return 0
+    writer = FrameBusWriter(name, frame.shape, slots)
+    period = 1.0 / fps if fps else 0.0
+    next_time = time.monotonic()
+    try:
+        while frame is not None and not (should_stop is not None and should_stop()):
+            writer.publish(frame)
+            if period:
+                next_time += period
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            frame = source()
+    finally:
+        writer.close()
+    return writer.published
+
+
+class FakeProducer:
+    """ Source de frames synthétiques (voir abandoned_objects.synthetic) qui tourne en boucle, pour tester le bus sans kinect.
+    """
+
+    def __init__(self, width=640, height=480, frames=300, seed=0, count=None):
+        """ Paramètres :
+            @width, @height : dimensions des frames.
+            @frames : nombre de frames de la scène, rejouée en boucle.
+            @seed : graine de la scène.
+            @count : nombre total de frames produites (None : sans fin).
+        """
+        from .synthetic import SyntheticScene
+
+        self.scene = SyntheticScene(width, height, frames=frames, seed=seed)
+        self.buffer = None
+        self.count = count
+        self.produced = 0
+
+    def __call__(self):
+        if self.count is not None and self.produced >= self.count:
+            return None
+        self.buffer = self.scene.render(self.produced % len(self.scene), self.buffer)
+        self.produced += 1
+        return self.buffer
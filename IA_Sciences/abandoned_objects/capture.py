@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+""" Capture vidéo dans un thread dédié.
+
+    La récupération d'une frame (freenect.sync_get_video) est bloquante : si elle est faite
+    dans la boucle de traitement, le traitement attend la capture et la capture s'arrête
+    pendant le traitement. Ici, un thread capture en continu et range les frames dans un
+    anneau de buffers préalloués ; la boucle de traitement vient y piocher.
+"""
+
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+# Politiques de gestion de l'anneau quand il est plein
+POLICY_LATEST = "latest"    # on écrase les frames non lues : le lecteur récupère toujours la plus récente
+POLICY_BLOCK = "block"      # le thread de capture attend qu'une place se libère : aucune frame n'est perdue
+
+
+class FrameRing:
+    """ Anneau de taille fixe de buffers préalloués.
+
+        Chaque emplacement ("slot") passe par trois états : libre, rempli (en attente de lecture)
+        et détenu par le lecteur. Le slot détenu par le lecteur n'est jamais réécrit tant que
+        le lecteur n'a pas demandé la frame suivante : la frame retournée par read() reste donc
+        valide jusqu'au prochain appel à read().
+    """
+
+    def __init__(self, size=4, policy=POLICY_LATEST):
+        """ Paramètres :
+            @size : nombre de buffers de l'anneau (au moins 2 : un pour le lecteur, un pour la capture).
+            @policy : POLICY_LATEST ou POLICY_BLOCK.
+        """
+        if size < 2:
+            raise ValueError("L'anneau doit contenir au moins 2 buffers")
+        if policy not in (POLICY_LATEST, POLICY_BLOCK):
+            raise ValueError("Politique inconnue : {0}".format(policy))
+
+        self.size = size
+        self.policy = policy
+
+        # Les buffers sont alloués à la première frame, quand on connaît sa taille
+        self.buffers = None
+        self.timestamps = [0.0] * size
+
+        self.free = collections.deque(range(size))
+        self.filled = collections.deque()
+        self.held = None
+
+        # Compteur de frames perdues (écrasées avant d'avoir été lues)
+        self.dropped = 0
+
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def _allocate(self, frame):
+        self.buffers = [np.empty_like(frame) for _ in range(self.size)]
+
+    def put(self, frame, timestamp):
+        """ Copie une frame dans un buffer libre de l'anneau.
+            Retourne False si l'anneau a été fermé.
+        """
+        with self.cond:
+            if self.buffers is None or self.buffers[0].shape != frame.shape or self.buffers[0].dtype != frame.dtype:
+                # Changement de résolution : on réalloue, les frames en attente sont perdues
+                self._allocate(frame)
+                self.dropped += len(self.filled)
+                self.free.extend(self.filled)
+                self.filled.clear()
+
+            while not self.free and not self.closed:
+                if self.policy == POLICY_LATEST:
+                    # On sacrifie la plus ancienne frame non lue
+                    self.free.append(self.filled.popleft())
+                    self.dropped += 1
+                else:
+                    self.cond.wait()
+            if self.closed:
+                return False
+            slot = self.free.popleft()
+
+        # La copie se fait hors du verrou : le slot n'appartient qu'au thread de capture
+        np.copyto(self.buffers[slot], frame)
+        self.timestamps[slot] = timestamp
+
+        with self.cond:
+            self.filled.append(slot)
+            self.cond.notify_all()
+        return True
+
+    def read(self, timeout=None):
+        """ Retourne (frame, timestamp) ou (None, None) si l'anneau est fermé ou si le délai est dépassé.
+            Avec POLICY_LATEST on saute directement à la frame la plus récente.
+        """
+        with self.cond:
+            # On rend le slot lu précédemment
+            if self.held is not None:
+                self.free.append(self.held)
+                self.held = None
+                self.cond.notify_all()
+
+            if not self.cond.wait_for(lambda: self.filled or self.closed, timeout):
+                return None, None
+            if not self.filled:
+                return None, None
+
+            if self.policy == POLICY_LATEST:
+                while len(self.filled) > 1:
+                    self.free.append(self.filled.popleft())
+                    self.dropped += 1
+            self.held = self.filled.popleft()
+            self.cond.notify_all()
+            return self.buffers[self.held], self.timestamps[self.held]
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class ThreadedCapture:
+    """ Capture les frames d'une fonction de callback (par exemple get_video) dans un thread dédié.
+
+        Un objet ThreadedCapture est lui-même appelable et peut donc remplacer le callback
+        cb_get_frame de la classe Detection.
+    """
+
+    def __init__(self, cb_get_frame, buffers=4, policy=POLICY_LATEST, late_threshold=0.1):
+        """ Paramètres :
+            @cb_get_frame : callback qui récupère une frame (bloquant). S'il retourne None, la capture s'arrête.
+            @buffers : nombre de buffers préalloués dans l'anneau.
+            @policy : POLICY_LATEST (on ne garde que la plus récente) ou POLICY_BLOCK (on attend le lecteur).
+            @late_threshold : âge en secondes au-delà duquel une frame lue est comptée comme en retard.
+        """
+        self.get_frame = cb_get_frame
+        self.ring = FrameRing(buffers, policy)
+        self.late_threshold = late_threshold
+
+        # Compteurs
+        self.captured = 0
+        self.late = 0
+
+        # Horodatage (monotone) de la dernière frame retournée
+        self.last_timestamp = None
+
+        # Exception levée par le callback de capture, transmise au lecteur
+        self.error = None
+
+        self.thread = None
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self.ring.closed:
+                frame = self.get_frame()
+                timestamp = time.monotonic()
+                if frame is None:
+                    break
+                self.captured += 1
+                if not self.ring.put(frame, timestamp):
+                    break
+        except Exception as e:
+            # Caméra débranchée, erreur freenect... : le lecteur la recevra au lieu d'attendre indéfiniment
+            self.error = e
+        finally:
+            self.ring.close()
+
+    def read(self, timeout=None):
+        """ Retourne (frame, timestamp). La frame reste valide jusqu'au prochain appel.
+            Si le callback de capture a levé une exception, elle est relevée ici une fois les frames en attente lues.
+        """
+        self.start()
+        frame, timestamp = self.ring.read(timeout)
+        if frame is None and self.error is not None:
+            raise self.error
+        if frame is not None:
+            self.last_timestamp = timestamp
+            if time.monotonic() - timestamp > self.late_threshold:
+                self.late += 1
+        return frame, timestamp
+
+    def __call__(self):
+        return self.read()[0]
+
+    def stop(self):
+        self.ring.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def stats(self):
+        return {"captured": self.captured, "dropped": self.dropped, "late": self.late}
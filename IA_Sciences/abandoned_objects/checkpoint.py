@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+""" Sauvegarde périodique de l'état de la détection, pour repartir à chaud après un redémarrage.
+
+    L'état comprend la frame de référence et tous les objets suivis (cadres, moments de première et
+    de dernière apparition, image, tags). Il est écrit dans un seul fichier binaire compact (format
+    .npz de NumPy, non compressé : les images des objets y sont déjà en PNG ou en JPEG) :
+    - les tableaux NumPy sont écrits tels quels ;
+    - les images des objets sont encodées en PNG (ou gardées dans leur compression) et mises bout à bout, avec leurs positions ;
+    - les tags et les informations générales sont en JSON.
+
+    La boucle de détection ne fait que copier les tableaux (quelques Ko) et figer les références des images
+    (abandoned_objects.crops.CropSnapshot) : la lecture des images débordées sur disque, leur encodage et
+    l'écriture se font dans un thread dédié. Le fichier est d'abord écrit à côté, puis renommé : un arrêt
+    brutal pendant l'écriture laisse toujours le checkpoint précédent intact.
+"""
+
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+CHECKPOINT_VERSION = 1
+
+
+def _encoded_crops(crops):
+    """ Retourne les images encodées (octets PNG ou JPEG, b"" pour une place vide).
+        Paramètres :
+        @crops : liste d'images (ou de None), ou CropSnapshot.
+    """
+    for idx in range(len(crops)):
+        if isinstance(crops, list):
+            img = crops[idx]
+        else:
+            stored = crops.read(idx)
+            img = None
+            if stored is not None:
+                data, shape, encoded = stored
+                if encoded:
+                    # Déjà compressée : cv2.imdecode relira le JPEG comme le PNG
+                    yield data.tobytes()
+                    continue
+                img = data.reshape(shape)
+        data = b""
+        if img is not None:
+            ok, encoded = cv2.imencode(".png", img)
+            if ok:
+                data = encoded.tobytes()
+        yield data
+
+
+def release_state(state):
+    """ Libère les ressources d'un état qui ne sera pas (ou plus) écrit (descripteur du CropSnapshot).
+    """
+    close = getattr(state["crops"], "close", None)
+    if close is not None:
+        close()
+
+
+def save_checkpoint(path, state):
+    """ Écrit un état dans un fichier, de façon atomique.
+        Paramètres :
+        @path : chemin du fichier.
+        @state : dictionnaire retourné par Detection.checkpoint_state(). "crops" est une liste d'images
+                 (ou de None) ou un CropSnapshot.
+    """
+    crops = []
+    offsets = [0]
+    for data in _encoded_crops(state["crops"]):
+        crops.append(data)
+        offsets.append(offsets[-1] + len(data))
+
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "saved_at": state["saved_at"],
+        "last_id": state["last_id"],
+        "input_shape": state["input_shape"],
+        "recognition": state["recognition"],
+        "zones": state.get("zones", {}),
+    }
+    arrays = {
+        "meta": np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), np.uint8),
+        "ids": np.asarray(state["ids"], np.int64),
+        "boxes": np.asarray(state["boxes"], np.int32).reshape(-1, 4),
+        "first_seen": np.asarray(state["first_seen"], np.float64),
+        "last_seen": np.asarray(state["last_seen"], np.float64),
+        "found": np.asarray(state["found"], bool),
+        "crops": np.frombuffer(b"".join(crops), np.uint8),
+        "crop_offsets": np.asarray(offsets, np.int64),
+    }
+    if state["reference"] is not None:
+        arrays["reference"] = state["reference"]
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """ Lit un checkpoint. Retourne un dictionnaire de la même forme que celui passé à save_checkpoint.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        if meta.get("version") != CHECKPOINT_VERSION:
+            raise ValueError("Version de checkpoint inconnue : {0}".format(meta.get("version")))
+        blob = data["crops"]
+        offsets = data["crop_offsets"]
+        crops = []
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            crops.append(cv2.imdecode(blob[start:end], cv2.IMREAD_UNCHANGED) if end > start else None)
+        return {
+            "saved_at": meta["saved_at"],
+            "last_id": meta["last_id"],
+            "input_shape": tuple(meta["input_shape"]) if meta["input_shape"] else None,
+            "recognition": meta["recognition"],
+            "zones": meta.get("zones", {}),
+            "reference": data["reference"].copy() if "reference" in data.files else None,
+            "ids": data["ids"].tolist(),
+            "boxes": data["boxes"].copy(),
+            "first_seen": data["first_seen"].copy(),
+            "last_seen": data["last_seen"].copy(),
+            "found": data["found"].tolist(),
+            "crops": crops,
+        }
+
+
+class Checkpointer:
+    """ Écrit les états qu'on lui confie dans un thread dédié. Seul le plus récent état en attente est écrit.
+    """
+
+    def __init__(self, path, interval=60.0):
+        """ Paramètres :
+            @path : chemin du fichier de checkpoint.
+            @interval : durée (en secondes) entre deux checkpoints.
+        """
+        self.path = path
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+        self.pending = None
+        self.written = 0
+        self.failed = 0
+        self.last_duration = 0.0
+
+        self.running = True
+        self.cond = threading.Condition()
+        self.writing = False
+        self.thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+        self.thread.start()
+
+    def due(self):
+        """ Indique s'il est temps de faire un nouveau checkpoint.
+        """
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, state):
+        """ Confie un état au thread d'écriture (un état encore en attente est remplacé).
+        """
+        self.last_save = time.monotonic()
+        with self.cond:
+            if self.pending is not None:
+                release_state(self.pending)
+            self.pending = state
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending is not None or not self.running)
+                state, self.pending = self.pending, None
+                if state is None:
+                    return
+                self.writing = True
+            start = time.perf_counter()
+            try:
+                save_checkpoint(self.path, state)
+                self.written += 1
+            except (IOError, OSError, ValueError) as e:
+                print(u"Erreur d'écriture du checkpoint : {0}".format(e))
+                self.failed += 1
+            finally:
+                release_state(state)
+            self.last_duration = time.perf_counter() - start
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+    def flush(self):
+        """ Attend que l'état en attente soit écrit.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending is None and not self.writing)
+
+    def close(self):
+        """ Écrit l'état en attente, puis arrête le thread.
+        """
+        self.flush()
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+""" Outils en ligne de commande : capture, view, diff, detect, bus et supervise.
+
+    Utilisation (une fois le paquet installé, ou depuis le dossier IA_Sciences avec python -m abandoned_objects) :
+
+        abandoned-objects capture --source kinect --output image_{timestamp}.png
+        abandoned-objects view --source video:enregistrement.mp4
+        abandoned-objects diff image1.png image2.png --save /tmp/diff
+        abandoned-objects detect --config detection.json --stream-port 8080
+        abandoned-objects bus --source kinect --name kinect       (puis --source bus:kinect pour les autres commandes)
+        abandoned-objects supervise --config site.json           (plusieurs caméras, voir abandoned_objects.supervisor)
+
+    Les commandes partagent le même fichier de configuration JSON, par exemple :
+
+        {
+            "source": "kinect:rgb",
+            "source_options": {},
+            "detection": {"min_object_area": 200, "object_movement_threshold": 20, "blur_size": 11},
+            "event_log": "/var/lib/detection/events",
+            "metrics_path": "/var/lib/node_exporter/detection.prom",
+            "stream_port": 8080
+        }
+
+    Les options de la ligne de commande priment sur le fichier. Les modules lourds (OpenCV, NumPy,
+    la détection) ne sont importés que par la commande qui en a besoin, et une dépendance optionnelle
+    absente (freenect, clarifai, ...) donne un message d'erreur clair au lieu d'une trace d'exécution.
+"""
+
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import sys
+
+
+# --- Configuration ---
+
+def load_config(path):
+    """ Lit le fichier de configuration JSON (dictionnaire vide si path est None).
+    """
+    if path is None:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_value(value):
+    """ Valeur d'une option --set : JSON si possible (nombres, booléens, listes, null), sinon chaîne.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def detection_options(config, args):
+    """ Paramètres de Detection : ceux du fichier de configuration, puis ceux de --set.
+    """
+    options = dict(config.get("detection", {}))
+    for item in getattr(args, "set", None) or []:
+        key, _, value = item.partition("=")
+        options[key.replace("-", "_")] = parse_value(value)
+    return options
+
+
+def startup_report(args, stage):
+    """ Affiche (avec --startup-report) le temps écoulé depuis le chargement de l'outil et la mémoire maximale du processus.
+    """
+    if not args.startup_report:
+        return
+    try:
+        import resource
+        # ru_maxrss est en Ko sous Linux
+        memory = "{0:.1f} Mo".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    except ImportError:
+        memory = "inconnue"
+    print(u"Démarrage ({0}) : {1:.0f} ms, mémoire max {2}, {3} modules chargés".format(
+        stage, (time.perf_counter() - _STARTED) * 1000, memory, len(sys.modules)), file=sys.stderr)
+
+
+def open_configured_source(config, args, default="kinect"):
+    from .sources import open_source
+
+    description = args.source or config.get("source", default)
+    return description, open_source(description, **config.get("source_options", {}))
+
+
+def close_source(source):
+    """ Arrête le thread de lecture des sources fichier : il ne doit pas tourner pendant l'arrêt de Python.
+    """
+    stop = getattr(source, "stop", None)
+    if stop is not None:
+        stop()
+
+
+# --- Commandes ---
+
+def cmd_capture(config, args):
+    """ Enregistre une ou plusieurs images de la source (comme chapitre_4.1.py), en rafale ou à intervalle régulier.
+        L'encodage et l'écriture se font dans des threads (voir abandoned_objects.snapshots) : la capture garde la cadence de la source.
+    """
+    import cv2
+    from .snapshots import ImageWriter, capture_images, check_output
+
+    check_output(args.output, args.count)
+    image_format = args.format or os.path.splitext(args.output)[1].lstrip(".").lower() or "png"
+    writer = ImageWriter(image_format,
+                         png_compression=args.png_compression,
+                         jpeg_quality=args.jpeg_quality,
+                         workers=args.workers,
+                         max_pending=args.max_pending,
+                         manifest=args.manifest)
+
+    def on_image(index, path, frame):
+        print(path)
+        if args.show:
+            cv2.imshow("image", frame)
+            cv2.waitKey(1)
+
+    _, source = open_configured_source(config, args)
+    startup_report(args, "source ouverte")
+    try:
+        stats = capture_images(source, writer, args.output,
+                               count=args.count,
+                               interval=args.interval,
+                               dedup_threshold=args.dedup_threshold,
+                               on_image=on_image)
+    except KeyboardInterrupt:
+        stats = None
+    finally:
+        close_source(source)
+        writer.close()
+    if stats is not None and (args.count != 1 or args.dedup_threshold is not None):
+        stats.update(writer.stats())
+        print(u"{captured} images capturées ({fps:.1f}/s), {kept} gardées, {skipped} ignorées, "
+              u"{written} écrites, {failed} en erreur, {stalls} attentes d'écriture".format(**stats), file=sys.stderr)
+    if args.show:
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+    return 0
+
+
+def cmd_view(config, args):
+    """ Affiche le flux vidéo de la source (comme chapitre_3.2.py). Echap pour quitter.
+    """
+    import cv2
+
+    _, source = open_configured_source(config, args)
+    startup_report(args, "source ouverte")
+    try:
+        while True:
+            frame = source()
+            if frame is None:
+                break
+            cv2.imshow("Flux vidéo", frame)
+            if cv2.waitKey(5) & 0xFF == 27:
+                break
+    finally:
+        close_source(source)
+    cv2.destroyAllWindows()
+    return 0
+
+
+def cmd_diff(config, args):
+    """ Compare deux images avec les réglages de la détection (comme chapitre_4.x.py) et affiche les formes trouvées.
+    """
+    import cv2
+    from .blobs import BlobExtractor
+    from .preprocess import Preprocessor
+
+    options = detection_options(config, args)
+    prep = Preprocessor(width=options.get("resize_width", 500),
+                        blur_size=options.get("blur_size", 11),
+                        threshold=options.get("diff_threshold", 45),
+                        dilate_iterations=options.get("dilate_iterations", 2))
+    blobs = BlobExtractor(options.get("blob_mode", "contours"), options.get("min_object_area", 200))
+
+    images = []
+    for path in (args.image1, args.image2):
+        img = cv2.imread(path)
+        if img is None:
+            print(u"Image illisible : {0}".format(path), file=sys.stderr)
+            return 1
+        images.append(img)
+    startup_report(args, "images chargées")
+
+    prep.prepare(images[0])
+    prep.set_reference()
+    prep.prepare(images[1])
+    dilated = prep.diff()
+    boxes = blobs.extract(dilated)
+    for (x, y, w, h) in boxes.tolist():
+        cv2.rectangle(prep.frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+
+    steps = {"frame": prep.frame, "gray": prep.gray, "gray blurred": prep.blurred, "delta": prep.delta,
+             "threshold": prep.threshold, "dilated": prep.dilated, "reference": prep.reference}
+    if args.save:
+        if not os.path.isdir(args.save):
+            os.makedirs(args.save)
+        for name, img in steps.items():
+            cv2.imwrite(os.path.join(args.save, name.replace(" ", "_") + ".png"), img)
+
+    json.dump({"boxes": boxes.tolist(), "changed_pixels": int(cv2.countNonZero(prep.threshold))}, sys.stdout)
+    print()
+
+    if args.show:
+        from .view import show_windows
+        show_windows(steps)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+    return 0
+
+
+def cmd_detect(config, args):
+    """ Lance la détection des objets abandonnés (comme chapitre_6.py).
+    """
+    from .detection import Detection
+
+    description, source = open_configured_source(config, args, default="kinect:rgb")
+    options = detection_options(config, args)
+    options.setdefault("frame_is_rgb", description == "kinect:rgb")
+    # Une source fichier donne le temps de la vidéo : les délais sont comptés dans ce temps
+    if not description.startswith("kinect") and hasattr(source, "clock"):
+        options.setdefault("clock", source.clock)
+    if args.display:
+        options["display"] = args.display
+    if args.recognizer:
+        options["do_recognize"] = True
+        options["recognizer"] = args.recognizer
+
+    metrics = exporter = server = None
+    metrics_path = args.metrics_path or config.get("metrics_path")
+    metrics_port = args.metrics_port or config.get("metrics_port")
+    if metrics_path or metrics_port:
+        from .metrics import Metrics, MetricsExporter, MetricsServer
+        metrics = options["profiler"] = Metrics()
+        if metrics_path:
+            exporter = MetricsExporter(metrics, metrics_path, interval=config.get("metrics_interval", 10)).start()
+        if metrics_port:
+            server = MetricsServer(metrics, port=metrics_port).start()
+
+    event_log = args.event_log or config.get("event_log")
+    if event_log:
+        from .events import EventLog
+        options["event_log"] = EventLog(event_log)
+
+    stream_port = args.stream_port or config.get("stream_port")
+    if stream_port:
+        from .stream import StreamServer
+        options["stream_server"] = StreamServer(host=config.get("stream_host", "127.0.0.1"), port=stream_port).start()
+
+    if args.checkpoint or config.get("checkpoint_path"):
+        options["checkpoint_path"] = args.checkpoint or config.get("checkpoint_path")
+
+    detection = Detection(source, **options)
+    startup_report(args, "détection prête")
+    try:
+        detection.detect_objects()
+    except KeyboardInterrupt:
+        detection.close()
+    finally:
+        close_source(source)
+        if exporter is not None:
+            exporter.stop()
+        if server is not None:
+            server.stop()
+    return 0
+
+
+def cmd_bus(config, args):
+    """ Démon de capture : lit la source une seule fois et publie ses frames sur un bus en mémoire partagée,
+        que les autres commandes (et chapitre_6.py) lisent avec --source bus:NOM. Ctrl+C pour arrêter.
+    """
+    import signal
+    from .bus import FakeProducer, publish_source
+
+    # Un démon est arrêté par SIGTERM : on ferme alors proprement le bus (la mémoire partagée est supprimée)
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+
+    if args.fake:
+        description, source = "fake", FakeProducer(args.width, args.height)
+    else:
+        description, source = open_configured_source(config, args)
+    startup_report(args, "source ouverte")
+    print(u"Bus {0} : frames de {1}".format(args.name, description), file=sys.stderr)
+    try:
+        count = publish_source(source, args.name, slots=args.slots, fps=args.fps, should_stop=lambda: stopped)
+    except KeyboardInterrupt:
+        count = None
+    finally:
+        close_source(source)
+    if count is not None:
+        print(u"{0} frames publiées".format(count), file=sys.stderr)
+    return 0
+
+
+def cmd_supervise(config, args):
+    """ Lance une détection par caméra (voir abandoned_objects.supervisor) et écrit les événements de toutes les caméras
+        en JSON, un par ligne, dans events_path (ou sur la sortie standard). Ctrl+C pour arrêter.
+    """
+    from .supervisor import Supervisor
+
+    cameras = config.get("cameras")
+    if not cameras:
+        print(u"La configuration ne contient aucune caméra (clé \"cameras\")", file=sys.stderr)
+        return 1
+
+    events_path = args.events or config.get("events_path")
+    output = open(events_path, "a") if events_path else sys.stdout
+
+    def write_event(event):
+        output.write(json.dumps(event, ensure_ascii=False) + "\n")
+        output.flush()
+
+    supervisor = Supervisor(cameras,
+                            recognizer=config.get("recognizer"),
+                            recognizer_options=config.get("recognizer_options"),
+                            recognition_rate=config.get("recognition_rate"),
+                            recognition_burst=config.get("recognition_burst", 5),
+                            pin_cpus=config.get("pin_cpus", True),
+                            heartbeat_timeout=config.get("heartbeat_timeout", 30),
+                            on_event=write_event)
+    startup_report(args, "superviseur prêt")
+    try:
+        supervisor.run(duration=args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(supervisor.status(), ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+# --- Analyse de la ligne de commande ---
+
+def build_parser():
+    # Options communes à toutes les commandes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help="fichier de configuration JSON partagé par toutes les commandes")
+    common.add_argument("--source", help='source des frames : "kinect", "kinect:rgb", "video:FICHIER", "images:DOSSIER", ...')
+    common.add_argument("--set", action="append", metavar="PARAMÈTRE=VALEUR",
+                        help="paramètre de Detection (par exemple --set blur_size=21), prime sur la configuration")
+    common.add_argument("--startup-report", action="store_true", help="affiche le temps de démarrage et la mémoire utilisée")
+
+    parser = argparse.ArgumentParser(prog="abandoned-objects", description="Détection d'objets abandonnés")
+    commands = parser.add_subparsers(dest="command", metavar="COMMANDE")
+    commands.required = True
+
+    capture = commands.add_parser("capture", parents=[common], help="enregistrer des images de la source")
+    capture.add_argument("--output", default="image_{timestamp}.png",
+                         help="nom des fichiers ({timestamp} et {index} sont remplacés)")
+    capture.add_argument("--count", type=int, default=1, help="nombre d'images (0 : jusqu'à Ctrl+C ou la fin du flux)")
+    capture.add_argument("--interval", type=float, default=0.0,
+                         help="délai (en secondes) entre deux images (timelapse), 0 pour une rafale à la cadence de la source")
+    capture.add_argument("--format", choices=["png", "jpg"], help="format des images (par défaut celui de l'extension de --output)")
+    capture.add_argument("--png-compression", type=int, default=1, help="niveau de compression PNG (0 à 9)")
+    capture.add_argument("--jpeg-quality", type=int, default=95, help="qualité JPEG (0 à 100)")
+    capture.add_argument("--workers", type=int, default=2, help="nombre de threads d'encodage et d'écriture")
+    capture.add_argument("--max-pending", type=int, default=64, help="nombre maximal d'images en attente d'écriture")
+    capture.add_argument("--dedup-threshold", type=float,
+                         help="ignorer les images presque identiques à la précédente (différence moyenne en niveaux de gris, par exemple 2)")
+    capture.add_argument("--manifest", metavar="FICHIER", help="manifeste des images écrites (JSON, une ligne par image)")
+    capture.add_argument("--show", action="store_true", help="afficher les images capturées")
+    capture.set_defaults(func=cmd_capture)
+
+    view = commands.add_parser("view", parents=[common], help="afficher le flux vidéo")
+    view.set_defaults(func=cmd_view)
+
+    diff = commands.add_parser("diff", parents=[common], help="comparer deux images avec les réglages de la détection")
+    diff.add_argument("image1", help="image de référence")
+    diff.add_argument("image2", help="image à comparer")
+    diff.add_argument("--save", metavar="DOSSIER", help="enregistrer les images de chaque étape")
+    diff.add_argument("--show", action="store_true", help="afficher les images de chaque étape")
+    diff.set_defaults(func=cmd_diff)
+
+    detect = commands.add_parser("detect", parents=[common], help="lancer la détection")
+    detect.add_argument("--display", choices=["full", "debug", "headless"])
+    detect.add_argument("--recognizer", help='service d\'identification ("clarifai", "fake", ...)')
+    detect.add_argument("--event-log", metavar="DOSSIER", help="journal des événements")
+    detect.add_argument("--metrics-path", help="fichier des métriques (format Prometheus)")
+    detect.add_argument("--metrics-port", type=int, help="port du serveur de métriques")
+    detect.add_argument("--stream-port", type=int, help="port du serveur MJPEG")
+    detect.add_argument("--checkpoint", metavar="FICHIER", help="checkpoint de l'état de la détection")
+    detect.set_defaults(func=cmd_detect)
+
+    bus = commands.add_parser("bus", parents=[common], help="publier les frames de la source en mémoire partagée")
+    bus.add_argument("--name", default="frames", help="nom du bus (les lecteurs utilisent --source bus:NOM)")
+    bus.add_argument("--slots", type=int, default=8, help="nombre de frames gardées dans l'anneau")
+    bus.add_argument("--fps", type=float, help="cadence maximale de publication")
+    bus.add_argument("--fake", action="store_true", help="frames synthétiques, pour tester sans kinect")
+    bus.add_argument("--width", type=int, default=640, help="largeur des frames synthétiques")
+    bus.add_argument("--height", type=int, default=480, help="hauteur des frames synthétiques")
+    bus.set_defaults(func=cmd_bus)
+
+    supervise = commands.add_parser("supervise", parents=[common], help="lancer une détection par caméra (clé \"cameras\" de la configuration)")
+    supervise.add_argument("--events", metavar="FICHIER", help="fichier des événements de toutes les caméras (JSON, un par ligne)")
+    supervise.add_argument("--duration", type=float, help="durée (en secondes) au bout de laquelle tout s'arrête")
+    supervise.set_defaults(func=cmd_supervise)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    startup_report(args, "outil chargé")
+    try:
+        config = load_config(args.config)
+        return args.func(config, args)
+    except ImportError as e:
+        # Dépendance optionnelle absente : message clair plutôt qu'une trace d'exécution
+        print(u"Dépendance manquante : {0}".format(e), file=sys.stderr)
+        return 2
+    except (IOError, OSError, ValueError) as e:
+        print(u"Erreur : {0}".format(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+""" Enregistrement de clips vidéo autour des événements (quelques secondes avant et après).
+
+    Quand un objet immobile est trouvé, on ne garde qu'une image de l'objet. Pour comprendre ce qui
+    s'est passé (qui a posé l'objet ?), on veut la vidéo des secondes qui précèdent et qui suivent.
+
+    Les dernières frames sont gardées dans un anneau de buffers préalloués en une seule fois, dont le
+    nombre est fixé par un budget mémoire. La boucle de détection ne fait qu'y copier la frame courante.
+    Quand un événement arrive, on note la plage de frames du clip (de pre_seconds avant à post_seconds
+    après) ; un thread dédié lit ces frames dans l'anneau, au fur et à mesure qu'elles arrivent, et les
+    encode dans un fichier vidéo. La détection n'attend donc jamais ni le disque ni l'encodage.
+
+    Chaque buffer porte le numéro de la frame qu'il contient (principe du "seqlock") : le thread d'encodage
+    vérifie ce numéro avant et après la copie. S'il a changé, la frame a été écrasée pendant la lecture
+    (l'encodage a pris trop de retard) : elle est comptée comme perdue et sautée, sans jamais bloquer la détection.
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class Clip:
+    """ Un clip à encoder : plage de frames, moment de fin et identifiants des objets concernés.
+        Un clip fermé (sa dernière frame est passée) ne peut plus être prolongé.
+    """
+
+    def __init__(self, path, start_seq, end_time, ids):
+        self.path = path
+        self.start_seq = start_seq
+        self.end_time = end_time
+        self.ids = list(ids)
+        self.closed = False
+
+
+class ClipRecorder:
+    """ Garde les dernières secondes de vidéo en mémoire et encode des clips autour des événements, dans un thread dédié.
+    """
+
+    def __init__(self, folder, pre_seconds=5.0, post_seconds=5.0, budget_bytes=128 * 1024 * 1024,
+                 codec="mp4v", extension=".mp4", fps=None, max_pending=8):
+        """ Paramètres :
+            @folder : dossier dans lequel les clips sont écrits.
+            @pre_seconds : durée (en secondes) de vidéo gardée avant l'événement.
+            @post_seconds : durée (en secondes) de vidéo enregistrée après l'événement.
+            @budget_bytes : mémoire (en octets) occupée par l'anneau. Elle limite la durée réellement disponible avant l'événement.
+            @codec : code FourCC du codec vidéo ("mp4v", "XVID", "MJPG", ...).
+            @extension : extension des fichiers vidéo (".mp4", ".avi", ...).
+            @fps : cadence des clips, None pour la mesurer sur les frames de l'anneau.
+            @max_pending : nombre maximal de clips en attente d'encodage (les suivants sont ignorés).
+        """
+        self.folder = folder
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.budget_bytes = budget_bytes
+        self.fourcc = cv2.VideoWriter_fourcc(*codec)
+        self.extension = extension
+        self.fps = fps
+        self.max_pending = max_pending
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        # L'anneau est alloué à la première frame, quand on connaît sa taille
+        self.capacity = 0
+        self.shape = None
+        self.buffers = None
+        self.slot_seq = None
+        self.times = None
+        # Numéro de la dernière frame écrite (les numéros commencent à 1)
+        self.seq = 0
+
+        self.clips = []
+
+        # Compteurs
+        self.written = 0
+        self.lost = 0
+        self.ignored = 0
+        self.failed = 0
+
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="clips", daemon=True)
+        self.thread.start()
+
+    def _allocate(self, frame):
+        # Un seul bloc de mémoire pour tout l'anneau
+        self.capacity = max(int(self.budget_bytes // frame.nbytes), 2)
+        self.shape = frame.shape
+        self.buffers = np.empty((self.capacity,) + frame.shape, frame.dtype)
+        self.slot_seq = np.zeros(self.capacity, np.int64)
+        self.times = np.zeros(self.capacity, np.float64)
+        self.scratch = np.empty_like(frame)
+
+    @property
+    def pending(self):
+        return len(self.clips)
+
+    # --- Côté détection ---
+
+    def add(self, frame, now):
+        """ Copie une frame (BGR) dans l'anneau. Les frames d'une autre taille que la première sont ignorées.
+            Paramètres :
+            @frame : la frame.
+            @now : moment de la frame.
+        """
+        if self.buffers is None:
+            self._allocate(frame)
+        elif frame.shape != self.shape:
+            self.ignored += 1
+            return
+
+        seq = self.seq + 1
+        slot = seq % self.capacity
+        # Le numéro du slot est invalidé pendant la copie : un lecteur qui la croise saura que la frame a changé
+        self.slot_seq[slot] = -1
+        np.copyto(self.buffers[slot], frame)
+        self.times[slot] = now
+        self.slot_seq[slot] = seq
+        self.seq = seq
+
+        # On ne réveille le thread d'encodage que s'il attend des frames
+        if self.clips:
+            with self.cond:
+                self.cond.notify()
+
+    def trigger(self, obj_id, now):
+        """ Demande un clip autour du moment now (par exemple l'immobilisation de l'objet obj_id).
+            Si un clip en attente couvre déjà ce moment, il est prolongé au lieu d'en créer un nouveau.
+            Retourne le chemin du fichier vidéo, ou None si le clip est ignoré.
+        """
+        if self.buffers is None:
+            return None
+        end_time = now + self.post_seconds
+
+        with self.cond:
+            if self.clips and not self.clips[-1].closed and self.clips[-1].end_time >= now - self.pre_seconds:
+                clip = self.clips[-1]
+                clip.end_time = max(clip.end_time, end_time)
+                clip.ids.append(obj_id)
+                return clip.path
+            if len(self.clips) >= self.max_pending:
+                self.ignored += 1
+                return None
+
+        # Première frame du clip : on remonte l'anneau jusqu'à pre_seconds avant l'événement.
+        # On laisse un quart de l'anneau libre : ces frames seront réécrites pendant que le thread d'encodage les lit.
+        oldest = max(self.seq - (self.capacity * 3) // 4 + 1, 1)
+        start = self.seq
+        while start > oldest and self.times[(start - 1) % self.capacity] >= now - self.pre_seconds:
+            start -= 1
+
+        path = os.path.join(self.folder, "clip_{0}_{1}{2}".format(
+            obj_id, time.strftime("%Y%m%d_%H%M%S", time.localtime(now)), self.extension))
+        with self.cond:
+            self.clips.append(Clip(path, start, end_time, [obj_id]))
+            self.cond.notify()
+        return path
+
+    # --- Thread d'encodage ---
+
+    def _read(self, seq):
+        """ Copie la frame n°seq dans scratch. Retourne son moment, ou None si elle a été écrasée.
+        """
+        slot = seq % self.capacity
+        if self.slot_seq[slot] != seq:
+            return None
+        np.copyto(self.scratch, self.buffers[slot])
+        t = self.times[slot]
+        if self.slot_seq[slot] != seq:
+            return None
+        return t
+
+    def _clip_fps(self, start):
+        """ Cadence du clip : celle demandée, sinon celle des frames qui précèdent l'événement.
+        """
+        if self.fps:
+            return self.fps
+        count = self.seq - start
+        if count >= 2:
+            duration = self.times[self.seq % self.capacity] - self.times[start % self.capacity]
+            if duration > 0:
+                return count / duration
+        return 15.0
+
+    def _encode(self, clip):
+        h, w = self.shape[:2]
+        writer = cv2.VideoWriter(clip.path, self.fourcc, self._clip_fps(clip.start_seq), (w, h))
+        if not writer.isOpened():
+            print(u"Impossible d'écrire le clip : {0}".format(clip.path))
+            self.failed += 1
+            with self.cond:
+                clip.closed = True
+            return
+
+        seq = clip.start_seq
+        while True:
+            # On attend la frame suivante (à l'arrêt, le clip s'arrête à la dernière frame reçue)
+            with self.cond:
+                self.cond.wait_for(lambda: self.seq >= seq or not self.running)
+                if self.seq < seq:
+                    clip.closed = True
+                    break
+            # Le thread d'encodage a pris trop de retard : on saute les frames déjà écrasées
+            oldest = self.seq - self.capacity + 1
+            if seq < oldest:
+                self.lost += oldest - seq
+                seq = oldest
+            t = self._read(seq)
+            seq += 1
+            if t is None:
+                self.lost += 1
+                continue
+            # La fin du clip est relue et le clip fermé sous le verrou : trigger ne peut pas le prolonger
+            # après qu'on a décidé d'arrêter l'encodage
+            with self.cond:
+                if t > clip.end_time:
+                    clip.closed = True
+                    break
+            writer.write(self.scratch)
+        writer.release()
+        self.written += 1
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.clips or not self.running)
+                if not self.clips:
+                    return
+                clip = self.clips[0]
+            self._encode(clip)
+            with self.cond:
+                self.clips.pop(0)
+
+    def close(self):
+        """ Termine les clips en attente avec les frames déjà reçues, puis arrête le thread d'encodage.
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+
+    def stats(self):
+        return {"capacity": self.capacity, "pending": self.pending, "written": self.written,
+                "lost": self.lost, "ignored": self.ignored, "failed": self.failed}
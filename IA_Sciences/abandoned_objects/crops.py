@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+""" Stockage des images des objets trouvés, avec un budget mémoire global.
+
+    Chaque image est stockée comme une copie compacte (jamais comme une vue sur une frame, qui
+    garderait toute la frame en mémoire), éventuellement compressée en JPEG ou PNG. Quand le
+    budget est dépassé, les images les moins récemment utilisées sont soit oubliées, soit
+    déplacées dans un fichier sur disque lu par projection mémoire (mmap).
+
+    Les données d'une image ne sont jamais modifiées sur place : une image remplacée reçoit de nouvelles
+    données, et le fichier de débordement ne fait que grandir jusqu'à sa compaction, qui écrit un nouveau
+    fichier. Un CropSnapshot peut donc relire des images dans un autre thread sans rien copier au préalable.
+"""
+
+import collections
+import mmap
+import os
+
+import cv2
+import numpy as np
+
+
+class CropSnapshot:
+    """ Images de quelques objets, figées pour être relues dans un autre thread (écriture d'un checkpoint).
+
+        Seules des références sont gardées : données en mémoire (brutes ou compressées) ou position dans le
+        fichier de débordement, relu par un descripteur dupliqué (il reste valide même après une compaction).
+        Rien n'est décodé ni lu sur le disque avant read().
+    """
+
+    def __init__(self, entries, spill_fd=None):
+        """ Paramètres :
+            @entries : liste de None, ("memory", données, forme, compressée) ou ("spill", position, longueur, forme, compressée).
+            @spill_fd : descripteur du fichier de débordement (fermé par close()).
+        """
+        self.entries = entries
+        self.spill_fd = spill_fd
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, idx):
+        """ Retourne (données, forme, compressée ou non) de la n-ième image, ou None.
+            Les données compressées sont les octets du fichier JPEG ou PNG.
+        """
+        entry = self.entries[idx]
+        if entry is None:
+            return None
+        if entry[0] == "memory":
+            return entry[1:]
+        _, offset, length, shape, encoded = entry
+        data = np.frombuffer(os.pread(self.spill_fd, length, offset), np.uint8)
+        return data, shape, encoded
+
+    def close(self):
+        if self.spill_fd is not None:
+            os.close(self.spill_fd)
+            self.spill_fd = None
+
+
+class CropStore:
+    """ Images des objets { id : image } avec budget mémoire, éviction LRU et débordement optionnel sur disque.
+    """
+
+    def __init__(self, budget_bytes=64 * 1024 * 1024, compression=None, quality=90,
+                 spill_path=None, spill_budget_bytes=1024 * 1024 * 1024):
+        """ Paramètres :
+            @budget_bytes : taille maximale (en octets) des images gardées en mémoire.
+            @compression : None (images brutes), "jpg" ou "png".
+            @quality : qualité JPEG (0 à 100) ou niveau de compression PNG (0 à 9).
+            @spill_path : fichier où déplacer les images qui dépassent le budget (None pour les oublier).
+            @spill_budget_bytes : taille maximale du fichier de débordement. Au-delà, les plus anciennes images du fichier sont oubliées.
+        """
+        if compression not in (None, "jpg", "png"):
+            raise ValueError("Compression inconnue : {0}".format(compression))
+        self.budget_bytes = budget_bytes
+        self.compression = compression
+        if compression == "jpg":
+            self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif compression == "png":
+            self.encode_params = [cv2.IMWRITE_PNG_COMPRESSION, min(quality, 9)]
+
+        # En mémoire : { id : (données, forme, compressée ou non) }, du moins récemment utilisé au plus récent
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.evicted = 0
+
+        # Sur disque : { id : (position, longueur, forme, compressée ou non) }. spill_bytes compte les images
+        # encore utilisées ; le fichier peut être plus gros (images oubliées, jusqu'à la prochaine compaction).
+        self.spill_path = spill_path
+        self.spill_budget_bytes = spill_budget_bytes
+        self.spilled = collections.OrderedDict()
+        self.spill_file = None
+        self.spill_map = None
+        self.spill_bytes = 0
+        if spill_path is not None:
+            self.spill_file = open(spill_path, "w+b")
+
+    def __len__(self):
+        return len(self.entries) + len(self.spilled)
+
+    def __contains__(self, key):
+        return key in self.entries or key in self.spilled
+
+    # --- Encodage ---
+
+    def _pack(self, img):
+        if self.compression is None:
+            # Copie compacte : l'image ne référence plus la frame d'origine
+            data = np.ascontiguousarray(img).copy()
+            return data, img.shape, False
+        ok, data = cv2.imencode("." + self.compression, img, self.encode_params)
+        if not ok:
+            raise ValueError("Impossible d'encoder l'image")
+        return data, img.shape, True
+
+    @staticmethod
+    def _unpack(data, shape, encoded):
+        if encoded:
+            flags = cv2.IMREAD_UNCHANGED
+            return cv2.imdecode(data, flags).reshape(shape)
+        return data.reshape(shape)
+
+    # --- Accès ---
+
+    def put(self, key, img):
+        self.discard(key)
+        data, shape, encoded = self._pack(img)
+        self.entries[key] = (data, shape, encoded)
+        self.bytes += data.nbytes
+        self._enforce_budget()
+
+    def get(self, key):
+        """ Retourne l'image, ou None si elle n'est pas (ou plus) stockée.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return self._unpack(*entry)
+
+        spilled = self.spilled.get(key)
+        if spilled is None:
+            return None
+        offset, length, shape, encoded = spilled
+        data = np.frombuffer(self._map(), np.uint8, length, offset).copy()
+        return self._unpack(data, shape, encoded)
+
+    def snapshot(self, keys):
+        """ Fige les images d'une liste de clés (None pour une place vide) sans les copier ni les décoder.
+            Retourne un CropSnapshot, à fermer après usage.
+        """
+        entries = []
+        spill_fd = None
+        for key in keys:
+            entry = self.entries.get(key) if key is not None else None
+            spilled = self.spilled.get(key) if key is not None else None
+            if entry is not None:
+                entries.append(("memory",) + entry)
+            elif spilled is not None:
+                if spill_fd is None:
+                    spill_fd = os.dup(self.spill_file.fileno())
+                entries.append(("spill",) + spilled)
+            else:
+                entries.append(None)
+        return CropSnapshot(entries, spill_fd)
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[0].nbytes
+        spilled = self.spilled.pop(key, None)
+        if spilled is not None:
+            self.spill_bytes -= spilled[1]
+
+    # --- Budget ---
+
+    def _enforce_budget(self):
+        while self.bytes > self.budget_bytes and self.entries:
+            key, (data, shape, encoded) = self.entries.popitem(last=False)
+            self.bytes -= data.nbytes
+            if self.spill_file is not None:
+                self._spill(key, data, shape, encoded)
+            else:
+                self.evicted += 1
+
+    def _spill(self, key, data, shape, encoded):
+        # Le budget porte sur la taille du fichier, images oubliées comprises
+        self.spill_file.seek(0, os.SEEK_END)
+        if self.spill_file.tell() + data.nbytes > self.spill_budget_bytes:
+            self._compact(self.spill_budget_bytes // 2)
+            self.spill_file.seek(0, os.SEEK_END)
+        offset = self.spill_file.tell()
+        self.spill_file.write(data.tobytes())
+        self.spill_file.flush()
+        self.spilled[key] = (offset, data.nbytes, shape, encoded)
+        self.spill_bytes += data.nbytes
+
+    def _map(self):
+        """ Projection mémoire du fichier de débordement, refaite quand le fichier a grandi.
+        """
+        size = os.fstat(self.spill_file.fileno()).st_size
+        if self.spill_map is None or len(self.spill_map) < size:
+            if self.spill_map is not None:
+                self.spill_map.close()
+            self.spill_map = mmap.mmap(self.spill_file.fileno(), size, access=mmap.ACCESS_READ)
+        return self.spill_map
+
+    def _compact(self, target_bytes):
+        """ Oublie les images les plus anciennes du fichier de débordement jusqu'à target_bytes,
+            puis réécrit le fichier avec les images restantes.
+        """
+        while self.spilled and self.spill_bytes > target_bytes:
+            _, (_, length, _, _) = self.spilled.popitem(last=False)
+            self.spill_bytes -= length
+            self.evicted += 1
+
+        kept = []
+        if self.spilled:
+            mapped = self._map()
+            kept = [(key, mapped[offset:offset + length], shape, encoded)
+                    for key, (offset, length, shape, encoded) in self.spilled.items()]
+        if self.spill_map is not None:
+            self.spill_map.close()
+            self.spill_map = None
+
+        # Les images gardées sont écrites dans un nouveau fichier, qui remplace l'ancien : un CropSnapshot
+        # qui lit encore l'ancien (par son descripteur) n'est pas dérangé
+        spill_file = open(self.spill_path + ".new", "w+b")
+        self.spilled.clear()
+        offset = 0
+        for key, data, shape, encoded in kept:
+            spill_file.write(data)
+            self.spilled[key] = (offset, len(data), shape, encoded)
+            offset += len(data)
+        spill_file.flush()
+        os.replace(self.spill_path + ".new", self.spill_path)
+        self.spill_file.close()
+        self.spill_file = spill_file
+        self.spill_bytes = offset
+
+    def memory_usage(self):
+        """ Retourne l'occupation du stockage (nombre d'images et octets, en mémoire et sur disque).
+        """
+        return {"entries": len(self.entries), "bytes": self.bytes,
+                "spilled_entries": len(self.spilled), "spill_bytes": self.spill_bytes,
+                "evicted": self.evicted}
+
+    def close(self):
+        if self.spill_map is not None:
+            self.spill_map.close()
+            self.spill_map = None
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+            os.remove(self.spill_path)
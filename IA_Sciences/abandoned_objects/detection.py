@@ -0,0 +1,915 @@
+# -*- coding: utf-8 -*-
+""" La classe Detection : détection des objets abandonnés dans un flux vidéo (voir chapitre_6.py).
+
+    Elle s'appuie sur les autres modules du paquet : capture, prétraitement, extraction des formes,
+    suivi des objets, identification, galerie, journal des événements, ...
+"""
+
+import os
+import time
+
+import cv2
+
+from .blobs import BlobExtractor, BLOB_CONTOURS
+from .capture import ThreadedCapture, POLICY_LATEST
+from .checkpoint import Checkpointer, load_checkpoint
+from .clips import ClipRecorder
+from .crops import CropStore
+from .events import EVENT_APPEAR, EVENT_STATIONARY, EVENT_RECOGNIZED, EVENT_DISAPPEAR, EVENT_NAMES
+from .gallery import Gallery
+from .gating import MotionGate
+from .preprocess import Preprocessor
+from .profiling import NullProfiler
+from .rebaseline import Rebaseliner
+from .recognition import RecognitionQueue, create_recognizer
+from .recognition_cache import RecognitionCache, dhash
+from .roi import RegionsOfInterest
+from .tracking import ObjectStore
+from .view import DebugView, show_windows, DISPLAY_FULL, DISPLAY_DEBUG, DISPLAY_HEADLESS
+
+
+### La classe de travail
+class Detection:
+
+    def __init__(self, cb_get_frame, 
+                 min_object_area = 200, 
+                 object_movement_threshold = 10, 
+                 archive_folder = "/tmp/",
+                 do_recognize = False,                
+                 clarifai_client_id = None,
+                 clarifai_client_secret = None,
+                 threaded_capture = False,
+                 capture_buffers = 4,
+                 capture_policy = POLICY_LATEST,
+                 recognizer = None,
+                 recognition_workers = 2,
+                 recognition_queue_size = 32,
+                 recognition_batch_size = 4,
+                 recognition_timeout = 10,
+                 recognition_cache_size = 1024,
+                 recognition_cache_ttl = None,
+                 recognition_cache_path = None,
+                 frame_is_rgb = False,
+                 resize_width = 500,
+                 blur_size = 11,
+                 diff_threshold = 45,
+                 dilate_iterations = 2,
+                 blob_mode = BLOB_CONTOURS,
+                 display = DISPLAY_FULL,
+                 debug_windows = ("frame", "found objects"),
+                 debug_fps = 5,
+                 profiler = None,
+                 clock = None,
+                 motion_gate = False,
+                 gate_width = 32,
+                 gate_threshold = 2.0,
+                 gate_max_skip = 30,
+                 gallery_thumb_size = 120,
+                 gallery_page_interval = 5,
+                 crop_budget_bytes = 64 * 1024 * 1024,
+                 crop_compression = None,
+                 crop_spill_path = None,
+                 event_log = None,
+                 stream_server = None,
+                 checkpoint_path = None,
+                 checkpoint_interval = 60,
+                 checkpoint_max_age = None,
+                 zones = None,
+                 rebaseline = True,
+                 rebaseline_change_ratio = 0.4,
+                 rebaseline_learning_rate = 0.1,
+                 rebaseline_settle_time = 2,
+                 rebaseline_max_hold = 30,
+                 clip_folder = None,
+                 clip_pre_seconds = 5,
+                 clip_post_seconds = 5,
+                 clip_budget_bytes = 128 * 1024 * 1024,
+                 on_event = None):
+        """ Constructeur dans lequel on va initialiser les variables.
+            Paramètres : 
+            @cb_get_frame : callback vers la fonction qui récupère la frame courante du flux vidéo.
+            @min_object_area : aire minimale en pixels des objets détectés dans l'image.
+            @object_movement_threshold : seuil de tolérance pour le mouvement des objets .
+            @archive_folder : dossier qui sera utilisé pour stocker des images sous forme de fichiers (None pour ne rien stocker).
+            @do_recognize : True/False : activer (True) ou non l'identification des objets détectés (par défaut avec Clarifai).
+            @clarifai_client_id : client id pour utiliser l'API de Clarifai.
+            @clarifai_client_secret : clé du client pour utiliser l'API de Clarifai.
+            @threaded_capture : True/False : capturer les frames dans un thread dédié (voir abandoned_objects.capture).
+            @capture_buffers : nombre de buffers préalloués pour la capture dans un thread.
+            @capture_policy : "latest" (on ne traite que la frame la plus récente) ou "block" (aucune frame n'est perdue).
+            @recognizer : service d'identification à utiliser à la place de Clarifai (par exemple abandoned_objects.recognition.FakeRecognizer),
+                          ou son nom dans le registre abandoned_objects.recognition.RECOGNIZERS ("clarifai", "fake", ...).
+            @recognition_workers : nombre de threads (et donc d'appels simultanés) pour l'identification.
+            @recognition_queue_size : nombre maximal d'objets en attente d'identification.
+            @recognition_batch_size : nombre maximal d'images envoyées en un seul appel au service d'identification.
+            @recognition_timeout : délai maximal (en secondes) d'un appel au service d'identification.
+            @recognition_cache_size : nombre d'identifications gardées en cache (0 pour désactiver le cache).
+            @recognition_cache_ttl : durée de vie (en secondes) d'une identification en cache, None pour ne jamais expirer.
+            @recognition_cache_path : fichier dans lequel le cache est conservé entre deux exécutions.
+            @frame_is_rgb : True si cb_get_frame retourne des frames en RGB (comme get_video_rgb), False si elles sont en BGR.
+            @resize_width : largeur (en pixels) à laquelle les frames sont réduites avant le traitement.
+            @blur_size : taille (impaire) du flou gaussien.
+            @diff_threshold : niveau de gris au-delà duquel un pixel est considéré comme changé par rapport à la référence.
+            @dilate_iterations : nombre d'itérations de la dilatation.
+            @blob_mode : "contours" (findContours, une forme à la fois) ou "components" (connectedComponentsWithStats,
+                         toutes les formes en un seul appel, bien plus rapide dans les scènes bruitées). Voir abandoned_objects.blobs.
+            @display : "full" (toutes les fenêtres à chaque frame), "debug" (fenêtres choisies, à fréquence réduite, dans un thread dédié)
+                       ou "headless" (aucun affichage ni dessin, pour les serveurs sans écran).
+            @debug_windows : noms des fenêtres affichées en mode "debug".
+            @debug_fps : nombre maximal de rafraîchissements par seconde en mode "debug".
+            @profiler : profiler qui mesure la durée de chaque étape du traitement (voir abandoned_objects.profiling),
+                        ou abandoned_objects.metrics.Metrics pour exporter aussi des jauges en production.
+            @clock : fonction qui retourne le moment courant en secondes (time.time par défaut).
+                     Avec une source fichier (voir abandoned_objects.sources), on passe source.clock :
+                     les délais sont alors comptés en temps de la vidéo et le traitement peut aller plus vite que le temps réel.
+                     Dans ce cas, on n'utilise pas threaded_capture (les sources fichier décodent déjà dans un thread).
+            @motion_gate : True/False : sauter le traitement complet des frames quand rien n'a bougé (voir abandoned_objects.gating).
+            @gate_width : largeur (en pixels) de la petite image utilisée pour détecter un changement.
+            @gate_threshold : différence moyenne (en niveaux de gris) au-delà de laquelle on considère que l'image a changé.
+            @gate_max_skip : nombre maximal de frames sautées d'affilée ; la frame suivante est traitée quoi qu'il arrive.
+            @gallery_thumb_size : taille maximale (en pixels) des vignettes des objets trouvés.
+            @gallery_page_interval : durée (en secondes) d'affichage de chaque page de la galerie des objets trouvés.
+            @crop_budget_bytes : mémoire maximale (en octets) occupée par les images des objets trouvés.
+            @crop_compression : None, "jpg" ou "png" : compression des images des objets en mémoire.
+            @crop_spill_path : fichier où déplacer les images qui dépassent le budget (None pour oublier les plus anciennes).
+            @event_log : journal (abandoned_objects.events.EventLog) dans lequel enregistrer l'apparition, l'immobilisation,
+                         l'identification et la disparition des objets, avec leur image. Il est fermé par close().
+            @stream_server : serveur (abandoned_objects.stream.StreamServer) qui diffuse les images en MJPEG et la liste des objets en JSON,
+                             pour suivre la détection à distance, même en mode "headless". Il est arrêté par close().
+            @checkpoint_path : fichier dans lequel l'état de la détection (référence, objets suivis, images, tags) est sauvegardé
+                               régulièrement. S'il existe au démarrage, la détection repart de cet état (voir restore_checkpoint).
+            @checkpoint_interval : durée (en secondes) entre deux sauvegardes.
+            @checkpoint_max_age : âge maximal (en secondes) d'un checkpoint pour qu'il soit repris, None pour toujours le reprendre.
+            @zones : zones d'intérêt (voir abandoned_objects.roi) : liste de Zone ou de dictionnaires
+                     {"name": ..., "polygon": [[x, y], ...], "min_object_area": ..., "movement_threshold": ...},
+                     en pixels de la frame réduite. None pour chercher les objets dans toute l'image.
+            @rebaseline : True/False : suspendre la détection quand toute l'image change (lumière, caméra bousculée)
+                          et reconstruire la frame de référence (voir abandoned_objects.rebaseline).
+            @rebaseline_change_ratio : part (entre 0 et 1) des pixels changés au-delà de laquelle la détection est suspendue.
+            @rebaseline_learning_rate : poids de chaque frame dans la moyenne glissante qui donne la nouvelle référence.
+            @rebaseline_settle_time : durée (en secondes) pendant laquelle la scène doit rester stable pour reprendre la détection.
+            @rebaseline_max_hold : durée maximale (en secondes) de la suspension de la détection.
+            @clip_folder : dossier dans lequel enregistrer un clip vidéo autour de chaque nouvel objet immobile
+                           (voir abandoned_objects.clips), None pour ne pas enregistrer de clips.
+            @clip_pre_seconds : durée (en secondes) de vidéo enregistrée avant l'immobilisation de l'objet.
+            @clip_post_seconds : durée (en secondes) de vidéo enregistrée après l'immobilisation de l'objet.
+            @clip_budget_bytes : mémoire maximale (en octets) occupée par les dernières frames gardées pour les clips.
+            @on_event : fonction (ou liste de fonctions) appelée pour chaque événement (apparition, immobilisation,
+                        identification, disparition) avec un dictionnaire {"type", "time", "id", "box", "zone", "tags"}.
+                        Elle peut être appelée depuis un thread d'identification : elle doit être rapide (voir abandoned_objects.supervisor).
+        """
+      
+        # On affecte les valeurs des paramètres à des variables de la classe
+        self.get_frame = cb_get_frame
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.clock = clock if clock is not None else time.time
+        self.min_object_area = min_object_area
+        self.object_movement_threshold = object_movement_threshold
+        self.archive_folder = archive_folder
+        self.do_recognize = do_recognize
+        self.clarifai_client_id = clarifai_client_id
+        self.clarifai_client_secret = clarifai_client_secret
+
+        # Si on le souhaite, la capture se fait dans un thread dédié : elle continue pendant le traitement
+        # de la frame précédente. Les frames sont rangées dans un anneau de buffers préalloués.
+        self.capture = None
+        if threaded_capture:
+            self.capture = ThreadedCapture(cb_get_frame, buffers=capture_buffers, policy=capture_policy)
+            self.get_frame = self.capture
+
+        # On initialise la frame pour l'affichage de l'image
+        self.frame = None
+
+        # Mode d'affichage. En mode "headless", on ne dessine même pas les cadres autour des objets,
+        # sauf si les images sont diffusées par le serveur MJPEG.
+        self.display = display
+        self.stream_server = stream_server
+        self.draw = display != DISPLAY_HEADLESS or stream_server is not None
+        self.debug_view = None
+        if display == DISPLAY_DEBUG:
+            self.debug_view = DebugView(debug_windows, debug_fps)
+
+        # La boucle de détection tourne tant que cet indicateur est à True (voir stop())
+        self.running = False
+
+        # Nombre de frames traitées
+        self.frame_count = 0
+
+        # Le moment de la frame en cours, lu une seule fois par frame sur l'horloge
+        self.now = self.clock()
+
+        # Si on le souhaite, une frame qui n'a pas changé depuis la dernière frame traitée n'est pas traitée à nouveau.
+        # On retient les ids des objets vus sur la dernière frame traitée : ils sont toujours là.
+        self.motion_gate = None
+        if motion_gate:
+            self.motion_gate = MotionGate(width = gate_width,
+                                          threshold = gate_threshold,
+                                          max_skip = gate_max_skip,
+                                          input_rgb = frame_is_rgb)
+        self.visible_ids = []
+        self.visible_boxes = []
+
+        # Si on ne s'intéresse qu'à quelques zones de l'image, tout le traitement se limite au rectangle qui les englobe.
+        # La marge autour de ce rectangle évite que le flou et la dilatation ne se comportent différemment au bord des zones.
+        self.roi = None
+        if zones:
+            self.roi = RegionsOfInterest(zones,
+                                         min_object_area = min_object_area,
+                                         movement_threshold = object_movement_threshold,
+                                         margin = blur_size // 2 + dilate_iterations)
+
+        # Les dernières secondes de vidéo sont gardées en mémoire : un clip est encodé en tâche de fond autour de chaque nouvel objet immobile
+        self.clip_recorder = None
+        if clip_folder is not None:
+            self.clip_recorder = ClipRecorder(clip_folder,
+                                              pre_seconds = clip_pre_seconds,
+                                              post_seconds = clip_post_seconds,
+                                              budget_bytes = clip_budget_bytes)
+
+        # Le préprocesseur alloue une fois pour toutes les images intermédiaires du traitement.
+        # Les clips ont besoin de frames complètes, même avec des zones d'intérêt et rien à dessiner.
+        self.preprocessor = Preprocessor(width = resize_width,
+                                         blur_size = blur_size,
+                                         threshold = diff_threshold,
+                                         dilate_iterations = dilate_iterations,
+                                         input_rgb = frame_is_rgb,
+                                         copy_frame = self.draw,
+                                         profiler = self.profiler,
+                                         roi = self.roi,
+                                         full_frame = self.clip_recorder is not None)
+
+        # Si presque toute l'image change d'un coup (lever du jour, lumière allumée, caméra bousculée), la détection
+        # est suspendue le temps de reconstruire la frame de référence : pas d'avalanche de formes ni d'identifications.
+        self.rebaseliner = None
+        if rebaseline:
+            self.rebaseliner = Rebaseliner(change_ratio = rebaseline_change_ratio,
+                                           threshold = diff_threshold,
+                                           learning_rate = rebaseline_learning_rate,
+                                           settle_time = rebaseline_settle_time,
+                                           max_hold = rebaseline_max_hold,
+                                           roi = self.roi)
+
+        # Extraction des cadres des formes blanches de l'image dilatée
+        # Avec des zones d'intérêt, on garde d'abord les formes qui dépassent la plus petite des aires minimales des zones.
+        min_area = self.roi.min_object_area if self.roi is not None else self.min_object_area
+        self.blob_extractor = BlobExtractor(blob_mode, min_area, profiler = self.profiler)
+
+        # On initialise une frame 'outil' pour afficher les objets détectés hors de l'image.
+        # La taille de cette frame (500px de haut pour 1500px de large) sera à adapter en fonction de l'usage. 
+        # Les objets y sont affichés en vignettes, sur plusieurs pages qui défilent s'il le faut.
+        # Elle n'est redessinée que si la liste des objets trouvés ou de leurs tags change (voir abandoned_objects.gallery).
+        self.gallery = Gallery(1500, 500, thumb_size = gallery_thumb_size, page_interval = gallery_page_interval)
+        self.frame_found_objects = self.gallery.image
+
+        # On intialise la liste des objets détectés. 
+        # Elle contiendra cette structure : 
+        #   { "id1" : 
+        #       {
+        #          "x" : coordonnées
+        #          "y" : coordonnées
+        #          "w" : coordonnées
+        #          "h" : coordonnées
+        #          "img" : l'image de l'objet lors de sa première apparition
+        #          "found" : True si l'objet a été signalé comme objet immobile
+        #          "zone" : le nom de la zone d'intérêt de l'objet (None sans zones d'intérêt)
+        #          "recognition" : une liste de tags qui décrivent l'objet
+        #          "first_seen" : le moment où a été vu l'objet la première fois
+        #          "last_seen" : le dernier moment où a été vu l'objet
+        #       },
+        #     "id2" : 
+        #       { ... },
+        #     ...
+        #  }
+        # Pour que la recherche d'un objet déjà connu reste rapide même avec des centaines d'objets,
+        # les coordonnées et les temps sont stockés dans des tableaux NumPy (voir abandoned_objects.tracking).
+        # L'ObjectStore compte aussi les identifiants : objects.last_id est l'id du dernier objet trouvé.
+        # Les images des objets sont des copies compactes, rangées dans un stockage à budget mémoire fixe (voir abandoned_objects.crops).
+        self.crops = CropStore(budget_bytes = crop_budget_bytes,
+                               compression = crop_compression,
+                               spill_path = crop_spill_path)
+        self.objects = ObjectStore(self.object_movement_threshold, crops = self.crops,
+                                   max_movement_threshold = self.roi.max_movement_threshold if self.roi is not None else None)
+
+        # Journal persistant des événements (None pour n'en garder aucune trace), et fonctions à prévenir de chaque événement
+        self.event_log = event_log
+        if on_event is None:
+            self.event_listeners = []
+        elif callable(on_event):
+            self.event_listeners = [on_event]
+        else:
+            self.event_listeners = list(on_event)
+
+        # Si on souhaite activer l'identification des objets
+        self.recognition = None
+        if self.do_recognize:
+            # Initialisation de Clarifai avec l'identifiant et sa clé, sauf si on fournit un autre service (ou son nom).
+            # Le service n'importe ses dépendances qu'ici. S'il en manque une, la détection tourne sans identification.
+            if recognizer is None:
+                recognizer = "clarifai"
+            if isinstance(recognizer, str):
+                options = {}
+                if recognizer == "clarifai":
+                    options = {"client_id": self.clarifai_client_id, "client_secret": self.clarifai_client_secret}
+                try:
+                    recognizer = create_recognizer(recognizer, **options)
+                except ImportError as e:
+                    print(u"Identification désactivée : {0}".format(e))
+                    self.do_recognize = False
+        if self.do_recognize:
+            # Les appels au service se font en tâche de fond : la boucle vidéo n'attend jamais le réseau.
+            self.recognition = RecognitionQueue(recognizer, self.on_object_recognized,
+                                                workers = recognition_workers,
+                                                max_queue = recognition_queue_size,
+                                                batch_size = recognition_batch_size,
+                                                timeout = recognition_timeout,
+                                                archive_folder = self.archive_folder)
+
+            # Un objet qui revient dans la scène a une image très proche de la précédente :
+            # on retrouve ses tags dans un cache indexé par l'empreinte de l'image.
+            self.recognition_cache = None
+            if recognition_cache_size:
+                self.recognition_cache = RecognitionCache(max_size = recognition_cache_size,
+                                                          ttl = recognition_cache_ttl,
+                                                          path = recognition_cache_path,
+                                                          clock = self.clock)
+            # Empreintes des images en cours d'identification { id : empreinte }
+            self.pending_hashes = {}
+
+        # Sauvegarde régulière de l'état, dans un thread dédié, et reprise à chaud de la dernière sauvegarde
+        self.checkpointer = None
+        if checkpoint_path is not None:
+            if os.path.exists(checkpoint_path):
+                self.restore_checkpoint(checkpoint_path, checkpoint_max_age)
+            self.checkpointer = Checkpointer(checkpoint_path, checkpoint_interval)
+
+        # Jauges exportées avec les métriques (sans effet avec le profiler par défaut)
+        self.profiler.gauge("frames_total", lambda: self.frame_count)
+        self.profiler.gauge("tracked_objects", lambda: len(self.objects))
+        self.profiler.gauge("crops_bytes", lambda: self.crops.bytes)
+        self.profiler.gauge("crops_spill_bytes", lambda: self.crops.spill_bytes)
+        self.profiler.gauge("crops_evicted", lambda: self.crops.evicted)
+        if self.motion_gate is not None:
+            self.profiler.gauge("skipped_frames", lambda: self.motion_gate.skipped_total)
+        if self.capture is not None:
+            self.profiler.gauge("capture_dropped_frames", lambda: self.capture.dropped)
+            self.profiler.gauge("capture_late_frames", lambda: self.capture.late)
+        if self.recognition is not None:
+            self.profiler.gauge("recognition_queue_depth", lambda: self.recognition.depth)
+            self.profiler.gauge("recognition_failed", lambda: self.recognition.failed)
+            if self.recognition_cache is not None:
+                self.profiler.gauge("recognition_cache_hits", lambda: self.recognition_cache.hits)
+                self.profiler.gauge("recognition_cache_misses", lambda: self.recognition_cache.misses)
+        if self.checkpointer is not None:
+            self.profiler.gauge("checkpoints_written", lambda: self.checkpointer.written)
+            self.profiler.gauge("checkpoint_seconds", lambda: self.checkpointer.last_duration)
+        if self.rebaseliner is not None:
+            self.profiler.gauge("detection_on_hold", lambda: int(self.rebaseliner.holding))
+            self.profiler.gauge("reference_rebuilds", lambda: self.rebaseliner.rebuilt)
+        if self.clip_recorder is not None:
+            self.profiler.gauge("clips_written", lambda: self.clip_recorder.written)
+            self.profiler.gauge("clip_frames_lost", lambda: self.clip_recorder.lost)
+        if self.event_log is not None:
+            self.profiler.gauge("events_written", lambda: self.event_log.written)
+            self.profiler.gauge("events_dropped", lambda: self.event_log.dropped)
+
+
+
+
+    def recognize_object(self, obj_id, img):
+        """ Fonction qui demande l'identification de ce que contient l'image.
+            L'identification se fait en tâche de fond : les tags arriveront plus tard dans la liste 'recognition' de l'objet.
+            Paramètres :
+            @obj_id : identifiant de l'objet concerné. Il va servir à compléter la liste des tags 'recognition' de l'objet.
+            @img : l'image de l'objet à identifier.
+        """
+        # On regarde d'abord si un objet qui ressemble a déjà été identifié
+        if self.recognition_cache is not None:
+            h = dhash(img)
+            tags = self.recognition_cache.get(h)
+            if tags is not None:
+                print(u"Objet déjà identifié (cache) : {0}".format(obj_id))
+                self.objects[obj_id]["recognition"].extend(tags)
+                self._emit_event(EVENT_RECOGNIZED, obj_id, tags = tags)
+                return
+            self.pending_hashes[obj_id] = h
+
+        if not self.recognition.submit(obj_id, img):
+            print(u"File d'identification pleine, objet ignoré (id={0})".format(obj_id))
+            self.pending_hashes.pop(obj_id, None)
+
+
+    def on_object_recognized(self, obj_id, tags):
+        """ Fonction appelée (depuis un thread d'identification) quand les tags d'un objet sont connus.
+            Paramètres :
+            @obj_id : identifiant de l'objet concerné.
+            @tags : liste des concepts identifiés, les plus pertinents en premier.
+        """
+        # On garde le résultat en cache, même si l'objet a disparu entre temps
+        h = self.pending_hashes.pop(obj_id, None)
+        if h is not None:
+            self.recognition_cache.put(h, tags)
+
+        # L'objet a pu être supprimé pendant l'identification
+        obj = self.objects.get(obj_id)
+        if obj is not None:
+            obj["recognition"].extend(tags)
+            self._emit_event(EVENT_RECOGNIZED, obj_id, tags = tags)
+
+
+    def _emit_event(self, event_type, obj_id, tags = None, crop = None):
+        """ Enregistre un événement dans le journal (s'il y en a un) et le transmet aux fonctions on_event, au moment de la frame en cours.
+            Paramètres :
+            @event_type : type d'événement (voir abandoned_objects.events).
+            @obj_id : identifiant de l'objet concerné.
+            @tags : tags de l'objet.
+            @crop : image de l'objet.
+        """
+        if self.event_log is None and not self.event_listeners:
+            return
+        obj = self.objects.get(obj_id)
+        box = (obj["x"], obj["y"], obj["w"], obj["h"]) if obj is not None else (0, 0, 0, 0)
+        if self.event_log is not None:
+            self.event_log.append(event_type, self.now, obj_id, box, tags, crop)
+        if self.event_listeners:
+            event = {"type": EVENT_NAMES[event_type], "time": self.now, "id": obj_id, "box": list(box),
+                     "zone": obj["zone"] if obj is not None else None, "tags": list(tags) if tags else []}
+            for listener in self.event_listeners:
+                listener(event)
+
+
+
+
+    def detect_objects(self):
+        """ Fonction à appeler pour lancer la détection des objets.
+        """
+        profiler = self.profiler
+
+        # Pour chaque frame du flux vidéo...
+        self.running = True
+        while self.running:
+
+            # On récupère une frame du flux vidéo en appelant la fonction de callback.
+            # Si le flux est terminé, on arrête la détection.
+            with profiler.stage("capture"):
+                frame = self.get_frame()
+            if frame is None:
+                break
+            self.frame_count += 1
+            self.now = self.clock()
+
+            # Si rien n'a bougé depuis la dernière frame traitée (comparaison sur une toute petite image, limitée aux zones d'intérêt),
+            # on se contente de faire avancer le temps des objets. Sinon on traite la frame.
+            # La première frame sert de référence : rien à afficher.
+            # Pendant la reconstruction de la référence, aucune frame n'est sautée : la moyenne glissante doit
+            # recevoir chaque frame pour garder la même constante de temps (learning_rate par frame).
+            holding = self.rebaseliner is not None and self.rebaseliner.holding
+            if (self.motion_gate is not None and self.preprocessor.has_reference and not holding
+                    and not self.motion_gate.check(frame, self.preprocessor.input_rect)):
+                with profiler.stage("skip"):
+                    self.skip_frame()
+            elif not self.process_frame(frame):
+                continue
+
+            # La frame (non annotée) rejoint les dernières secondes de vidéo gardées pour les clips
+            if self.clip_recorder is not None:
+                with profiler.stage("clips"):
+                    self.clip_recorder.add(self.frame_raw, self.now)
+
+            # De temps en temps, on confie une copie de l'état au thread de sauvegarde
+            if self.checkpointer is not None and self.checkpointer.due():
+                with profiler.stage("checkpoint"):
+                    self.checkpointer.save(self.checkpoint_state())
+
+            self.show()
+
+        # La boucle est terminée : on libère les ressources
+        self.close()
+
+
+    def process_frame(self, frame):
+        """ Fonction qui fait tout le traitement d'une frame : réduction, différence avec la référence, recherche des formes,
+            mise à jour et analyse de la liste des objets.
+            Paramètres :
+            @frame : la frame capturée.
+            Retourne False si la frame a servi de référence (il n'y a alors rien à afficher).
+        """
+        # Toutes les images intermédiaires sont allouées une seule fois par le préprocesseur, puis réutilisées à chaque frame.
+        # La frame de référence sera la première frame capturée.
+        prep = self.preprocessor
+        profiler = self.profiler
+
+        # On diminue la taille de la frame.
+        # Si l'image est trop grosse, les calculs sont plus longs et consomment plus de ressources.
+        # Comme nous recherchons de gros éléments, nous pouvons redimensionner l'image dans une petite taille (500px de large).
+        # Le préprocesseur garde aussi une copie de l'image qui ne sera pas modifiée (frame_raw) : 
+        # l'image affichée (frame) sera agrémentée de rectangles autour des objets et d'autres informations.
+        # Il passe ensuite la frame en niveaux de gris, nécessaire pour réaliser des opérations de soustraction qui ont du sens sur les images,
+        # puis applique un flou gaussien qui permet de lisser des imperfections de l'image (mouche qui vole, petits bruits, ...).
+        # Si la frame arrive en RGB, les conversions de couleur se font sur l'image réduite.
+        prep.prepare(frame)
+        self.frame = prep.frame
+        self.frame_raw = prep.frame_raw
+
+        # Si la frame de référence n'est pas définie, on lui assigne la frame de travail et on arrête le traitement de cette itération de la boucle.
+        if not prep.has_reference:
+            prep.set_reference()
+            return False
+    
+        # On calcule la différence absolue entre la frame en cours et la frame de référence.
+        # Ceci va donner une frame avec un fond noir et en niveaux de gris les pixels qui ont changés.
+        # On transforme ensuite tous les niveaux de gris supérieurs à 45 (sur une échelle allant de 0 à 255) en blanc.
+        # Ceci permet de supprimer des ombres légères de la détection, mais aussi de se débarasser de bruits.
+        # Enfin, on réalise une dilation de l'image pour combler les défauts des formes blanches (pour faire simple, on tente de remplir les trous).
+        frame_dilated = prep.diff()
+
+        # Si une trop grande partie de l'image a changé, on ne cherche pas les objets : on reconstruit la référence.
+        rebaseliner = self.rebaseliner
+        if rebaseliner is not None:
+            if not rebaseliner.holding and rebaseliner.check(prep.threshold, prep.blurred, self.now):
+                print(u"Changement global de l'image ({0:.0%} des pixels) : détection suspendue".format(rebaseliner.ratio))
+            if rebaseliner.holding:
+                with profiler.stage("rebaseline"):
+                    self.hold_detection()
+                return True
+    
+        # Et on trouve les boîtes qui encadrent les formes blanches, en ignorant les formes de taille négligeable.
+        # Toutes les coordonnées sont retournées en une fois, dans un tableau (voir abandoned_objects.blobs).
+        # Avec des zones d'intérêt, chaque forme est rattachée à sa zone, dont elle prend l'aire minimale et le seuil de tolérance.
+        thresholds = zones = None
+        if self.roi is None:
+            boxes = self.blob_extractor.extract(frame_dilated)
+        else:
+            boxes, areas = self.blob_extractor.extract(frame_dilated, with_areas = True)
+            boxes, zones, thresholds = self.roi.assign(boxes, areas)
+
+        # Pour les formes non négligeables, on dessine un rectangle de couleur verte (0, 255, 0) et d'épaisseur 2 autour.
+        # Les formes sont gardées pour redessiner la même image sur les frames sautées (voir skip_frame).
+        self.visible_boxes = boxes.tolist()
+        if self.draw:
+            self.draw_shapes()
+
+        # On appelle la fonction qui maintient à jour la liste des objets.
+        # C'est cette fonction qui va voir si les objets sont déjà présents dans la liste des objets trouvés ou non.
+        # On passe en arguments les coordonnées de toutes les formes de l'image.
+        # On garde les ids des objets vus sur cette frame : ils resteront "vus" tant que l'image ne change pas (voir skip_frame).
+        with profiler.stage("update_objects"):
+            self.visible_ids = self.update_objects(boxes, thresholds, zones)
+
+
+        # On appelle la fonction qui va analyser tous les objets qui ont été ajoutés à la liste pour cette image, 
+        # mais aussi pour ceux qui étaient déjà présents dans la liste auparavant.
+        with profiler.stage("analyse_objects"):
+            self.analyse_objects()
+        return True
+
+
+    def draw_shapes(self):
+        """ Dessine sur l'image affichée le cadre des formes trouvées sur la dernière frame traitée, et les zones d'intérêt.
+        """
+        for (x, y, w, h) in self.visible_boxes:
+            cv2.rectangle(self.frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        if self.roi is not None:
+            self.roi.draw(self.frame)
+
+    def skip_frame(self):
+        """ Fonction appelée à la place de process_frame quand l'image n'a pas changé depuis la dernière frame traitée.
+            Les objets vus sur cette dernière frame sont toujours là : on met à jour le moment de leur dernière visualisation,
+            puis on analyse la liste des objets pour que les délais (objet trop jeune, immobile, disparu) continuent d'avancer.
+            L'image affichée est repartie de la dernière frame traitée (non annotée) : les délais affichés ne s'empilent pas.
+        """
+        self.objects.touch(self.visible_ids, self.now)
+        if self.draw:
+            self.frame[:] = self.frame_raw
+            self.draw_shapes()
+        self.analyse_objects()
+
+
+    def hold_detection(self):
+        """ Fonction appelée à la place de la recherche des objets pendant la reconstruction de la frame de référence.
+            Les objets immobiles déjà trouvés sont considérés comme toujours là ; les autres ne sont plus vus et finissent
+            par être supprimés. Quand la scène est de nouveau stable, la moyenne glissante devient la frame de référence,
+            sauf à l'emplacement des objets immobiles.
+        """
+        prep = self.preprocessor
+        rebaseliner = self.rebaseliner
+        found = [id for id, obj in self.objects.items() if obj["found"]]
+        self.objects.touch(found, self.now)
+        self.visible_ids = found
+        self.visible_boxes = []
+
+        if rebaseliner.update(prep.blurred, self.now):
+            boxes = [(self.objects[id]["x"], self.objects[id]["y"], self.objects[id]["w"], self.objects[id]["h"]) for id in found]
+            rebaseliner.rebuild(prep.reference, boxes, prep.rect[:2])
+            print(u"Nouvelle frame de référence après {0:.0f}s : détection reprise".format(self.now - rebaseliner.hold_start))
+
+        if self.draw:
+            cv2.putText(self.frame, u"Reconstruction de la reference", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        self.analyse_objects()
+
+
+    def show(self):
+        """ Fonction qui affiche les fenêtres (selon le mode d'affichage) et gère la touche 'q'.
+        """
+        # On affiche les différentes fenêtres.
+        # Dans la pratique, 3 fenêtres suffiraient : 
+        # - l'image de base avec les cadres autour des objets, 
+        # - l'image de base brute (pour une meilleure lecture sans les cadres),
+        # - l'image qui affiche la liste des objets trouvés.
+        # Pour l'exercice, il est intéressant d'afficher chacune des frames afin de mieux comprendre le processus de recherche.
+        # Le serveur MJPEG encode et diffuse les images dans ses propres threads : on lui en confie une copie de temps en temps.
+        if self.stream_server is not None and self.stream_server.due():
+            self.stream_server.publish({"frame": self.frame, "found objects": self.frame_found_objects},
+                                       self.objects_snapshot())
+
+        if self.display == DISPLAY_HEADLESS:
+            return
+        prep = self.preprocessor
+        windows = {"frame": self.frame,
+                   "gray": prep.gray,
+                   "gray blurred": prep.blurred,
+                   "delta": prep.delta,
+                   "threshold": prep.threshold,
+                   "dilated": prep.dilated,
+                   "reference": prep.reference,
+                   "found objects": self.frame_found_objects}
+
+        # En mode "debug", l'affichage se fait dans un thread, seulement de temps en temps.
+        # La touche 'q' y est aussi gérée.
+        if self.debug_view is not None:
+            if self.debug_view.due():
+                self.debug_view.publish(windows)
+            if self.debug_view.quit:
+                self.stop()
+            return
+
+        show_windows(windows)
+
+        # On va gérer ici la pression de la touche 'q' pour quitter proprement le programme.
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord("q"):
+            self.stop()
+
+
+    def objects_snapshot(self):
+        """ Retourne la liste des objets suivis (sans leur image), sérialisable en JSON.
+        """
+        return [{"id": id,
+                 "x": obj["x"], "y": obj["y"], "w": obj["w"], "h": obj["h"],
+                 "first_seen": obj["first_seen"],
+                 "last_seen": obj["last_seen"],
+                 "found": obj["found"],
+                 "zone": obj["zone"],
+                 "recognition": list(obj["recognition"])}
+                for id, obj in self.objects.items()]
+
+
+    def checkpoint_state(self):
+        """ Retourne une copie de l'état de la détection, à sauvegarder avec abandoned_objects.checkpoint.
+            Les tableaux sont copiés ; les images des objets ne sont ni copiées, ni décompressées, ni lues sur le disque :
+            on en fige seulement les références (CropSnapshot), relues par le thread d'écriture.
+        """
+        prep = self.preprocessor
+        objects = self.objects.values()
+        rows = [obj.row for obj in objects]
+        return {
+            "saved_at": self.now,
+            "last_id": self.objects.last_id,
+            "input_shape": list(prep.input_shape) if prep.has_reference else None,
+            "reference": prep.reference.copy() if prep.has_reference else None,
+            "ids": [obj.id for obj in objects],
+            "boxes": self.objects.boxes[rows],
+            "first_seen": self.objects.first_seen[rows],
+            "last_seen": self.objects.last_seen[rows],
+            "found": [obj["found"] for obj in objects],
+            "crops": self.crops.snapshot([obj.id if obj["found"] else None for obj in objects]),
+            "recognition": dict((str(obj.id), list(obj["recognition"])) for obj in objects),
+            "zones": dict((str(obj.id), obj["zone"]) for obj in objects if obj["zone"] is not None),
+        }
+
+
+    def restore_checkpoint(self, path, max_age = None):
+        """ Reprend l'état sauvegardé dans un checkpoint : frame de référence et objets suivis.
+            Paramètres :
+            @path : chemin du checkpoint.
+            @max_age : âge maximal (en secondes) du checkpoint, None pour toujours le reprendre.
+
+            Les moments d'apparition des objets sont décalés de la durée de l'arrêt : chaque objet reprend avec
+            le même âge et la même durée de disparition qu'au moment de la sauvegarde. Un objet immobile est donc
+            toujours un objet trouvé, sans nouvelle identification (sauf si elle n'avait pas encore abouti).
+            Retourne True si l'état a été repris.
+        """
+        try:
+            state = load_checkpoint(path)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            print(u"Checkpoint illisible, ignoré : {0}".format(e))
+            return False
+
+        shift = self.clock() - state["saved_at"]
+        if max_age is not None and shift > max_age:
+            print(u"Checkpoint trop ancien ({0:.0f}s), ignoré".format(shift))
+            return False
+
+        if state["reference"] is not None:
+            if not self.preprocessor.restore_reference(state["input_shape"], state["reference"]):
+                print(u"La frame de référence du checkpoint ne correspond pas aux réglages actuels, elle est ignorée")
+
+        for i, id in enumerate(state["ids"]):
+            obj = self.objects.insert(id, tuple(state["boxes"][i].tolist()),
+                                      state["first_seen"][i] + shift, state["last_seen"][i] + shift)
+            obj["found"] = state["found"][i]
+            obj["zone"] = state["zones"].get(str(id))
+            tags = state["recognition"].get(str(id), [])
+            obj["recognition"].extend(tags)
+            img = state["crops"][i]
+            if img is not None:
+                obj["img"] = img
+                if self.do_recognize and not tags:
+                    self.recognize_object(id, img)
+        self.objects.last_id = max(self.objects.last_id, state["last_id"])
+        print(u"Reprise du checkpoint : {0} objet(s), arrêt de {1:.0f}s".format(len(state["ids"]), shift))
+        return True
+
+
+    def stop(self):
+        """ Demande l'arrêt de la boucle de détection (elle s'arrête à la fin de la frame en cours).
+        """
+        self.running = False
+
+
+    def close(self):
+        """ Libère les ressources : fenêtres, thread de capture, threads d'identification, ...
+        """
+        # On supprime les fenêtres 
+        if self.debug_view is not None:
+            self.debug_view.close()
+        elif self.display == DISPLAY_FULL:
+            cv2.destroyAllWindows()
+        # On arrête le thread de capture s'il y en a un
+        if self.capture is not None:
+            self.capture.stop()
+        # Et les threads d'identification
+        if self.recognition is not None:
+            self.recognition.close()
+            # On conserve le cache des identifications pour la prochaine exécution
+            if self.recognition_cache is not None:
+                self.recognition_cache.save()
+        # On sauvegarde l'état une dernière fois, pour repartir de là au prochain démarrage
+        if self.checkpointer is not None:
+            self.checkpointer.save(self.checkpoint_state())
+            self.checkpointer.close()
+        # Et on libère le stockage des images des objets
+        self.crops.close()
+        # On termine les clips en cours
+        if self.clip_recorder is not None:
+            self.clip_recorder.close()
+        # On écrit les derniers événements du journal
+        if self.event_log is not None:
+            self.event_log.close()
+        # Et on arrête la diffusion
+        if self.stream_server is not None:
+            self.stream_server.stop()
+
+
+
+    def update_objects_list(self, x, y, w, h):
+        """ Fonction qui ajoute (ou pas) un objet à la liste des objets trouvés.
+            Paramètres : 
+            @x, @y : coordonnées de l'objet
+            @w, @h : largeur et hauteur de l'objet
+        """
+        return self.update_objects([(x, y, w, h)])[0]
+
+
+    def update_objects(self, boxes, thresholds = None, zones = None):
+        """ Fonction qui ajoute (ou pas) les objets d'une frame à la liste des objets trouvés.
+            Paramètres : 
+            @boxes : liste des coordonnées (x, y, w, h) des formes trouvées dans la frame.
+            @thresholds : seuil de tolérance de chaque forme (zones d'intérêt), None pour utiliser object_movement_threshold.
+            @zones : indice de la zone d'intérêt de chaque forme (voir abandoned_objects.roi), None sans zones.
+
+            Le principe est assez basique : on considère qu'un objet est déjà présent dans la liste si on a déjà un objet à peu près au même endroit et à peu près de la même taille dans la liste.
+            Ce seuil de tolérance est nécessaire car à cause du bruit, de petites ombres et autres détail, un objet détecté peu bouger de quelques pixels en plus en haut, en bas, à gauche ou à droite.
+            Si c'est le cas, on met à jour le moment de la dernière visualisation de l'objet. Sinon, il s'agit d'un nouvel objet.
+            Toutes les formes de la frame sont traitées en une seule fois par l'ObjectStore.
+            Retourne la liste des ids des objets (un par forme).
+        """
+        last_id = self.objects.last_id
+        ids = self.objects.match(boxes, self.now, thresholds)
+        # Les ids supérieurs au dernier id connu sont ceux des nouveaux objets
+        if zones is not None:
+            for i, id in enumerate(ids):
+                if id > last_id:
+                    self.objects[id]["zone"] = self.roi.names[zones[i]]
+        if self.event_log is not None or self.event_listeners:
+            for id in sorted(set(ids)):
+                if id > last_id:
+                    self._emit_event(EVENT_APPEAR, id)
+        return ids
+
+
+    def analyse_objects(self):
+        """ Fonction qui analyse la liste des objets trouvés pour voir si :
+            - l'objet est trop récent pour remonter comme objet trouvé, auquel cas on le garde pour le moment
+            - l'objet a disparu. Si oui, on analyse depuis combien de temps et si on le considère comme disparut ou pas
+            - l'objet devient considéré comme trouvé et on l'identifie comme tel
+        """
+        # On initialise la liste des objets à supprimer à l'issue du parcours de la liste des objets
+        objects_to_del = []
+
+        # On initialise la liste des objets trouvés, à afficher dans la galerie
+        found_objects = []
+
+        # On parcourt la liste des objets connus
+        for id in self.objects:
+
+            # Histoire de simplifier l'écriture du code, on copie l'objet dans une variable
+            obj = self.objects[id]
+
+            # On calcule le temps pendant lequel l'objet a été vu pour la première et la dernière fois
+            # Ce temps inclut les disparitions de l'objet (par exemple si il a été caché par un groupe de personnes)
+            time_seen = int(obj["last_seen"] - obj["first_seen"])
+
+            # On calcule le temps depuis la première apparition de l'objet à maintenant
+            time_since_first_seen = int(self.now - obj["first_seen"])
+
+            # On calcule le temps depuis la dernière apparition de l'objet à maintenant
+            time_since_last_seen = int(self.now - obj["last_seen"])
+
+            # Début de la phase de filtrage...
+            # Dans toute cette phase, les timings (en secondes) sont volontairement courts. 
+            # En 'production', il faudra les allonger et adapter leur valeur avec l'expérience
+            OBJECT_TOO_YOUNG_TIME_MIN = 5        # secondes
+            OBJECT_TOO_YOUNG_TIME_MAX = 10       # secondes
+            OBJET_HIDDEN_FACTOR = 2              # ratio de multiplication
+        
+            # Objets perdus de vue il y a peu et restés peu de temps à l'écran : on les supprime
+            if time_since_last_seen > OBJECT_TOO_YOUNG_TIME_MIN and time_seen <= OBJECT_TOO_YOUNG_TIME_MAX:
+                print(u"Suppression de l'objet (disparu et trop jeune) : {0}".format(id))
+                objects_to_del.append(id)
+
+            # Objets restés un peu à l'écran mais perdus de vue depuis 2 fois leur temps d'apparition : on les supprime
+            # Ici on considère qu'un objet a le droit de disparaître  pendant au moins 2 fois son temps d'apparition.
+            if time_seen > OBJECT_TOO_YOUNG_TIME_MAX and time_since_last_seen > OBJET_HIDDEN_FACTOR*time_seen:
+                print(u"Suppression de l'objet (disparu mais ayant été un objet détecté pendant un moment) : {0}".format(id))
+                objects_to_del.append(id)
+
+            # Objets présents à l'écran depuis un moment et candidats à être de potentiels objets perdus
+            if time_seen > OBJECT_TOO_YOUNG_TIME_MAX:
+                # Quelques raccourcis pour simplifier l'écriture du code...
+                ix = obj["x"] 
+                iy = obj["y"] 
+                iw = obj["w"] 
+                ih = obj["h"] 
+
+                # Si l'objet n'a pas encore été signalé comme objet trouvé :
+                # 1. on stocke son image. Ceci signifie qu'on gardera en image de référence la première apparition de l'objet.
+                # 2. si on a choisit de requêter le service Clarifai pour identifier l'objet, on appelle Clarifai.
+                if not obj["found"]:
+                    # On stocke l'image. Le stockage en fait une copie compacte : frame_raw est réécrite à chaque frame.
+                    print(u"Nouvel objet immobile identifié (id={0})".format(id))
+                    obj["found"] = True
+                    img = self.frame_raw[iy:iy+ih,ix:ix+iw]
+                    obj["img"] = img
+                    self._emit_event(EVENT_STATIONARY, id, crop = img)
+
+                    # Et on enregistre la vidéo des secondes qui précèdent et qui suivent
+                    if self.clip_recorder is not None:
+                        path = self.clip_recorder.trigger(id, self.now)
+                        if path is not None:
+                            print(u"Clip vidéo : {0}".format(path))
+
+                    # Si on souhaite identifier l'objet, on ajoute l'image à la file d'identification.
+                    # L'image est encodée en mémoire (et archivée dans archive_folder) par les threads d'identification.
+                    if self.do_recognize:
+                        print(u"Demande d'identification...")
+                        with self.profiler.stage("recognition"):
+                            self.recognize_object(id, img)
+
+                # En mode "headless", rien n'est dessiné : on passe à l'objet suivant.
+                if not self.draw:
+                    continue
+
+                # Maintenant on repasse aux opérations effectuées sur les objets détectés à chaque passage dans la fonction...
+                # Tout d'abord, on ajoute l'objet (son id, de quoi lire son image et ses tags) à la liste des objets à afficher dans la galerie.
+                # L'image n'est lue (et décompressée) que si la galerie a besoin d'en faire une vignette.
+                found_objects.append((id, lambda obj=obj: obj["img"], obj["recognition"]))
+
+                # Par simplicité, on définit une couleur pour les manipulations qui suivent.
+                color = (255, 255, 0)
+                
+                # On dessine le cadre autour de l'objet
+                cv2.rectangle(self.frame, (obj["x"], obj["y"]), (obj["x"] + obj["w"], obj["y"] + obj["h"]), color, 2)
+    
+                # On affiche l'id de l'objet et le temps écoulé depuis que l'objet est découvert (et le temps depuis la dernière fois qu'on l'a vu)
+                cv2.putText(self.frame, "Id={0} / {1}s / {2}s".format(id, time_seen, time_since_last_seen), (obj["x"], obj["y"]), 
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)   
+
+        # Suppression des objets marqués à supprimer
+        for id in objects_to_del:
+            self._emit_event(EVENT_DISAPPEAR, id)
+            del self.objects[id]
+
+        # On met à jour la galerie des objets trouvés (elle n'est redessinée que si quelque chose a changé)
+        if self.draw:
+            deleted = set(objects_to_del)
+            self.gallery.update([item for item in found_objects if item[0] not in deleted], self.now)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+""" Journal persistant des événements de détection (apparition, immobilisation, identification, disparition).
+
+    Le journal est un dossier qui contient :
+    - des segments (segment_000001.log, ...) dans lesquels les événements sont ajoutés les uns à la suite
+      des autres, sans jamais être réécrits. Chaque événement est un en-tête binaire de taille fixe
+      (type, moment, id de l'objet, cadre), suivi des tags en JSON et de l'image de l'objet en JPEG.
+      Quand un segment atteint sa taille maximale, on passe au suivant ;
+    - un index (index.bin) : une ligne de taille fixe par événement (moment, id de l'objet, session,
+      segment, position, longueur, type). Il est lu par projection mémoire (np.memmap) : une recherche
+      sur une plage de temps est une recherche dichotomique, même sur des mois d'événements.
+
+    Les écritures se font dans un thread dédié, par lots : la boucle de détection n'attend jamais le disque.
+    Chaque ouverture du journal démarre une nouvelle session : les ids des objets, qui repartent de 1
+    à chaque exécution, restent ainsi distincts d'une exécution à l'autre.
+"""
+
+import collections
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+
+# Types d'événements
+EVENT_APPEAR = 1
+EVENT_STATIONARY = 2
+EVENT_RECOGNIZED = 3
+EVENT_DISAPPEAR = 4
+
+EVENT_NAMES = {
+    EVENT_APPEAR: "appear",
+    EVENT_STATIONARY: "stationary",
+    EVENT_RECOGNIZED: "recognized",
+    EVENT_DISAPPEAR: "disappear",
+}
+
+# En-tête d'un événement dans un segment :
+# marqueur, type, moment, id de l'objet, session, x, y, w, h, longueur des tags, longueur de l'image
+_MAGIC = 0x45564E54
+_HEADER = struct.Struct("<IBdqIiiiiII")
+
+# Une ligne de l'index
+INDEX_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("object_id", "<i8"),
+    ("session", "<u4"),
+    ("segment", "<u4"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("type", "u1"),
+])
+
+Event = collections.namedtuple("Event", ["type", "ts", "object_id", "session", "box", "tags", "crop"])
+
+
+def decode_crop(data):
+    """ Décode l'image (JPEG) d'un événement. Retourne None si l'événement n'a pas d'image.
+    """
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class EventLog:
+    """ Journal des événements : écriture en tâche de fond et recherche par plage de temps et par objet.
+    """
+
+    def __init__(self, folder, segment_bytes=256 * 1024 * 1024, batch_size=64, max_queue=4096,
+                 jpeg_quality=90, readonly=False):
+        """ Paramètres :
+            @folder : dossier du journal (créé s'il n'existe pas).
+            @segment_bytes : taille maximale (en octets) d'un segment.
+            @batch_size : nombre maximal d'événements écrits en une fois.
+            @max_queue : nombre maximal d'événements en attente d'écriture. Au-delà, les événements sont perdus (et comptés).
+            @jpeg_quality : qualité JPEG (0 à 100) des images des objets.
+            @readonly : True pour seulement consulter le journal (aucun thread d'écriture).
+        """
+        self.folder = folder
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.readonly = readonly
+        self.index_path = os.path.join(folder, "index.bin")
+
+        # Index projeté en mémoire, remappé quand il a grandi
+        self.index = np.zeros(0, INDEX_DTYPE)
+        self.index_sorted = True
+        # Fichiers des segments ouverts en lecture { numéro : fichier }
+        self.readers = {}
+        self.lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+
+        self.queue = None
+        self.thread = None
+        if readonly:
+            self._refresh()
+            return
+
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._recover()
+        self._refresh()
+        self.session = int(self.index["session"].max()) + 1 if len(self.index) else 1
+
+        self.segment = max(self._segments() or [1])
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+        self.index_file = open(self.index_path, "ab")
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, name="EventLog", daemon=True)
+        self.thread.start()
+
+    # --- Fichiers ---
+
+    def _segment_path(self, segment):
+        return os.path.join(self.folder, "segment_{0:06d}.log".format(segment))
+
+    def _segments(self):
+        paths = glob.glob(os.path.join(self.folder, "segment_*.log"))
+        return sorted(int(os.path.basename(p)[8:14]) for p in paths)
+
+    def _recover(self):
+        """ Remet le journal en état après un arrêt brutal : on coupe une ligne d'index incomplète,
+            puis on réindexe les événements écrits dans le dernier segment mais absents de l'index.
+        """
+        if not os.path.exists(self.index_path):
+            open(self.index_path, "wb").close()
+        size = os.path.getsize(self.index_path)
+        if size % INDEX_DTYPE.itemsize:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(size - size % INDEX_DTYPE.itemsize)
+
+        segments = self._segments()
+        if not segments:
+            return
+        last = segments[-1]
+        index = self._map_index()
+        in_last = index[index["segment"] == last]
+        offset = int((in_last["offset"] + in_last["length"]).max()) if len(in_last) else 0
+
+        path = self._segment_path(last)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        entries = []
+        position = 0
+        while position + _HEADER.size <= len(data):
+            header = _HEADER.unpack_from(data, position)
+            length = _HEADER.size + header[9] + header[10]
+            if header[0] != _MAGIC or position + length > len(data):
+                break
+            entries.append((header[2], header[3], header[4], last, offset + position, length, header[1]))
+            position += length
+        # Ce qui suit le dernier événement complet est un événement à moitié écrit : on le coupe
+        if position < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(offset + position)
+        if entries:
+            print(u"Journal des événements : {0} événement(s) réindexé(s)".format(len(entries)))
+            with open(self.index_path, "ab") as f:
+                f.write(np.array(entries, INDEX_DTYPE).tobytes())
+
+    def _map_index(self):
+        count = os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize if os.path.exists(self.index_path) else 0
+        if count == 0:
+            return np.zeros(0, INDEX_DTYPE)
+        return np.memmap(self.index_path, INDEX_DTYPE, "r", shape=(count,))
+
+    def _refresh(self):
+        """ Remappe l'index s'il a grandi. On vérifie seulement sur les nouvelles lignes que l'index reste trié par moment.
+        """
+        with self.lock:
+            old = len(self.index)
+            index = self._map_index()
+            if len(index) == old:
+                return self.index
+            ts = index["ts"][max(old - 1, 0):]
+            if self.index_sorted and len(ts) > 1:
+                self.index_sorted = bool(np.all(ts[1:] >= ts[:-1]))
+            self.index = index
+            return index
+
+    # --- Écriture ---
+
+    def append(self, event_type, ts, object_id, box=(0, 0, 0, 0), tags=None, crop=None):
+        """ Ajoute un événement au journal, sans jamais bloquer. Retourne False si la file d'écriture est pleine.
+            Paramètres :
+            @event_type : EVENT_APPEAR, EVENT_STATIONARY, EVENT_RECOGNIZED ou EVENT_DISAPPEAR.
+            @ts : moment de l'événement (en secondes).
+            @object_id : identifiant de l'objet.
+            @box : cadre (x, y, w, h) de l'objet.
+            @tags : liste de tags.
+            @crop : image de l'objet (copiée ici, encodée en JPEG dans le thread d'écriture).
+        """
+        if crop is not None:
+            crop = crop.copy()
+        try:
+            self.queue.put_nowait((event_type, float(ts), int(object_id), tuple(int(v) for v in box), tags, crop))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _encode(self, event):
+        event_type, ts, object_id, box, tags, crop = event
+        tags_data = json.dumps(list(tags), ensure_ascii=False).encode("utf-8") if tags else b""
+        crop_data = b""
+        if crop is not None:
+            ok, encoded = cv2.imencode(".jpg", crop, self.encode_params)
+            if ok:
+                crop_data = encoded.tobytes()
+        header = _HEADER.pack(_MAGIC, event_type, ts, object_id, self.session, box[0], box[1], box[2], box[3],
+                              len(tags_data), len(crop_data))
+        return header + tags_data + crop_data
+
+    def _write_batch(self, batch):
+        entries = []
+        for event in batch:
+            record = self._encode(event)
+            # On passe au segment suivant quand celui-ci est plein
+            offset = self.segment_file.tell()
+            if offset and offset + len(record) > self.segment_bytes:
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(self._segment_path(self.segment), "ab")
+                offset = 0
+            self.segment_file.write(record)
+            entries.append((event[1], event[2], self.session, self.segment, offset, len(record), event[0]))
+            self.bytes += len(record)
+
+        # Les événements sont écrits sur disque avant leurs lignes d'index : après un arrêt brutal,
+        # un événement peut manquer dans l'index (il est réindexé à l'ouverture), jamais l'inverse.
+        self.segment_file.flush()
+        self.index_file.write(np.array(entries, INDEX_DTYPE).tobytes())
+        self.index_file.flush()
+        self.written += len(entries)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            batch = []
+            stop = event is None
+            if not stop:
+                batch.append(event)
+            # On regroupe les événements déjà en attente
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                else:
+                    batch.append(event)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except (IOError, OSError) as e:
+                    print(u"Erreur d'écriture du journal des événements : {0}".format(e))
+                    self.dropped += len(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """ Attend que tous les événements en attente soient écrits.
+        """
+        if self.queue is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.segment_file.close()
+            self.index_file.close()
+        for f in self.readers.values():
+            f.close()
+        self.readers.clear()
+
+    # --- Lecture ---
+
+    def query(self, start=None, end=None, object_id=None, session=None, types=None):
+        """ Retourne les lignes de l'index (tableau structuré INDEX_DTYPE) des événements qui correspondent.
+            Paramètres :
+            @start, @end : plage de temps [start, end[ (None pour ne pas borner).
+            @object_id : ne garder que les événements de cet objet.
+            @session : ne garder que les événements de cette session.
+            @types : ne garder que ces types d'événements.
+        """
+        index = self._refresh()
+        if self.index_sorted:
+            ts = index["ts"]
+            lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+            hi = len(index) if end is None else int(np.searchsorted(ts, end, "left"))
+            rows = np.asarray(index[lo:hi])
+            mask = np.ones(len(rows), bool)
+        else:
+            # L'horloge a reculé à un moment (par exemple en rejouant une vidéo) : on filtre tout l'index
+            rows = np.asarray(index)
+            mask = np.ones(len(rows), bool)
+            if start is not None:
+                mask &= rows["ts"] >= start
+            if end is not None:
+                mask &= rows["ts"] < end
+        if object_id is not None:
+            mask &= rows["object_id"] == object_id
+        if session is not None:
+            mask &= rows["session"] == session
+        if types is not None:
+            mask &= np.isin(rows["type"], list(types))
+        return rows[mask]
+
+    def read(self, entry):
+        """ Lit l'événement complet (tags et image JPEG compris) d'une ligne de l'index.
+        """
+        segment = int(entry["segment"])
+        with self.lock:
+            f = self.readers.get(segment)
+            if f is None:
+                f = self.readers[segment] = open(self._segment_path(segment), "rb")
+            f.seek(int(entry["offset"]))
+            data = f.read(int(entry["length"]))
+        header = _HEADER.unpack_from(data)
+        if header[0] != _MAGIC:
+            raise IOError("Événement corrompu (segment {0}, position {1})".format(segment, int(entry["offset"])))
+        tags_end = _HEADER.size + header[9]
+        tags = json.loads(data[_HEADER.size:tags_end].decode("utf-8")) if header[9] else []
+        crop = data[tags_end:tags_end + header[10]]
+        return Event(header[1], header[2], header[3], header[4], header[5:9], tags, crop)
+
+    def events(self, **criteria):
+        """ Générateur des événements complets qui correspondent aux critères de query().
+        """
+        for entry in self.query(**criteria):
+            yield self.read(entry)
+
+    def stats(self):
+        return {"events": len(self._refresh()), "written": self.written, "dropped": self.dropped,
+                "bytes": self.bytes, "pending": self.queue.qsize() if self.queue is not None else 0}
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+""" Affichage des objets trouvés sous forme de galerie de vignettes.
+
+    L'image de la galerie n'est redessinée que si la liste des objets trouvés (ou de leurs tags)
+    a changé. Elle est toujours dessinée dans le même buffer, et les images des objets y sont
+    réduites en vignettes de taille fixe, rangées en grille. S'il y a plus d'objets que de cases,
+    la galerie est découpée en pages qui défilent.
+"""
+
+import cv2
+import numpy as np
+
+
+class Gallery:
+    """ Galerie des objets trouvés : une vignette, un id et quelques tags par objet.
+    """
+
+    # Hauteur (en pixels) de la ligne de l'id et de chaque ligne de tag
+    ID_HEIGHT = 28
+    LABEL_HEIGHT = 18
+    # Hauteur (en pixels) de la bande du numéro de page, en bas de l'image
+    PAGE_HEIGHT = 20
+
+    def __init__(self, width=1500, height=500, thumb_size=120, max_labels=5, padding=10, page_interval=5.0):
+        """ Paramètres :
+            @width, @height : dimensions de l'image de la galerie.
+            @thumb_size : taille maximale (en pixels) du plus grand côté d'une vignette.
+            @max_labels : nombre maximal de tags affichés sous chaque vignette.
+            @padding : espace entre deux cases.
+            @page_interval : durée (en secondes) d'affichage de chaque page quand il y en a plusieurs.
+        """
+        self.image = np.zeros((height, width, 3), np.uint8)
+        self.thumb_size = thumb_size
+        self.max_labels = max_labels
+        self.padding = padding
+        self.page_interval = page_interval
+
+        # On considère que nous avons besoin d'une largeur minimale de 100 pixels pour pouvoir afficher correctement les labels.
+        self.cell_width = max(thumb_size, 100) + padding
+        self.cell_height = self.ID_HEIGHT + thumb_size + self.LABEL_HEIGHT * max_labels + padding
+        self.columns = max(width // self.cell_width, 1)
+        # Pas d'espace à prévoir sous la dernière rangée. Quand il y a plusieurs pages, les rangées s'arrêtent
+        # au-dessus de la bande du numéro de page.
+        self.rows = max((height + padding) // self.cell_height, 1)
+        self.paged_rows = max((height - self.PAGE_HEIGHT + padding) // self.cell_height, 1)
+        self.per_page = self.columns * self.rows
+
+        self.page = 0
+        self.pages = 1
+        self.page_started = None
+
+        # Signature de ce qui est dessiné : on ne redessine que si elle change
+        self.signature = None
+        # Vignettes des objets de la page affichée { id : vignette }
+        self.thumbnails = {}
+        self.redraws = 0
+
+    def _thumbnail(self, obj_id, img):
+        thumb = self.thumbnails.get(obj_id)
+        if thumb is None:
+            if callable(img):
+                img = img()
+            if img is None:
+                return None
+            h, w = img.shape[:2]
+            scale = min(float(self.thumb_size) / max(w, h), 1.0)
+            size = (max(int(w * scale), 1), max(int(h * scale), 1))
+            thumb = cv2.resize(img, size, interpolation=cv2.INTER_AREA) if scale < 1.0 else img.copy()
+            self.thumbnails[obj_id] = thumb
+        return thumb
+
+    def update(self, items, now=None):
+        """ Met à jour la galerie.
+            Paramètres :
+            @items : liste de (id, image, tags) des objets trouvés. L'image peut être remplacée par une fonction
+                     qui la retourne : elle ne sera appelée que s'il faut fabriquer la vignette.
+            @now : moment courant, pour faire défiler les pages.
+            Retourne True si l'image a été redessinée.
+        """
+        rows = self.rows if len(items) <= self.columns * self.rows else self.paged_rows
+        self.per_page = self.columns * rows
+        self.pages = max((len(items) + self.per_page - 1) // self.per_page, 1)
+        if now is not None and self.pages > 1:
+            if self.page_started is None:
+                self.page_started = now
+            elif now - self.page_started >= self.page_interval:
+                self.page += 1
+                self.page_started = now
+        self.page %= self.pages
+
+        visible = items[self.page * self.per_page:(self.page + 1) * self.per_page]
+        signature = (self.page, self.pages, tuple((obj_id, len(tags)) for obj_id, _, tags in visible))
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        self.redraws += 1
+
+        # On oublie les vignettes des objets qui ne sont plus affichés
+        visible_ids = set(obj_id for obj_id, _, _ in visible)
+        for obj_id in list(self.thumbnails):
+            if obj_id not in visible_ids:
+                del self.thumbnails[obj_id]
+
+        self.image[:] = 0
+        if self.pages > 1:
+            cv2.putText(self.image, "page {0}/{1}".format(self.page + 1, self.pages),
+                        (self.image.shape[1] - 110, self.image.shape[0] - 6),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        for idx, (obj_id, img, tags) in enumerate(visible):
+            x = (idx % self.columns) * self.cell_width
+            y = (idx // self.columns) * self.cell_height
+
+            # L'id de l'objet, sa vignette, puis les tags les uns sous les autres
+            cv2.putText(self.image, "Id={0}".format(obj_id), (x, y + self.ID_HEIGHT - 3),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            top = y + self.ID_HEIGHT
+            thumb = self._thumbnail(obj_id, img)
+            if thumb is not None:
+                th, tw = thumb.shape[:2]
+                self.image[top:top + th, x:x + tw] = thumb
+
+            # Chaque tag tient dans sa ligne, jambages compris : la case s'arrête à la fin de la dernière ligne
+            label_y = top + self.thumb_size + self.LABEL_HEIGHT - 5
+            for label in list(tags)[:self.max_labels]:
+                cv2.putText(self.image, label, (x, label_y),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                label_y += self.LABEL_HEIGHT
+        return True
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+""" Détection rapide des frames qui n'ont pas changé.
+
+    La plupart des frames sont identiques à la précédente (au bruit près). Avant de lancer
+    tout le traitement, on réduit la frame à une toute petite image en niveaux de gris et on
+    la compare à celle de la dernière frame traitée : si la différence moyenne est faible,
+    on peut sauter le traitement complet. Avec des zones d'intérêt, seul le rectangle qui les
+    englobe est comparé : ce qui bouge ailleurs ne compte pas.
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """ Décide si une frame doit être traitée, en la comparant à la dernière frame traitée.
+    """
+
+    def __init__(self, width=32, threshold=2.0, max_skip=30, input_rgb=False):
+        """ Paramètres :
+            @width : largeur (en pixels) de la petite image de comparaison.
+            @threshold : différence moyenne (en niveaux de gris) au-delà de laquelle la frame est traitée.
+            @max_skip : nombre maximal de frames sautées d'affilée (pour rattraper les changements très lents).
+            @input_rgb : True si les frames arrivent en RGB, False si elles sont en BGR.
+        """
+        self.width = width
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.gray_conversion = cv2.COLOR_RGB2GRAY if input_rgb else cv2.COLOR_BGR2GRAY
+
+        self.input_shape = None
+        self.has_last = False
+
+        # Nombre de frames sautées d'affilée et au total
+        self.skipped = 0
+        self.skipped_total = 0
+        # Dernière différence moyenne calculée
+        self.score = 0.0
+
+    def _allocate(self, input_shape):
+        h, w = input_shape[:2]
+        self.size = (self.width, max(int(h * self.width / float(w)), 1))
+        shape = (self.size[1], self.size[0])
+        self.small = np.empty(shape + input_shape[2:], np.uint8)
+        self.gray = np.empty(shape, np.uint8)
+        self.last = np.empty(shape, np.uint8)
+        self.input_shape = input_shape
+        self.has_last = False
+
+    def check(self, frame, rect=None):
+        """ Retourne True si la frame doit être traitée, False si elle peut être sautée.
+            Paramètres :
+            @frame : la frame capturée.
+            @rect : partie de la frame à comparer (x0, y0, x1, y1), None pour toute la frame.
+        """
+        if rect is not None:
+            x0, y0, x1, y1 = rect
+            frame = frame[y0:y1, x0:x1]
+        if frame.shape != self.input_shape:
+            self._allocate(frame.shape)
+
+        # INTER_AREA fait la moyenne des pixels : le bruit de la caméra est lissé
+        cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        if self.small.ndim == 3:
+            cv2.cvtColor(self.small, self.gray_conversion, dst=self.gray)
+        else:
+            np.copyto(self.gray, self.small)
+
+        if self.has_last:
+            self.score = cv2.norm(self.gray, self.last, cv2.NORM_L1) / self.gray.size
+            if self.score <= self.threshold and self.skipped < self.max_skip:
+                self.skipped += 1
+                self.skipped_total += 1
+                return False
+
+        np.copyto(self.last, self.gray)
+        self.has_last = True
+        self.skipped = 0
+        return True
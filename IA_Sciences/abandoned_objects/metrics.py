@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+""" Métriques de production : durée des étapes du traitement et jauges (objets suivis, file d'identification, ...).
+
+    Metrics s'utilise comme un profiler (voir abandoned_objects.profiling) mais ne garde que les
+    dernières mesures de chaque étape, dans un tableau circulaire de taille fixe : le coût d'une
+    mesure est constant et la mémoire ne grossit pas. Les percentiles ne sont calculés qu'au
+    moment de l'export (fichier JSON / texte Prometheus, ou petit serveur HTTP local).
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .profiling import Stage
+
+
+class RollingHistogram:
+    """ Garde les `size` dernières valeurs observées, plus le nombre et la somme de toutes les valeurs.
+    """
+
+    def __init__(self, size=512):
+        self.values = [0.0] * size
+        self.size = size
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.values[self.count % self.size] = value
+        self.count += 1
+        self.total += value
+
+    def recent(self):
+        return np.array(self.values[:min(self.count, self.size)])
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        values = self.recent()
+        result = {"count": self.count, "sum": self.total}
+        if len(values):
+            for q, value in zip(quantiles, np.quantile(values, quantiles)):
+                result[str(q)] = float(value)
+            result["max"] = float(values.max())
+        return result
+
+
+class Metrics:
+    """ Durées des étapes (histogrammes glissants, en secondes) et jauges.
+    """
+
+    def __init__(self, window=512, prefix="detection"):
+        """ Paramètres :
+            @window : nombre de mesures gardées par étape pour le calcul des percentiles.
+            @prefix : préfixe des noms de métriques Prometheus.
+        """
+        self.window = window
+        self.prefix = prefix
+        self.histograms = collections.OrderedDict()
+        # { nom : fonction sans paramètre qui retourne la valeur courante }
+        self.gauges = collections.OrderedDict()
+        self.started = time.time()
+
+    # --- Interface profiler ---
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = RollingHistogram(self.window)
+        histogram.observe(seconds)
+
+    def gauge(self, name, fn):
+        """ Déclare une jauge, lue à chaque export.
+        """
+        self.gauges[name] = fn
+
+    # --- Export ---
+
+    def snapshot(self):
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                gauges[name] = None
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "stages": {name: h.summary() for name, h in list(self.histograms.items())},
+            "gauges": gauges,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        name = "{0}_stage_seconds".format(self.prefix)
+        lines = ["# HELP {0} Durée des étapes du traitement (quantiles sur les dernières mesures).".format(name),
+                 "# TYPE {0} summary".format(name)]
+        for stage, summary in snapshot["stages"].items():
+            for key, value in summary.items():
+                if key in ("count", "sum", "max"):
+                    continue
+                lines.append('{0}{{stage="{1}",quantile="{2}"}} {3:.9f}'.format(name, stage, key, value))
+            lines.append('{0}_sum{{stage="{1}"}} {2:.9f}'.format(name, stage, summary["sum"]))
+            lines.append('{0}_count{{stage="{1}"}} {2}'.format(name, stage, summary["count"]))
+        for gauge, value in snapshot["gauges"].items():
+            if value is None:
+                continue
+            metric = "{0}_{1}".format(self.prefix, gauge)
+            lines.append("# TYPE {0} gauge".format(metric))
+            lines.append("{0} {1}".format(metric, value))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """ Écrit périodiquement les métriques dans un fichier (JSON ou texte Prometheus), depuis un thread dédié.
+    """
+
+    def __init__(self, metrics, path, interval=10.0, format="prometheus"):
+        """ Paramètres :
+            @metrics : l'objet Metrics à exporter.
+            @path : fichier de sortie. Il est remplacé de façon atomique à chaque export.
+            @interval : période d'export, en secondes.
+            @format : "prometheus" (format texte, pour le textfile collector de node_exporter) ou "json".
+        """
+        if format not in ("prometheus", "json"):
+            raise ValueError("Format inconnu : {0}".format(format))
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.format = format
+        self.stopped = threading.Event()
+        self.thread = None
+        # Nombre d'exports qui ont échoué
+        self.failures = 0
+
+    def export(self):
+        content = self.metrics.to_prometheus() if self.format == "prometheus" else self.metrics.to_json()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self.thread.start()
+        return self
+
+    def _try_export(self):
+        """ Exporte les métriques. Une erreur (disque plein, dossier absent...) est signalée mais n'arrête pas les exports.
+        """
+        try:
+            self.export()
+        except Exception as e:
+            self.failures += 1
+            print(u"Erreur lors de l'export des métriques dans {0} : {1!r}".format(self.path, e))
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._try_export()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        self._try_export()
+
+
+class MetricsServer:
+    """ Petit serveur HTTP local : /metrics (texte Prometheus) et /metrics.json.
+    """
+
+    def __init__(self, metrics, host="127.0.0.1", port=9108):
+        metrics_ = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics_.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics_.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+""" Prétraitement des frames sans allocation mémoire à chaque frame.
+
+    Toutes les images intermédiaires (frame réduite, niveaux de gris, flou, différence, seuil,
+    dilatation) sont allouées une seule fois pour une résolution donnée, puis chaque fonction
+    OpenCV écrit directement dans son buffer (paramètre dst=).
+    Si la frame arrive en RGB (freenect), on la réduit d'abord et on ne convertit que la petite
+    image : en BGR pour l'affichage et directement en niveaux de gris pour la détection.
+    Avec des zones d'intérêt (voir abandoned_objects.roi), tout ce qui suit la réduction ne se fait
+    que sur le rectangle qui englobe les zones.
+"""
+
+import cv2
+import numpy as np
+
+from .profiling import NullProfiler
+
+
+class Preprocessor:
+    """ Chaîne réduction / niveaux de gris / flou / différence / seuil / dilatation avec des buffers réutilisés.
+
+        Les buffers sont accessibles comme attributs (frame, frame_raw, gray, blurred, reference, delta,
+        threshold, dilated) : ils sont réécrits à chaque frame. Avec des zones d'intérêt, les buffers à partir
+        de gray ont la taille du rectangle de travail (roi.rect), et non celle de la frame réduite.
+    """
+
+    def __init__(self, width=500, blur_size=11, threshold=45, dilate_iterations=2, input_rgb=False, copy_frame=True,
+                 profiler=None, roi=None, full_frame=False):
+        """ Paramètres :
+            @width : largeur (en pixels) à laquelle les frames sont réduites.
+            @blur_size : taille (impaire) du noyau du flou gaussien.
+            @threshold : niveau de gris au-delà duquel un pixel de la différence est considéré comme changé.
+            @dilate_iterations : nombre d'itérations de la dilatation.
+            @input_rgb : True si les frames arrivent en RGB (freenect.sync_get_video), False si elles sont déjà en BGR.
+            @copy_frame : True pour fournir une copie de la frame à annoter, False si on ne dessine rien (frame est alors frame_raw).
+            @profiler : profiler qui mesure la durée de chaque étape (voir abandoned_objects.profiling).
+            @roi : zones d'intérêt (abandoned_objects.roi.RegionsOfInterest), None pour traiter toute l'image.
+            @full_frame : True pour réduire toute la frame même si rien n'est dessiné (frame_raw est alors toujours complète).
+        """
+        self.width = width
+        self.blur_size = blur_size
+        self.threshold_level = threshold
+        self.dilate_iterations = dilate_iterations
+        self.input_rgb = input_rgb
+        self.copy_frame = copy_frame
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.roi = roi
+        self.full_frame = full_frame
+
+        # Forme des frames d'entrée pour lesquelles les buffers ont été alloués
+        self.input_shape = None
+        self.has_reference = False
+
+    def _allocate(self, input_shape):
+        h, w = input_shape[:2]
+        # Même calcul de hauteur que imutils.resize
+        self.size = (self.width, int(h * self.width / float(w)))
+        shape = (self.size[1], self.size[0])
+
+        self.resized = np.empty(shape + (3,), np.uint8)
+        # Si la frame est déjà en BGR, la frame réduite est directement la frame brute
+        self.frame_raw = np.empty_like(self.resized) if self.input_rgb else self.resized
+        self.frame = np.empty_like(self.resized) if self.copy_frame else self.frame_raw
+
+        # Le traitement ne porte que sur le rectangle de travail : resized_work est une vue, sans copie
+        self.rect = self.roi.layout(shape) if self.roi is not None else (0, 0, self.size[0], self.size[1])
+        x, y, w, h = self.rect
+        self.resized_work = self.resized[y:y + h, x:x + w]
+        shape = (h, w)
+
+        # Le rectangle de travail dans la frame d'origine (x0, y0, x1, y1), None sans zones d'intérêt
+        self.input_rect = None
+        if self.roi is not None:
+            sx = input_shape[1] / float(self.size[0])
+            sy = input_shape[0] / float(self.size[1])
+            self.input_rect = (int(x * sx), int(y * sy),
+                               min(int(np.ceil((x + w) * sx)), input_shape[1]),
+                               min(int(np.ceil((y + h) * sy)), input_shape[0]))
+
+        # Si rien n'est dessiné, seule la partie de la frame qui correspond au rectangle de travail est réduite :
+        # la réduction coûte alors elle aussi en proportion de la surface des zones.
+        self.source_rect = None
+        if self.roi is not None and not self.copy_frame and not self.full_frame:
+            self.source_rect = self.input_rect
+            self.resized_part = np.empty((h, w, 3), np.uint8)
+
+        self.gray = np.empty(shape, np.uint8)
+        self.blurred = np.empty(shape, np.uint8)
+        self.reference = np.empty(shape, np.uint8)
+        self.delta = np.empty(shape, np.uint8)
+        self.threshold = np.empty(shape, np.uint8)
+        self.dilated = np.empty(shape, np.uint8)
+
+        self.input_shape = input_shape
+        self.has_reference = False
+
+    def prepare(self, frame):
+        """ Réduit la frame et calcule frame (copie à annoter), frame_raw, gray et blurred.
+            Si la résolution change, les buffers sont réalloués et la référence est perdue.
+        """
+        if frame.shape != self.input_shape:
+            self._allocate(frame.shape)
+
+        profiler = self.profiler
+        with profiler.stage("resize"):
+            if self.source_rect is not None:
+                x0, y0, x1, y1 = self.source_rect
+                cv2.resize(frame[y0:y1, x0:x1], (self.rect[2], self.rect[3]), dst=self.resized_part,
+                           interpolation=cv2.INTER_AREA)
+                np.copyto(self.resized_work, self.resized_part)
+            else:
+                cv2.resize(frame, self.size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            if self.input_rgb:
+                cv2.cvtColor(self.resized, cv2.COLOR_RGB2BGR, dst=self.frame_raw)
+            # La frame affichée sera agrémentée de rectangles : on garde frame_raw intacte
+            if self.copy_frame:
+                np.copyto(self.frame, self.frame_raw)
+
+        with profiler.stage("gray"):
+            if self.input_rgb:
+                cv2.cvtColor(self.resized_work, cv2.COLOR_RGB2GRAY, dst=self.gray)
+            else:
+                cv2.cvtColor(self.resized_work, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+        with profiler.stage("blur"):
+            cv2.GaussianBlur(self.gray, (self.blur_size, self.blur_size), 0, dst=self.blurred)
+
+    def set_reference(self):
+        """ La frame floutée courante devient la frame de référence.
+        """
+        np.copyto(self.reference, self.blurred)
+        self.has_reference = True
+
+    def restore_reference(self, input_shape, reference):
+        """ Reprend une frame de référence sauvegardée (checkpoint) pour des frames d'entrée de forme input_shape.
+            Elle est ignorée si elle ne correspond pas à la largeur de réduction actuelle.
+            Retourne True si la référence a été reprise.
+        """
+        self._allocate(tuple(input_shape))
+        if reference.shape != self.reference.shape:
+            self.input_shape = None
+            return False
+        np.copyto(self.reference, reference)
+        self.has_reference = True
+        return True
+
+    def diff(self):
+        """ Calcule delta, threshold et dilated à partir de la frame floutée courante et de la référence.
+        """
+        profiler = self.profiler
+        with profiler.stage("absdiff"):
+            cv2.absdiff(self.reference, self.blurred, dst=self.delta)
+        with profiler.stage("threshold"):
+            cv2.threshold(self.delta, self.threshold_level, 255, cv2.THRESH_BINARY, dst=self.threshold)
+            # Les pixels hors des zones d'intérêt ne comptent pas
+            if self.roi is not None:
+                cv2.bitwise_and(self.threshold, self.roi.mask, dst=self.threshold)
+        with profiler.stage("dilate"):
+            cv2.dilate(self.threshold, None, dst=self.dilated, iterations=self.dilate_iterations)
+        return self.dilated
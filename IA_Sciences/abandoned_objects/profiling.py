@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+""" Mesure du temps passé dans chaque étape du traitement.
+
+    Le code mesuré écrit simplement :
+
+        with profiler.stage("blur"):
+            ...
+
+    NullProfiler ne mesure rien (c'est le profiler par défaut), StageTimer garde toutes les
+    mesures pour calculer des percentiles exacts (benchmarks). Pour la production, voir
+    abandoned_objects.metrics.Metrics.
+"""
+
+import collections
+import time
+
+import numpy as np
+
+
+class Stage:
+    """ Contexte qui mesure la durée d'une étape et la transmet au profiler.
+    """
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler:
+    """ Profiler qui ne mesure rien.
+    """
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def record(self, name, seconds):
+        pass
+
+    def gauge(self, name, fn):
+        pass
+
+
+class StageTimer:
+    """ Profiler qui garde la durée (en secondes) de chaque passage dans chaque étape.
+    """
+
+    def __init__(self):
+        self.samples = collections.OrderedDict()
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def record(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = []
+        samples.append(seconds)
+
+    def gauge(self, name, fn):
+        # Les jauges ne sont utiles qu'en production (voir abandoned_objects.metrics)
+        pass
+
+    def reset(self):
+        self.samples.clear()
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """ Retourne { étape : { "count", "mean_ms", "p50_ms", ... } }.
+        """
+        result = collections.OrderedDict()
+        for name, samples in self.samples.items():
+            values = np.array(samples) * 1000.0
+            stats = {"count": len(values), "mean_ms": float(values.mean())}
+            for q, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats["p{0}_ms".format(q)] = float(value)
+            result[name] = stats
+        return result
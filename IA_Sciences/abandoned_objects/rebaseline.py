@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+""" Changements globaux de l'image (lumière qui change, caméra bousculée) et reconstruction de la frame de référence.
+
+    La frame de référence est prise une fois pour toutes sur la première frame. Quand la lumière change
+    (le matin, le soir) ou que la caméra bouge, toute l'image devient différente de la référence : des
+    centaines de formes, autant de nouveaux objets, et autant d'appels au service d'identification.
+
+    On surveille donc la part des pixels changés. Au-delà d'un seuil, la détection est suspendue et on
+    construit une nouvelle référence par moyenne glissante (cv2.accumulateWeighted) des frames floutées.
+    Quand cette moyenne ne bouge plus (la scène est de nouveau stable), elle devient la nouvelle référence.
+    Les objets immobiles déjà trouvés ne doivent pas y entrer, sinon ils disparaîtraient de la différence :
+    à leur emplacement, on recopie l'ancienne référence, corrigée du changement de luminosité autour d'eux.
+"""
+
+import cv2
+import numpy as np
+
+
+class Rebaseliner:
+    """ Détecte les changements globaux de l'image et reconstruit la frame de référence après un changement.
+    """
+
+    def __init__(self, change_ratio=0.4, threshold=45, learning_rate=0.1, settle_ratio=0.02, settle_time=2.0,
+                 max_hold=30.0, protect_margin=8, roi=None):
+        """ Paramètres :
+            @change_ratio : part (entre 0 et 1) des pixels changés au-delà de laquelle la détection est suspendue.
+            @threshold : niveau de gris au-delà duquel un pixel est considéré comme changé (celui de la détection).
+            @learning_rate : poids de chaque nouvelle frame dans la moyenne glissante.
+            @settle_ratio : part des pixels qui diffèrent encore de la moyenne en dessous de laquelle la scène est stable.
+            @settle_time : durée (en secondes) pendant laquelle la scène doit rester stable pour reprendre la détection.
+            @max_hold : durée maximale (en secondes) de la suspension : au-delà, la moyenne devient la référence quoi qu'il arrive.
+            @protect_margin : largeur (en pixels) de la bordure autour d'un objet qui sert à mesurer le changement de luminosité.
+            @roi : zones d'intérêt (abandoned_objects.roi.RegionsOfInterest) : seuls les pixels des zones comptent.
+        """
+        self.change_ratio = change_ratio
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+        self.settle_ratio = settle_ratio
+        self.settle_time = settle_time
+        self.max_hold = max_hold
+        self.protect_margin = protect_margin
+        self.roi = roi
+
+        self.shape = None
+        self.holding = False
+        self.hold_start = 0.0
+        self.stable_since = None
+
+        # Dernière part des pixels changés, et nombre de références reconstruites
+        self.ratio = 0.0
+        self.rebuilt = 0
+
+    def _allocate(self, shape):
+        self.average = np.empty(shape, np.float32)
+        self.average_u8 = np.empty(shape, np.uint8)
+        self.delta = np.empty(shape, np.uint8)
+        self.changed = np.empty(shape, np.uint8)
+        # Nombre de pixels pris en compte
+        self.area = cv2.countNonZero(self.roi.mask) if self.roi is not None else shape[0] * shape[1]
+        self.shape = shape
+
+    def _changed_ratio(self, binary, masked=True):
+        """ Part des pixels blancs de l'image binaire. Si elle n'est pas encore masquée (masked=False), on la masque.
+        """
+        if self.roi is not None and not masked:
+            cv2.bitwise_and(binary, self.roi.mask, dst=binary)
+        return cv2.countNonZero(binary) / float(self.area)
+
+    def check(self, threshold, blurred, now):
+        """ Regarde si la différence avec la référence touche une trop grande partie de l'image.
+            Paramètres :
+            @threshold : image seuillée de la différence avec la référence (Preprocessor.threshold).
+            @blurred : frame floutée courante (Preprocessor.blurred) : elle initialise la moyenne glissante.
+            @now : moment de la frame.
+            Retourne True si la détection doit être suspendue.
+        """
+        if threshold.shape != self.shape:
+            self._allocate(threshold.shape)
+        self.ratio = self._changed_ratio(threshold)
+        if self.ratio < self.change_ratio:
+            return False
+        self.holding = True
+        self.hold_start = now
+        self.stable_since = None
+        self.average[...] = blurred
+        return True
+
+    def update(self, blurred, now):
+        """ Ajoute la frame floutée courante à la moyenne glissante.
+            Retourne True quand la scène est stable (ou que la suspension a trop duré) : il faut alors appeler rebuild().
+        """
+        cv2.accumulateWeighted(blurred, self.average, self.learning_rate)
+        cv2.convertScaleAbs(self.average, dst=self.average_u8)
+
+        # La scène est stable quand la frame ne diffère presque plus de la moyenne
+        cv2.absdiff(blurred, self.average_u8, dst=self.delta)
+        cv2.threshold(self.delta, self.threshold, 255, cv2.THRESH_BINARY, dst=self.changed)
+        self.ratio = self._changed_ratio(self.changed, masked=False)
+        if self.ratio > self.settle_ratio:
+            self.stable_since = None
+        elif self.stable_since is None:
+            self.stable_since = now
+
+        if self.stable_since is not None and now - self.stable_since >= self.settle_time:
+            return True
+        return now - self.hold_start >= self.max_hold
+
+    def rebuild(self, reference, boxes, origin=(0, 0)):
+        """ Remplace la référence par la moyenne glissante, sauf à l'emplacement des objets protégés.
+            Paramètres :
+            @reference : frame de référence (Preprocessor.reference), modifiée sur place.
+            @boxes : cadres (x, y, w, h) des objets immobiles, en coordonnées de la frame réduite.
+            @origin : coin (x, y) du rectangle de travail dans la frame réduite (Preprocessor.rect).
+        """
+        old = reference.copy()
+        np.copyto(reference, self.average_u8)
+
+        h, w = reference.shape
+        m = self.protect_margin
+        for (x, y, bw, bh) in boxes:
+            x0, y0 = max(x - origin[0], 0), max(y - origin[1], 0)
+            x1, y1 = min(x - origin[0] + bw, w), min(y - origin[1] + bh, h)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            # Changement de luminosité mesuré sur une bordure autour de l'objet (l'objet lui-même n'y compte pas)
+            ox0, oy0, ox1, oy1 = max(x0 - m, 0), max(y0 - m, 0), min(x1 + m, w), min(y1 + m, h)
+            border = (ox1 - ox0) * (oy1 - oy0) - (x1 - x0) * (y1 - y0)
+            gain = 1.0
+            if border > 0:
+                old_sum = float(old[oy0:oy1, ox0:ox1].sum()) - float(old[y0:y1, x0:x1].sum())
+                new_sum = float(reference[oy0:oy1, ox0:ox1].sum()) - float(reference[y0:y1, x0:x1].sum())
+                if old_sum > 0:
+                    gain = new_sum / old_sum
+            reference[y0:y1, x0:x1] = cv2.convertScaleAbs(old[y0:y1, x0:x1], alpha=gain)
+
+        self.holding = False
+        self.stable_since = None
+        self.rebuilt += 1
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+""" Identification des objets en tâche de fond.
+
+    L'appel à Clarifai prend le temps d'un aller-retour réseau : s'il est fait dans la boucle
+    vidéo, la détection s'arrête pendant ce temps. Ici, les images à identifier sont placées
+    dans une file d'attente servie par un groupe de threads. Chaque thread encode les images
+    en mémoire (sans passer par un fichier), les envoie par lots au service d'identification
+    et transmet les tags obtenus à un callback.
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import cv2
+import numpy as np
+
+
+class RecognitionError(Exception):
+    """ Erreur renvoyée par un service d'identification.
+    """
+
+
+class ClarifaiRecognizer:
+    """ Identification avec l'API de Clarifai.
+    """
+
+    def __init__(self, client_id, client_secret, model="general-v1.3", max_tags=5):
+        """ Paramètres :
+            @client_id : client id pour utiliser l'API de Clarifai.
+            @client_secret : clé du client pour utiliser l'API de Clarifai.
+            @model : nom du modèle Clarifai. Ici on utilise par défaut le modèle général.
+            @max_tags : nombre de concepts gardés par image : les premiers sont les plus pertinents.
+        """
+        # Clarifai n'est importé que si on l'utilise
+        try:
+            from clarifai.rest import ClarifaiApp
+            from clarifai.rest import Image as ClImage
+        except ImportError:
+            raise ImportError("L'identification avec Clarifai nécessite le client Clarifai : pip install clarifai")
+
+        self.image_class = ClImage
+        self.max_tags = max_tags
+        app = ClarifaiApp(client_id, client_secret)
+        self.model = app.models.get(model)
+
+    def predict(self, images):
+        """ Identifie une liste d'images encodées (bytes) et retourne une liste de tags par image.
+        """
+        inputs = [self.image_class(file_obj=io.BytesIO(data)) for data in images]
+        result = self.model.predict(inputs)
+
+        # On teste le code de statut. Si il est différent de 10 000, il y a eu une erreur.
+        if result["status"]["code"] != 10000:
+            raise RecognitionError(result["status"].get("description", result["status"]["code"]))
+
+        return [[concept["name"] for concept in output["data"].get("concepts", [])[:self.max_tags]]
+                for output in result["outputs"]]
+
+
+class FakeRecognizer:
+    """ Service d'identification local, sans réseau, pour les tests et les benchmarks.
+
+        Les tags sont déduits de la couleur dominante et de la taille de l'image :
+        une même image donne toujours les mêmes tags.
+    """
+
+    COLORS = ("bleu", "vert", "rouge")
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        """ Paramètres :
+            @latency : durée simulée (en secondes) d'un appel.
+            @failure_rate : proportion d'appels qui échouent (pour tester les relances).
+            @seed : graine du générateur utilisé pour les échecs.
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = np.random.default_rng(seed)
+        self.calls = 0
+
+    def predict(self, images):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise RecognitionError("échec simulé")
+
+        results = []
+        for data in images:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            mean = img.reshape(-1, 3).mean(axis=0)
+            size = "grand" if img.shape[0] * img.shape[1] > 10000 else "petit"
+            results.append(["objet", self.COLORS[int(mean.argmax())], size])
+        return results
+
+
+# Services d'identification disponibles, par nom. Chaque service n'importe ses dépendances qu'à sa création.
+RECOGNIZERS = {
+    "clarifai": ClarifaiRecognizer,
+    "fake": FakeRecognizer,
+}
+
+
+def register_recognizer(name, factory):
+    """ Ajoute un service d'identification au registre.
+        Paramètres :
+        @name : nom du service (utilisé dans la configuration).
+        @factory : classe ou fonction qui crée le service à partir de ses options.
+    """
+    RECOGNIZERS[name] = factory
+
+
+def create_recognizer(name, **options):
+    """ Crée un service d'identification du registre. Lève ImportError si une dépendance optionnelle manque.
+    """
+    try:
+        factory = RECOGNIZERS[name]
+    except KeyError:
+        raise ValueError("Service d'identification inconnu : {0} (disponibles : {1})".format(
+            name, ", ".join(sorted(RECOGNIZERS))))
+    return factory(**options)
+
+
+class RecognitionQueue:
+    """ File d'attente d'identification servie par un groupe de threads.
+    """
+
+    def __init__(self, backend, on_result,
+                 workers=2,
+                 max_queue=32,
+                 batch_size=4,
+                 timeout=10.0,
+                 retries=2,
+                 archive_folder=None):
+        """ Paramètres :
+            @backend : service d'identification (ClarifaiRecognizer, FakeRecognizer, ...) qui fournit predict(liste de bytes).
+            @on_result : callback appelé avec (obj_id, tags) quand un objet a été identifié.
+            @workers : nombre de threads, et nombre maximal d'appels simultanés au service (y compris les appels
+                       qui ont dépassé le délai et ne sont pas encore terminés).
+            @max_queue : nombre maximal d'objets en attente. Au-delà, les nouvelles demandes sont refusées.
+            @batch_size : nombre maximal d'images envoyées en un seul appel.
+            @timeout : délai maximal (en secondes) d'un appel.
+            @retries : nombre de nouvelles tentatives après un échec.
+            @archive_folder : si défini, l'image encodée de chaque objet y est aussi écrite (object_found_<id>.jpg).
+        """
+        self.backend = backend
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retries = retries
+        self.archive_folder = archive_folder
+
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        # Les appels au service sont faits dans un pool : si un appel dépasse le délai,
+        # le thread qui l'attendait peut passer au lot suivant. L'appel continue pourtant dans le pool :
+        # le sémaphore n'est rendu qu'à sa fin, ce qui borne le nombre d'appels en cours à workers.
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = threading.BoundedSemaphore(workers)
+
+        # Compteurs
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+        self.threads = []
+        for idx in range(workers):
+            thread = threading.Thread(target=self._run, name="recognition-{0}".format(idx), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    @property
+    def depth(self):
+        """ Nombre d'objets en attente d'identification.
+        """
+        return self.queue.qsize()
+
+    def submit(self, obj_id, img):
+        """ Demande l'identification d'une image. Ne bloque jamais.
+            Retourne False si la file d'attente est pleine.
+        """
+        try:
+            # On garde une copie : l'image d'origine peut être une vue sur une frame qui sera réutilisée
+            self.queue.put_nowait((obj_id, np.array(img)))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _next_batch(self):
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # On remet le signal d'arrêt pour les autres threads
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _call(self, images):
+        """ Appelle le service avec délai maximal et nouvelles tentatives.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+            # Tous les appels autorisés sont en cours (des appels hors délai peuvent encore tourner)
+            if not self.in_flight.acquire(timeout=self.timeout):
+                error = TimeoutError()
+                continue
+            try:
+                future = self.executor.submit(self.backend.predict, images)
+            except Exception:
+                self.in_flight.release()
+                raise
+            future.add_done_callback(lambda _: self.in_flight.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except Exception as e:
+                # Délai dépassé, erreur du service (RecognitionError, ApiError de Clarifai, réponse mal formée...)
+                error = e
+        raise RecognitionError(str(error) or "délai dépassé")
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                self._process(batch)
+            except Exception as e:
+                # Une erreur sur un lot (service, callback, archive...) ne doit pas arrêter le thread
+                print(u"Erreur lors de l'identification d'un lot : {0!r}".format(e))
+                self.failed += len(batch)
+
+    def _process(self, batch):
+        ids = []
+        images = []
+        for obj_id, img in batch:
+            ok, data = cv2.imencode(".jpg", img)
+            if not ok:
+                continue
+            ids.append(obj_id)
+            images.append(data.tobytes())
+            if self.archive_folder is not None:
+                with open(os.path.join(self.archive_folder, "object_found_{0}.jpg".format(obj_id)), "wb") as f:
+                    f.write(images[-1])
+        if not images:
+            return
+
+        try:
+            results = self._call(images)
+        except RecognitionError as e:
+            print(u"Erreur lors de l'appel au service d'identification : {0}".format(e))
+            self.failed += len(ids)
+            return
+
+        for obj_id, tags in zip(ids, results):
+            self.on_result(obj_id, tags)
+            self.completed += 1
+
+    def close(self):
+        """ Arrête les threads. Les demandes encore en attente sont abandonnées.
+        """
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout=1)
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {"depth": self.depth, "submitted": self.submitted, "rejected": self.rejected,
+                "completed": self.completed, "failed": self.failed, "retried": self.retried}
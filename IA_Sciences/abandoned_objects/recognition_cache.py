@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+""" Cache des identifications, indexé par une empreinte perceptuelle des images.
+
+    Les mêmes objets (sacs, chaises, chariots, ...) reviennent régulièrement dans la scène et
+    reçoivent à chaque fois un nouvel id. Plutôt que de rappeler le service d'identification,
+    on calcule une empreinte (dHash, 64 bits) de l'image : deux images proches ont des empreintes
+    qui ne diffèrent que de quelques bits (distance de Hamming).
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def dhash(img, size=8):
+    """ Calcule l'empreinte dHash d'une image : on réduit l'image en niveaux de gris à (size+1) x size
+        pixels et chaque bit indique si un pixel est plus clair que son voisin de droite.
+        Retourne un entier de size*size bits.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# Nombre de bits à 1 pour chaque valeur d'octet, pour compter les bits sans np.bitwise_count (NumPy < 2)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+
+def hamming_distances(hashes, h):
+    """ Distances de Hamming entre un tableau d'empreintes (uint64) et une empreinte.
+    """
+    xor = np.bitwise_xor(hashes, np.uint64(h))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class RecognitionCache:
+    """ Cache LRU (avec durée de vie optionnelle) { empreinte : tags }.
+    """
+
+    def __init__(self, max_size=1024, max_distance=6, ttl=None, path=None, clock=time.time):
+        """ Paramètres :
+            @max_size : nombre maximal d'entrées. Au-delà, on supprime les moins récemment utilisées.
+            @max_distance : distance de Hamming maximale pour considérer que deux images sont le même objet.
+            @ttl : durée de vie (en secondes) d'une entrée, None pour ne jamais expirer.
+            @path : fichier JSON dans lequel le cache est conservé entre deux exécutions (None pour ne rien conserver).
+            @clock : horloge (en secondes) qui date les entrées, celle de la détection (time.time par défaut).
+                     Avec une vidéo rejouée, les entrées expirent en temps de la vidéo.
+        """
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+
+        # { empreinte : (tags, moment de l'ajout) }, du moins récemment utilisé au plus récemment utilisé
+        self.entries = collections.OrderedDict()
+        # Tableau des empreintes, reconstruit après chaque modification, pour la recherche approchée
+        self.hashes = None
+        self.keys = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            try:
+                self.load()
+            except (OSError, ValueError, TypeError) as e:
+                # Fichier corrompu ou tronqué (arrêt pendant l'écriture, disque plein...) : on repart d'un cache vide
+                print(u"Cache des identifications illisible ({0}), il est ignoré : {1}".format(path, e))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _index(self):
+        if self.hashes is None:
+            self.keys = list(self.entries)
+            self.hashes = np.array(self.keys, np.uint64)
+        return self.keys, self.hashes
+
+    def get(self, h):
+        """ Retourne les tags de l'entrée valide la plus proche de l'empreinte h, ou None si aucune n'est assez proche.
+        """
+        now = self.clock()
+        with self.lock:
+            candidates = [h] if h in self.entries else []
+            if self.entries and self.max_distance > 0:
+                keys, hashes = self._index()
+                distances = hamming_distances(hashes, h)
+                close = np.flatnonzero(distances <= self.max_distance)
+                candidates = [keys[idx] for idx in close[np.argsort(distances[close], kind="stable")]]
+
+            # Les entrées expirées rencontrées sont supprimées : on garde la plus proche encore valide
+            key = None
+            for candidate in candidates:
+                if not self._expired(self.entries[candidate][1], now):
+                    key = candidate
+                    break
+                del self.entries[candidate]
+                self.hashes = None
+
+            if key is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return list(self.entries[key][0])
+
+    def put(self, h, tags):
+        with self.lock:
+            self.entries[h] = (list(tags), self.clock())
+            self.entries.move_to_end(h)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self.hashes = None
+
+    def load(self):
+        """ Lit le cache depuis son fichier. Lève OSError, ValueError ou TypeError si le fichier est illisible :
+            dans ce cas le cache n'est pas modifié.
+        """
+        with open(self.path) as f:
+            data = json.load(f)
+        now = self.clock()
+        entries = [(int(key, 16), (list(tags), float(stored_at))) for key, (tags, stored_at) in data]
+        with self.lock:
+            for key, (tags, stored_at) in entries:
+                if not self._expired(stored_at, now):
+                    self.entries[key] = (tags, stored_at)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            self.hashes = None
+
+    def save(self):
+        """ Écrit le cache dans son fichier (écriture atomique).
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            data = [("{0:x}".format(key), value) for key, value in self.entries.items()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+""" Zones d'intérêt : on ne cherche les objets que dans quelques zones de l'image (un quai, une porte, ...).
+
+    Chaque zone est un polygone, en pixels de la frame réduite (celle de la fenêtre "frame"), avec
+    éventuellement sa propre aire minimale d'objet et son propre seuil de tolérance au mouvement.
+
+    Le traitement (niveaux de gris, flou, différence, seuil, dilatation, formes) ne se fait que sur le
+    rectangle qui englobe toutes les zones : son coût est à peu près proportionnel à la surface couverte.
+    Dans ce rectangle, les pixels hors zone sont masqués après le seuil. Chaque forme est rattachée à la
+    zone qui contient son centre.
+"""
+
+import cv2
+import numpy as np
+
+
+class Zone:
+    """ Une zone d'intérêt.
+    """
+
+    def __init__(self, name, polygon, min_object_area=None, movement_threshold=None):
+        """ Paramètres :
+            @name : nom de la zone (il est associé aux objets trouvés dans la zone).
+            @polygon : liste des sommets [(x, y), ...] en pixels de la frame réduite.
+            @min_object_area : aire minimale des objets de la zone (None : celle de la détection).
+            @movement_threshold : seuil de tolérance au mouvement des objets de la zone (None : celui de la détection).
+        """
+        self.name = name
+        self.polygon = np.array(polygon, np.int32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError("La zone {0} doit avoir au moins 3 sommets".format(name))
+        self.min_object_area = min_object_area
+        self.movement_threshold = movement_threshold
+
+    @classmethod
+    def from_config(cls, config):
+        """ Crée une zone à partir d'un dictionnaire (fichier de configuration JSON) :
+            {"name": "quai", "polygon": [[0, 200], [500, 200], [500, 375], [0, 375]], "min_object_area": 300}
+        """
+        if isinstance(config, cls):
+            return config
+        return cls(config["name"], config["polygon"],
+                   config.get("min_object_area"), config.get("movement_threshold"))
+
+
+class RegionsOfInterest:
+    """ Ensemble des zones d'intérêt : rectangle de travail, masque et zone de chaque pixel.
+    """
+
+    def __init__(self, zones, min_object_area=200, movement_threshold=10, margin=0):
+        """ Paramètres :
+            @zones : liste de Zone (ou de dictionnaires, voir Zone.from_config).
+            @min_object_area : aire minimale par défaut des objets.
+            @movement_threshold : seuil de tolérance par défaut au mouvement des objets.
+            @margin : marge (en pixels) ajoutée autour du rectangle de travail, pour que le flou et la dilatation
+                      se comportent au bord des zones comme sur l'image entière.
+        """
+        self.zones = [Zone.from_config(z) for z in zones]
+        if not self.zones:
+            raise ValueError("Il faut au moins une zone d'intérêt")
+        self.margin = margin
+
+        # Paramètres par indice de zone ; l'indice 0 correspond à "hors zone"
+        self.names = [None] + [z.name for z in self.zones]
+        self.min_areas = np.array([np.inf] + [z.min_object_area if z.min_object_area is not None else min_object_area
+                                              for z in self.zones], np.float64)
+        self.thresholds = np.array([0] + [z.movement_threshold if z.movement_threshold is not None else movement_threshold
+                                          for z in self.zones], np.int32)
+
+        self.shape = None
+        self.rect = None
+        self.mask = None
+        self.labels = None
+
+    @property
+    def min_object_area(self):
+        """ Plus petite aire minimale de toutes les zones (premier filtre, avant celui de chaque zone).
+        """
+        return float(self.min_areas[1:].min())
+
+    @property
+    def max_movement_threshold(self):
+        return int(self.thresholds[1:].max())
+
+    def layout(self, shape):
+        """ Calcule, pour des frames réduites de forme shape, le rectangle de travail (x, y, w, h),
+            le masque des zones et l'image des indices de zone, tous deux limités au rectangle.
+        """
+        h, w = shape[:2]
+        labels = np.zeros((h, w), np.uint8)
+        # En cas de recouvrement, la dernière zone l'emporte
+        for idx, zone in enumerate(self.zones):
+            cv2.fillPoly(labels, [zone.polygon], idx + 1)
+
+        ys, xs = np.nonzero(labels)
+        if len(xs) == 0:
+            raise ValueError("Les zones d'intérêt sont hors de l'image ({0}x{1})".format(w, h))
+        x0 = max(int(xs.min()) - self.margin, 0)
+        y0 = max(int(ys.min()) - self.margin, 0)
+        x1 = min(int(xs.max()) + 1 + self.margin, w)
+        y1 = min(int(ys.max()) + 1 + self.margin, h)
+
+        self.shape = (h, w)
+        self.rect = (x0, y0, x1 - x0, y1 - y0)
+        self.labels = np.ascontiguousarray(labels[y0:y1, x0:x1])
+        self.mask = np.where(self.labels > 0, 255, 0).astype(np.uint8)
+        self.coverage = float(np.count_nonzero(labels)) / (w * h)
+        return self.rect
+
+    def assign(self, boxes, areas):
+        """ Rattache les formes (trouvées dans le rectangle de travail) à leur zone et applique l'aire minimale de chaque zone.
+            Paramètres :
+            @boxes : tableau (n, 4) des cadres, en coordonnées du rectangle de travail.
+            @areas : tableau (n,) des aires des formes.
+            Retourne (cadres en coordonnées de la frame réduite, indices de zone, seuils de tolérance).
+        """
+        if len(boxes) == 0:
+            return boxes, np.zeros(0, np.intp), np.zeros(0, np.int32)
+        cx = boxes[:, 0] + boxes[:, 2] // 2
+        cy = boxes[:, 1] + boxes[:, 3] // 2
+        zones = self.labels[cy, cx].astype(np.intp)
+        keep = areas >= self.min_areas[zones]
+        boxes = boxes[keep].copy()
+        zones = zones[keep]
+        boxes[:, 0] += self.rect[0]
+        boxes[:, 1] += self.rect[1]
+        return boxes, zones, self.thresholds[zones]
+
+    def draw(self, frame, color=(0, 128, 255)):
+        """ Dessine le contour et le nom des zones sur la frame.
+        """
+        for zone in self.zones:
+            cv2.polylines(frame, [zone.polygon], True, color, 1)
+            x, y = zone.polygon[0]
+            cv2.putText(frame, zone.name, (int(x) + 3, int(y) + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+""" Capture d'images en rafale ou à intervalle régulier (timelapse), pour constituer des jeux d'images.
+
+    cv2.imwrite encode l'image (PNG : plusieurs dizaines de millisecondes) et l'écrit sur le disque :
+    appelé dans la boucle de capture, il limite la cadence à celle de l'encodage. Ici, la boucle de capture
+    ne fait que copier la frame dans un buffer ; l'encodage et l'écriture se font dans un groupe de threads
+    (cv2.imencode libère le GIL). Les buffers sont réutilisés d'une image à l'autre : leur nombre borne la
+    mémoire occupée par les images en attente.
+
+    Les images presque identiques à la dernière image gardée peuvent être ignorées (même comparaison sur une
+    petite image que abandoned_objects.gating). Chaque image écrite est décrite dans un manifeste (JSON, une
+    ligne par image : numéro, moment de la capture, fichier, taille).
+"""
+
+import collections
+import json
+import os
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .gating import MotionGate
+
+
+# Formats d'image et extension des fichiers
+FORMATS = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg"}
+
+
+class ImageWriter:
+    """ Encode et écrit des images dans un groupe de threads, avec un nombre borné d'images en attente.
+    """
+
+    def __init__(self, format="png", png_compression=1, jpeg_quality=95, workers=2, max_pending=64, manifest=None):
+        """ Paramètres :
+            @format : "png" (sans perte) ou "jpg".
+            @png_compression : niveau de compression PNG (0 : rapide et gros, 9 : lent et petit).
+            @jpeg_quality : qualité JPEG (0 à 100).
+            @workers : nombre de threads d'encodage et d'écriture.
+            @max_pending : nombre maximal d'images en attente d'écriture. Au-delà, la capture attend qu'une image soit écrite.
+            @manifest : fichier du manifeste (None pour ne pas en écrire).
+        """
+        if format not in FORMATS:
+            raise ValueError("Format d'image inconnu : {0} (disponibles : {1})".format(format, ", ".join(sorted(FORMATS))))
+        self.extension = FORMATS[format]
+        if self.extension == ".png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        else:
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Buffers libres, et nombre de buffers alloués
+        self.free = collections.deque()
+        self.allocated = 0
+        self.cond = threading.Condition()
+
+        self.manifest = open(manifest, "a") if manifest else None
+        self.manifest_lock = threading.Lock()
+
+        # Compteurs
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.bytes = 0
+        # Nombre de fois où la capture a dû attendre un buffer libre
+        self.stalls = 0
+
+    def _buffer(self, frame):
+        """ Retourne un buffer libre de la forme de la frame (en attendant qu'un buffer se libère si tous sont utilisés).
+        """
+        with self.cond:
+            while True:
+                while self.free:
+                    buf = self.free.popleft()
+                    if buf.shape == frame.shape and buf.dtype == frame.dtype:
+                        return buf
+                    # Buffer d'une autre résolution : il est abandonné
+                    self.allocated -= 1
+                if self.allocated < self.max_pending:
+                    self.allocated += 1
+                    return np.empty_like(frame)
+                self.stalls += 1
+                self.cond.wait()
+
+    def submit(self, frame, path, timestamp=None, index=None):
+        """ Copie la frame et confie son encodage et son écriture au groupe de threads.
+            Paramètres :
+            @frame : la frame (elle peut être réutilisée par la source dès le retour de la fonction).
+            @path : fichier de l'image.
+            @timestamp : moment de la capture (pour le manifeste).
+            @index : numéro de l'image (pour le manifeste).
+        """
+        buf = self._buffer(frame)
+        np.copyto(buf, frame)
+        self.submitted += 1
+        self.executor.submit(self._write, buf, path, timestamp, index)
+
+    def _write(self, buf, path, timestamp, index):
+        try:
+            ok, data = cv2.imencode(self.extension, buf, self.params)
+            if not ok:
+                raise IOError("encodage impossible")
+            with open(path, "wb") as f:
+                f.write(data.tobytes())
+            self.written += 1
+            self.bytes += len(data)
+            if self.manifest is not None:
+                line = json.dumps({"index": index, "timestamp": timestamp, "path": path, "bytes": len(data)})
+                with self.manifest_lock:
+                    self.manifest.write(line + "\n")
+        except Exception as e:
+            # Personne ne lit le résultat des tâches : toute erreur (disque, cv2.error de l'encodage...) est comptée ici
+            print(u"Erreur d'écriture de l'image {0} : {1}".format(path, e))
+            self.failed += 1
+        finally:
+            with self.cond:
+                self.free.append(buf)
+                self.cond.notify()
+
+    def close(self):
+        """ Attend que toutes les images soient écrites.
+        """
+        self.executor.shutdown(wait=True)
+        if self.manifest is not None:
+            self.manifest.close()
+
+    def stats(self):
+        return {"submitted": self.submitted, "written": self.written, "failed": self.failed,
+                "bytes": self.bytes, "stalls": self.stalls}
+
+
+def check_output(output, count):
+    """ Vérifie qu'un nom de fichiers convient à un nombre d'images : au-delà d'une image, il doit contenir
+        {index} ou {timestamp}, sinon chaque image écraserait la précédente. Lève ValueError sinon.
+    """
+    fields = set(field for _, field, _, _ in string.Formatter().parse(output) if field is not None)
+    if count != 1 and not fields & {"index", "timestamp"}:
+        raise ValueError(u"Le nom {0} ne contient ni {{index}} ni {{timestamp}} : "
+                         u"chaque image écraserait la précédente".format(output))
+
+
+def capture_images(source, writer, output="image_{timestamp}.png", count=1, interval=0.0, dedup_threshold=None,
+                   on_image=None, should_stop=None):
+    """ Capture des images d'une source en rafale (interval = 0) ou à intervalle régulier, et les confie au writer.
+        Paramètres :
+        @source : source de frames (voir abandoned_objects.sources).
+        @writer : ImageWriter.
+        @output : nom des fichiers ({timestamp} et {index} sont remplacés). L'extension est celle du format du writer.
+        @count : nombre d'images gardées (0 : jusqu'à la fin du flux ou jusqu'à should_stop).
+        @interval : délai (en secondes) entre deux captures, 0 pour capturer à la cadence de la source.
+        @dedup_threshold : différence moyenne (en niveaux de gris, sur une petite image) en dessous de laquelle
+                           une image est considérée identique à la dernière image gardée et ignorée (None : tout garder).
+        @on_image : fonction appelée avec (index, chemin, frame) pour chaque image gardée.
+        @should_stop : fonction qui retourne True pour arrêter la capture.
+        Retourne un dictionnaire de statistiques (images capturées, gardées, ignorées, cadence).
+    """
+    check_output(output, count)
+    gate = MotionGate(threshold=dedup_threshold, max_skip=float("inf")) if dedup_threshold is not None else None
+    base, _ = os.path.splitext(output)
+    output = base + writer.extension
+
+    captured = kept = skipped = 0
+    start = next_time = time.monotonic()
+    while not count or kept < count:
+        if should_stop is not None and should_stop():
+            break
+        if interval:
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_time += interval
+
+        frame = source()
+        if frame is None:
+            break
+        timestamp = time.time()
+        captured += 1
+
+        # Image presque identique à la dernière image gardée : on ne l'écrit pas
+        if gate is not None and not gate.check(frame):
+            skipped += 1
+            continue
+
+        path = output.format(timestamp=timestamp, index=kept)
+        writer.submit(frame, path, timestamp, kept)
+        if on_image is not None:
+            on_image(kept, path, frame)
+        kept += 1
+
+    elapsed = time.monotonic() - start
+    return {"captured": captured, "kept": kept, "skipped": skipped, "seconds": elapsed,
+            "fps": captured / elapsed if elapsed > 0 else 0.0}
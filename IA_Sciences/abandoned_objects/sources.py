@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+""" Sources de frames utilisables comme callback cb_get_frame de la classe Detection.
+
+    Une source est un objet appelable qui retourne la frame suivante, ou None quand le flux est terminé.
+    Les sources enregistrées (vidéo, dossier d'images, frames en mémoire) fournissent aussi une horloge :
+    source.clock() retourne le moment (en secondes) de la dernière frame retournée. En passant
+    clock=source.clock à Detection, tous les délais (objet trop jeune, disparu, ...) sont comptés
+    en temps de la vidéo : on peut traiter des heures d'enregistrement aussi vite que le processeur
+    le permet, avec les mêmes résultats qu'en direct.
+
+    Le kinect est une source comme les autres (get_video, KinectSource) : freenect n'est importé
+    qu'à la première capture. Les sources sont aussi accessibles par leur description
+    ("kinect", "video:fichier.mp4", "images:dossier", ...) avec open_source.
+    Avec "bus:nom", les frames sont lues sur le bus en mémoire partagée d'un démon de capture
+    (voir abandoned_objects.bus) : plusieurs processus peuvent alors partager le même kinect.
+"""
+
+import abc
+import glob
+import os
+import queue
+import re
+import threading
+
+import cv2
+
+
+def _freenect():
+    """ freenect n'est importé qu'au premier accès au kinect : tout le reste fonctionne sans lui.
+    """
+    try:
+        import freenect
+    except ImportError:
+        raise ImportError("La capture depuis le kinect nécessite freenect (libfreenect et son module Python)")
+    return freenect
+
+
+### La fonction pour récupérer une frame vidéo depuis le kinect (en BGR, comme les images d'OpenCV).
+def get_video():
+    array,_ = _freenect().sync_get_video()
+    array = cv2.cvtColor(array,cv2.COLOR_RGB2BGR)
+    return array
+
+
+### La même fonction, sans conversion de couleur : la frame est en RGB.
+### Le détecteur (frame_is_rgb = True) ne convertit alors que l'image réduite.
+def get_video_rgb():
+    array,_ = _freenect().sync_get_video()
+    return array
+
+
+class KinectSource:
+    """ Frames du kinect. freenect est importé à la création de la source (erreur claire s'il manque).
+    """
+
+    def __init__(self, rgb=False):
+        """ Paramètres :
+            @rgb : True pour retourner les frames en RGB (sans conversion), False pour les avoir en BGR.
+        """
+        _freenect()
+        self.rgb = rgb
+
+    def __call__(self):
+        return get_video_rgb() if self.rgb else get_video()
+
+
+class ReplaySource:
+    """ Rejoue une liste de frames déjà en mémoire (par exemple une scène synthétique).
+    """
+
+    def __init__(self, frames, loops=1, fps=30.0):
+        """ Paramètres :
+            @frames : liste (ou itérable) de frames.
+            @loops : nombre de fois où la séquence est rejouée.
+            @fps : cadence supposée des frames, pour l'horloge.
+        """
+        self.frames = list(frames)
+        self.loops = loops
+        self.fps = fps
+        self.position = 0
+
+    def __len__(self):
+        return len(self.frames) * self.loops
+
+    def __call__(self):
+        if self.position >= len(self):
+            return None
+        frame = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        return frame
+
+    def clock(self):
+        return self.position / self.fps
+
+    def rewind(self):
+        self.position = 0
+
+
+class BackgroundReader(abc.ABC):
+    """ Base des sources fichier : les frames sont décodées dans un thread et attendent dans une file bornée.
+    """
+
+    def __init__(self, prefetch=32):
+        """ Paramètres :
+            @prefetch : nombre maximal de frames décodées d'avance.
+        """
+        self.queue = queue.Queue(maxsize=prefetch)
+        self.timestamp = 0.0
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @abc.abstractmethod
+    def frames(self):
+        """ Générateur de (frame, moment) à fournir par les classes filles.
+            Une classe fille qui ne le fournit pas ne peut pas être instanciée.
+        """
+
+    def _run(self):
+        try:
+            for item in self.frames():
+                # On vérifie régulièrement qu'on ne nous a pas demandé de nous arrêter
+                while not self.stopped.is_set():
+                    try:
+                        self.queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self.stopped.is_set():
+                    break
+        finally:
+            self.queue.put(None)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+            self.thread.start()
+        return self
+
+    def __call__(self):
+        if self.finished:
+            return None
+        self.start()
+        item = self.queue.get()
+        if item is None:
+            self.finished = True
+            return None
+        frame, self.timestamp = item
+        return frame
+
+    def clock(self):
+        return self.timestamp
+
+    def stop(self):
+        self.stopped.set()
+        # On vide la file pour débloquer le thread de décodage
+        while self.thread is not None and self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+class VideoFileSource(BackgroundReader):
+    """ Frames d'un fichier vidéo (tout format lu par OpenCV), en BGR.
+    """
+
+    def __init__(self, path, prefetch=32, fps=None, start_time=0.0):
+        """ Paramètres :
+            @path : chemin du fichier vidéo.
+            @prefetch : nombre maximal de frames décodées d'avance.
+            @fps : cadence de la vidéo. Par défaut, celle indiquée dans le fichier.
+            @start_time : moment (en secondes) de la première frame, par exemple l'heure de début de l'enregistrement.
+        """
+        BackgroundReader.__init__(self, prefetch)
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError("Impossible d'ouvrir la vidéo {0}".format(path))
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self.start_time = start_time
+        self.timestamp = start_time
+
+    def frames(self):
+        idx = 0
+        try:
+            while True:
+                ok, frame = self.capture.read()
+                if not ok:
+                    break
+                yield frame, self.start_time + idx / self.fps
+                idx += 1
+        finally:
+            self.capture.release()
+
+
+# Nom des fichiers enregistrés par chapitre_4.1.py et abandoned-objects capture : image_<timestamp>.png.
+# Les autres nombres (frame_0001.png, ...) ne sont pas des timestamps.
+_TIMESTAMP = re.compile(r"image_(\d+(?:\.\d+)?)\.[A-Za-z0-9]+")
+
+
+class ImageDirectorySource(BackgroundReader):
+    """ Frames d'un dossier d'images (par exemple celles enregistrées par chapitre_4.1.py), en BGR.
+
+        Si tous les fichiers sont nommés avec un timestamp (image_1507456789.123.png), il sert d'horloge
+        et d'ordre de lecture. Sinon, les images sont lues dans l'ordre alphabétique à la cadence fps.
+    """
+
+    def __init__(self, folder, pattern="*.png", prefetch=32, fps=10.0):
+        """ Paramètres :
+            @folder : dossier des images.
+            @pattern : motif des noms de fichiers.
+            @prefetch : nombre maximal d'images décodées d'avance.
+            @fps : cadence utilisée pour l'horloge quand les noms ne contiennent pas de timestamp.
+        """
+        BackgroundReader.__init__(self, prefetch)
+        self.fps = fps
+
+        files = sorted(glob.glob(os.path.join(folder, pattern)))
+        stamps = [_TIMESTAMP.fullmatch(os.path.basename(f)) for f in files]
+        if files and all(stamps):
+            self.files = sorted((float(m.group(1)), f) for m, f in zip(stamps, files))
+        else:
+            self.files = [(idx / fps, f) for idx, f in enumerate(files)]
+        if self.files:
+            self.timestamp = self.files[0][0]
+
+    def __len__(self):
+        return len(self.files)
+
+    def frames(self):
+        for timestamp, path in self.files:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(u"Image illisible, ignorée : {0}".format(path))
+                continue
+            yield frame, timestamp
+
+
+# Sources disponibles, par nom : "kinect", "video:fichier.mp4", "images:dossier", "bus:kinect", ...
+# Chaque fabrique reçoit l'argument qui suit les deux points (ou None) et les options de la source.
+def _kinect(argument, **options):
+    return KinectSource(rgb=argument == "rgb", **options)
+
+
+def _video(argument, **options):
+    return VideoFileSource(argument, **options)
+
+
+def _images(argument, **options):
+    return ImageDirectorySource(argument, **options)
+
+
+def _bus(argument, **options):
+    # "bus:nom" ou "bus:nom:every" pour lire toutes les frames ("latest" par défaut)
+    from .bus import FrameBusReader, DEFAULT_BUS
+
+    name, _, mode = (argument or DEFAULT_BUS).partition(":")
+    if mode:
+        options["mode"] = mode
+    return FrameBusReader(name, **options)
+
+
+SOURCES = {
+    "kinect": _kinect,
+    "video": _video,
+    "images": _images,
+    "bus": _bus,
+}
+
+
+def register_source(name, factory):
+    """ Ajoute un type de source au registre.
+        Paramètres :
+        @name : nom de la source (le préfixe de la description, avant les deux points).
+        @factory : fonction (argument, **options) qui crée la source.
+    """
+    SOURCES[name] = factory
+
+
+def open_source(description, **options):
+    """ Crée une source à partir de sa description : "kinect", "kinect:rgb", "video:enregistrement.mp4",
+        "images:/tmp/captures", ... Lève ImportError si une dépendance optionnelle de la source manque.
+    """
+    name, _, argument = description.partition(":")
+    try:
+        factory = SOURCES[name]
+    except KeyError:
+        raise ValueError("Source inconnue : {0} (disponibles : {1})".format(name, ", ".join(sorted(SOURCES))))
+    return factory(argument or None, **options)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+""" Diffusion des images de la détection en MJPEG sur HTTP, pour les regarder à distance dans un navigateur.
+
+    - /                         : page qui affiche tous les flux ;
+    - /stream/<nom>.mjpg        : flux MJPEG (par exemple /stream/frame.mjpg, /stream/found_objects.mjpg) ;
+    - /snapshot/<nom>.jpg       : dernière image du flux ;
+    - /objects.json             : liste des objets suivis, telle que publiée par la boucle de détection.
+
+    La boucle de détection se contente de confier (à la fréquence choisie) une copie des images à un
+    thread d'encodage. Chaque image est encodée une seule fois en JPEG, et les mêmes octets sont envoyés
+    à tous les clients. Chaque client reçoit toujours la dernière image disponible : un client lent
+    saute des images, mais ne ralentit ni la détection ni les autres clients.
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+_BOUNDARY = "frame"
+
+
+def stream_name(window):
+    """ Nom d'un flux dans les URL : "found objects" devient "found_objects".
+    """
+    return window.replace(" ", "_")
+
+
+class StreamServer:
+    """ Serveur HTTP local qui diffuse les fenêtres choisies en MJPEG et les objets suivis en JSON.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, windows=("frame", "found objects"), fps=10, quality=80,
+                 send_timeout=5.0):
+        """ Paramètres :
+            @host, @port : adresse d'écoute (127.0.0.1 : accessible uniquement depuis la machine, 0.0.0.0 : depuis le réseau).
+            @windows : noms des fenêtres diffusées (voir abandoned_objects.view.WINDOW_POSITIONS).
+            @fps : nombre maximal d'images par seconde diffusées.
+            @quality : qualité JPEG (0 à 100).
+            @send_timeout : délai (en secondes) au-delà duquel un client qui ne lit plus est déconnecté.
+        """
+        self.windows = tuple(windows)
+        self.period = 1.0 / fps
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.last_publish = 0.0
+
+        # Copies des images publiées, et celles en cours d'encodage : les deux jeux de buffers sont échangés
+        # à chaque encodage, et réutilisés d'une publication à l'autre. La détection n'attend jamais l'encodage.
+        self.images = {}
+        self.encoding = {}
+        self.snapshot = None
+        self.updated = False
+
+        # Dernières images encodées { nom du flux : octets JPEG }, et leur numéro
+        self.encoded = {}
+        self.objects_json = b"[]"
+        self.seq = 0
+
+        self.clients = 0
+        self.frames_encoded = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0
+
+        self.running = True
+        self.cond = threading.Condition()
+        # Les clients attendent les nouvelles images sur une condition séparée
+        self.frame_cond = threading.Condition()
+        self.encoder = threading.Thread(target=self._encode_loop, name="stream-encoder", daemon=True)
+        self.encoder.start()
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.send_timeout = send_timeout
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    # --- Côté détection ---
+
+    def due(self):
+        """ Indique s'il est temps de publier de nouvelles images.
+        """
+        return time.monotonic() - self.last_publish >= self.period
+
+    def publish(self, images, snapshot=None):
+        """ Confie au thread d'encodage une copie des images des fenêtres diffusées.
+            Paramètres :
+            @images : dictionnaire { nom de fenêtre : image }. Les fenêtres non diffusées sont ignorées.
+            @snapshot : objet sérialisable en JSON servi sur /objects.json (par exemple la liste des objets suivis).
+        """
+        self.last_publish = time.monotonic()
+        with self.cond:
+            for name in self.windows:
+                img = images.get(name)
+                if img is None:
+                    continue
+                buf = self.images.get(name)
+                if buf is None or buf.shape != img.shape or buf.dtype != img.dtype:
+                    self.images[name] = img.copy()
+                else:
+                    np.copyto(buf, img)
+            self.snapshot = snapshot
+            self.updated = True
+            self.cond.notify()
+
+    def _encode_loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.updated or not self.running)
+                if not self.running:
+                    break
+                self.images, self.encoding = self.encoding, self.images
+                snapshot = self.snapshot
+                self.updated = False
+
+            encoded = {}
+            for name, img in self.encoding.items():
+                ok, data = cv2.imencode(".jpg", img, self.encode_params)
+                if ok:
+                    encoded[stream_name(name)] = data.tobytes()
+            objects_json = json.dumps(snapshot, ensure_ascii=False).encode("utf-8") if snapshot is not None else None
+
+            with self.frame_cond:
+                self.encoded = encoded
+                if objects_json is not None:
+                    self.objects_json = objects_json
+                self.seq += 1
+                self.frames_encoded += 1
+                self.frame_cond.notify_all()
+
+    def wait_frame(self, name, last_seq, timeout=1.0):
+        """ Attend une image plus récente que last_seq. Retourne (numéro, octets JPEG), octets à None si rien de nouveau.
+        """
+        with self.frame_cond:
+            self.frame_cond.wait_for(lambda: self.seq > last_seq or not self.running, timeout)
+            if self.seq <= last_seq:
+                return last_seq, None
+            return self.seq, self.encoded.get(name)
+
+    # --- Côté HTTP ---
+
+    def _index_page(self):
+        images = "".join('<p>{0}<br><img src="/stream/{1}.mjpg"></p>'.format(name, stream_name(name))
+                         for name in self.windows)
+        return ('<html><head><meta charset="utf-8"><title>Détection</title></head><body>{0}'
+                '<p><a href="/objects.json">objets suivis</a></p></body></html>').format(images)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/":
+                    self._send(server._index_page().encode("utf-8"), "text/html; charset=utf-8")
+                elif path == "/objects.json":
+                    self._send(server.objects_json, "application/json")
+                elif path.startswith("/snapshot/") and path.endswith(".jpg"):
+                    data = server.encoded.get(path[len("/snapshot/"):-len(".jpg")])
+                    if data is None:
+                        self.send_error(404)
+                    else:
+                        self._send(data, "image/jpeg")
+                elif path.startswith("/stream/") and path.endswith(".mjpg"):
+                    self._stream(path[len("/stream/"):-len(".mjpg")])
+                else:
+                    self.send_error(404)
+
+            def _stream(self, name):
+                if name not in [stream_name(w) for w in server.windows]:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary={0}".format(_BOUNDARY))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                # Un client qui ne lit plus ses données est déconnecté au bout de send_timeout.
+                # Le buffer d'envoi est petit : un client lent bloque vite l'écriture et saute des images,
+                # au lieu d'accumuler des secondes de retard dans les buffers du système.
+                self.connection.settimeout(server.send_timeout)
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+
+                with server.frame_cond:
+                    server.clients += 1
+                seq = 0
+                try:
+                    while server.running:
+                        new_seq, data = server.wait_frame(name, seq)
+                        if data is None:
+                            # Rien de nouveau, ou une fenêtre que la détection ne publie pas (par exemple "gray") :
+                            # on attend l'image suivante, sans relire celle-ci en boucle
+                            seq = new_seq
+                            continue
+                        # Les images publiées pendant l'envoi de la précédente ont été sautées
+                        with server.frame_cond:
+                            if seq:
+                                server.frames_skipped += new_seq - seq - 1
+                            server.frames_sent += 1
+                        seq = new_seq
+                        self.wfile.write("--{0}\r\nContent-Type: image/jpeg\r\nContent-Length: {1}\r\n\r\n".format(
+                            _BOUNDARY, len(data)).encode("ascii"))
+                        self.wfile.write(data)
+                        self.wfile.write(b"\r\n")
+                except (socket.timeout, ConnectionError):
+                    pass
+                finally:
+                    with server.frame_cond:
+                        server.clients -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stream-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        with self.frame_cond:
+            self.frame_cond.notify_all()
+        self.encoder.join(timeout=1)
+        if self.thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        return {"clients": self.clients, "frames_encoded": self.frames_encoded,
+                "frames_sent": self.frames_sent, "frames_skipped": self.frames_skipped}
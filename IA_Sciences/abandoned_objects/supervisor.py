@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+""" Superviseur multi-caméras : une détection par processus, des événements regroupés, une identification partagée.
+
+    Une instance de Detection traite un seul flux, sur un seul cœur. Pour plusieurs caméras, le superviseur
+    lance un processus par caméra, éventuellement attaché à un cœur (os.sched_setaffinity), et surveille
+    qu'il avance : chaque processus publie le nombre de frames traitées dans une mémoire partagée. Un processus
+    qui s'arrête en erreur, ou qui n'avance plus, est relancé (avec un délai qui double à chaque échec).
+
+    Les événements de toutes les caméras (voir Detection(on_event=...)) sont regroupés par le superviseur,
+    avec l'identifiant de leur caméra. L'identification est faite par un seul service, dans le processus
+    du superviseur : les détections lui envoient leurs images (RemoteRecognizer) et un seau à jetons
+    limite le nombre d'images identifiées par seconde, toutes caméras confondues.
+
+    Chaque processus communique avec le superviseur par ses propres connexions (multiprocessing.Pipe),
+    recréées à chaque relance : aucune file n'est partagée entre caméras, et un processus qu'il faut tuer
+    (SIGKILL, après un SIGTERM resté sans effet) ne peut pas bloquer les autres.
+
+    Configuration (fichier JSON de abandoned-objects supervise) :
+
+        {
+            "cameras": [
+                {"id": "quai", "source": "bus:kinect", "detection": {"min_object_area": 300}, "restart": "always"},
+                {"id": "hall", "source": "video:hall.mp4", "cpu": 3}
+            ],
+            "recognizer": "clarifai",
+            "recognizer_options": {"client_id": "...", "client_secret": "..."},
+            "recognition_rate": 2.0,
+            "recognition_burst": 10,
+            "events_path": "/var/lib/detection/events.jsonl"
+        }
+"""
+
+import itertools
+import os
+import signal
+import threading
+import time
+import uuid
+import multiprocessing
+import multiprocessing.connection
+from concurrent.futures import ThreadPoolExecutor
+
+from .recognition import RecognitionError, create_recognizer
+
+
+# Politiques de relance d'une caméra dont le processus s'est terminé
+RESTART_ON_FAILURE = "on-failure"   # seulement s'il s'est terminé en erreur (une vidéo terminée ne l'est pas)
+RESTART_ALWAYS = "always"           # dans tous les cas (flux en direct : kinect, bus)
+
+
+class TokenBucket:
+    """ Seau à jetons : limite un débit moyen (rate par seconde) en autorisant des rafales de burst.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        """ Paramètres :
+            @rate : nombre moyen de jetons par seconde.
+            @burst : nombre maximal de jetons accumulés.
+            @clock : horloge (en secondes), time.monotonic par défaut.
+            @sleep : fonction d'attente, time.sleep par défaut.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+        # Temps passé à attendre des jetons
+        self.waited = 0.0
+
+    def acquire(self, count=1):
+        """ Attend que count jetons soient disponibles et les consomme.
+            Une demande plus grande que burst est servie en plusieurs fois : elle paie tous ses jetons.
+        """
+        while count > 0:
+            chunk = min(count, self.burst)
+            self._acquire(chunk)
+            count -= chunk
+
+    def _acquire(self, count):
+        while True:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= count:
+                self.tokens -= count
+                return
+            delay = (count - self.tokens) / self.rate
+            self.waited += delay
+            self.sleep(delay)
+
+
+class RemoteRecognizer:
+    """ Service d'identification d'un processus de caméra : les images sont envoyées au RecognitionService du superviseur.
+
+        Il s'utilise comme les autres services (predict) : plusieurs threads de RecognitionQueue peuvent l'appeler
+        en même temps. Demandes et réponses passent par une connexion (multiprocessing.Pipe) propre à ce processus ;
+        un thread répartit les réponses entre les appels en attente.
+    """
+
+    def __init__(self, connection, camera, timeout=10.0):
+        """ Paramètres :
+            @connection : connexion avec le RecognitionService, propre à ce processus.
+            @camera : identifiant de la caméra.
+            @timeout : délai maximal (en secondes) d'une identification, attente du seau à jetons comprise.
+        """
+        self.connection = connection
+        self.camera = camera
+        self.timeout = timeout
+
+        # Les identifiants d'appel sont (session, numéro) : une réponse qui ne porte pas la session de ce processus
+        # ne peut répondre à aucun de ses appels
+        self.session = uuid.uuid4().hex
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.lock = threading.Lock()
+        # Un message est écrit d'un seul tenant : les envois des différents threads ne doivent pas se mélanger
+        self.send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._receive, name="remote-recognizer", daemon=True)
+        self.thread.start()
+
+    def predict(self, images):
+        call_id = (self.session, next(self.ids))
+        done = threading.Event()
+        result = {}
+        with self.lock:
+            self.pending[call_id] = (done, result)
+        # Le service ignore les demandes dont le délai est dépassé : elles ne consomment pas de jetons
+        try:
+            with self.send_lock:
+                self.connection.send((call_id, time.time() + self.timeout, images))
+        except OSError as e:
+            with self.lock:
+                self.pending.pop(call_id, None)
+            raise RecognitionError(u"service d'identification injoignable : {0}".format(e))
+        if not done.wait(self.timeout):
+            with self.lock:
+                self.pending.pop(call_id, None)
+            raise RecognitionError("délai dépassé")
+        if result.get("error"):
+            raise RecognitionError(result["error"])
+        return result["tags"]
+
+    def _receive(self):
+        while True:
+            try:
+                item = self.connection.recv()
+            except (EOFError, OSError):
+                # Superviseur arrêté : les appels en attente finiront par dépasser leur délai
+                return
+            if item is None:
+                return
+            call_id, tags, error = item
+            # Réponse qui ne vient pas d'une demande de ce processus : ignorée
+            if call_id[0] != self.session:
+                continue
+            with self.lock:
+                entry = self.pending.pop(call_id, None)
+            # Réponse à un appel abandonné (délai dépassé) : ignorée
+            if entry is None:
+                continue
+            done, result = entry
+            result["tags"] = tags
+            result["error"] = error
+            done.set()
+
+    def close(self):
+        # Le service répond None à None : le thread de réception s'arrête
+        try:
+            with self.send_lock:
+                self.connection.send(None)
+        except OSError:
+            pass
+        self.thread.join(timeout=1)
+        if not self.thread.is_alive():
+            self.connection.close()
+
+
+class _Channel:
+    """ Connexion du RecognitionService avec le processus courant d'une caméra.
+    """
+
+    def __init__(self, camera, connection):
+        self.camera = camera
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        """ Envoie une réponse. Retourne False si le processus de la caméra n'est plus là.
+        """
+        try:
+            with self.lock:
+                self.connection.send(message)
+            return True
+        except OSError:
+            return False
+
+
+class RecognitionService:
+    """ Identification partagée par toutes les caméras, dans le processus du superviseur, avec un débit global limité.
+
+        Chaque processus de caméra a sa propre connexion avec le service (attach), remplacée à chaque relance :
+        un processus tué au milieu d'un envoi ne laisse un message à moitié écrit que dans une connexion abandonnée.
+    """
+
+    def __init__(self, backend, rate=None, burst=5, workers=4):
+        """ Paramètres :
+            @backend : service d'identification (voir abandoned_objects.recognition).
+            @rate : nombre maximal d'images identifiées par seconde, toutes caméras confondues (None : pas de limite).
+            @burst : nombre d'images qui peuvent être identifiées d'un coup après une période calme.
+            @workers : nombre maximal d'appels simultanés au service.
+        """
+        self.backend = backend
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # { identifiant de caméra : _Channel de son processus courant }, et connexions à fermer par le thread de réception
+        self.channels = {}
+        self.retired = []
+        self.lock = threading.Lock()
+
+        # Compteurs
+        self.calls = 0
+        self.images = 0
+        self.expired = 0
+        self.failed = 0
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="recognition-service", daemon=True)
+        self.thread.start()
+
+    def attach(self, camera, connection):
+        """ Reçoit désormais les demandes d'une caméra par cette connexion (celle de son nouveau processus).
+            L'ancienne connexion est abandonnée, avec les demandes qui y restent.
+        """
+        with self.lock:
+            previous = self.channels.get(camera)
+            self.channels[camera] = _Channel(camera, connection)
+            if previous is not None:
+                self.retired.append(previous.connection)
+
+    def _detach(self, channel):
+        with self.lock:
+            if self.channels.get(channel.camera) is channel:
+                del self.channels[channel.camera]
+        channel.connection.close()
+
+    def _run(self):
+        while self.running:
+            # Seul ce thread attend sur les connexions : c'est aussi lui qui ferme celles qui ne servent plus
+            with self.lock:
+                channels = dict((channel.connection, channel) for channel in self.channels.values())
+                retired, self.retired = self.retired, []
+            for connection in retired:
+                connection.close()
+            for connection in multiprocessing.connection.wait(list(channels), timeout=0.2):
+                channel = channels[connection]
+                try:
+                    item = connection.recv()
+                except (EOFError, OSError):
+                    # Processus de la caméra terminé
+                    self._detach(channel)
+                    continue
+                if item is None:
+                    channel.send(None)
+                    continue
+                call_id, deadline, images = item
+                if self.bucket is not None:
+                    self.bucket.acquire(len(images))
+                # La caméra a cessé d'attendre pendant qu'on attendait des jetons
+                if time.time() > deadline:
+                    self.expired += 1
+                    continue
+                self.executor.submit(self._call, channel, call_id, images)
+
+    def _call(self, channel, call_id, images):
+        tags, error = None, None
+        try:
+            tags = self.backend.predict(images)
+        except Exception as e:
+            # Toute erreur du service (RecognitionError, ApiError de Clarifai, réponse mal formée...) est renvoyée
+            # à la caméra : sans réponse, elle attendrait jusqu'à son délai
+            error = str(e) or e.__class__.__name__
+            self.failed += 1
+        finally:
+            self.calls += 1
+            self.images += len(images)
+            # Si la caméra a été relancée entre-temps, la réponse est perdue avec l'ancienne connexion
+            channel.send((call_id, tags, error))
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        self.executor.shutdown(wait=False)
+        if self.thread.is_alive():
+            return
+        with self.lock:
+            connections = [channel.connection for channel in self.channels.values()] + self.retired
+            self.channels, self.retired = {}, []
+        for connection in connections:
+            connection.close()
+
+    def stats(self):
+        return {"calls": self.calls, "images": self.images, "expired": self.expired, "failed": self.failed,
+                "throttled_seconds": self.bucket.waited if self.bucket is not None else 0.0}
+
+
+def _run_camera(camera, cpu, events, heartbeat, recognition):
+    """ Processus d'une caméra : ouvre la source, lance la détection et publie ses événements et son avancement.
+    """
+    # Attaché à un cœur, le processus ne doit pas lancer des threads OpenCV sur les autres
+    import cv2
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+        cv2.setNumThreads(1)
+
+    from .detection import Detection
+    from .sources import open_source
+
+    camera_id = camera["id"]
+    description = camera["source"]
+    source = open_source(description, **camera.get("source_options", {}))
+
+    options = dict(camera.get("detection", {}))
+    options.setdefault("display", "headless")
+    options.setdefault("frame_is_rgb", description == "kinect:rgb")
+    if not description.startswith("kinect") and hasattr(source, "clock"):
+        options.setdefault("clock", source.clock)
+
+    recognizer = None
+    if recognition is not None:
+        recognizer = RemoteRecognizer(recognition, camera_id, timeout=options.get("recognition_timeout", 10))
+        options["do_recognize"] = True
+        options["recognizer"] = recognizer
+
+    # Les événements peuvent venir de plusieurs threads (détection, identification) : un message à la fois
+    events_lock = threading.Lock()
+
+    def on_event(event):
+        event["camera"] = camera_id
+        with events_lock:
+            events.send(event)
+    options["on_event"] = on_event
+
+    detection = Detection(source, **options)
+    # Arrêt demandé par le superviseur : on termine la frame en cours, puis on libère tout normalement
+    signal.signal(signal.SIGTERM, lambda signum, frame: detection.stop())
+
+    # Avancement : moment de la dernière frame traitée et nombre de frames, relus par le superviseur
+    def beat():
+        while True:
+            frames = detection.frame_count
+            if frames != heartbeat[1]:
+                heartbeat[0] = time.time()
+                heartbeat[1] = frames
+            time.sleep(1.0)
+    threading.Thread(target=beat, name="heartbeat", daemon=True).start()
+
+    try:
+        detection.detect_objects()
+    except KeyboardInterrupt:
+        detection.close()
+    finally:
+        stop = getattr(source, "stop", None)
+        if stop is not None:
+            stop()
+        if recognizer is not None:
+            recognizer.close()
+
+
+class CameraWorker:
+    """ État d'une caméra côté superviseur : processus courant, avancement et relances.
+    """
+
+    def __init__(self, camera, cpu, heartbeat):
+        self.camera = camera
+        self.id = camera["id"]
+        self.cpu = cpu
+        self.heartbeat = heartbeat
+        # Connexion par laquelle arrivent les événements du processus courant (recréée à chaque relance)
+        self.events = None
+        self.restart = camera.get("restart", RESTART_ON_FAILURE)
+
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.delay = 0.0
+        self.next_start = 0.0
+        self.finished = False
+
+    def status(self):
+        alive = self.process is not None and self.process.is_alive()
+        return {"camera": self.id, "pid": self.process.pid if alive else None, "alive": alive, "cpu": self.cpu,
+                "frames": int(self.heartbeat[1]), "heartbeat_age": time.time() - self.heartbeat[0],
+                "restarts": self.restarts, "finished": self.finished}
+
+
+class Supervisor:
+    """ Lance une détection par caméra dans son propre processus, les surveille, les relance, et regroupe leurs événements.
+    """
+
+    def __init__(self, cameras, recognizer=None, recognizer_options=None, recognition_rate=None, recognition_burst=5,
+                 recognition_workers=4, pin_cpus=True, heartbeat_timeout=30.0, restart_delay=1.0,
+                 max_restart_delay=60.0, stop_timeout=5.0, on_event=None):
+        """ Paramètres :
+            @cameras : liste de dictionnaires {"id", "source", "source_options", "detection", "cpu", "restart"}
+                       ("detection" : paramètres de Detection ; "cpu" : cœur imposé ; "restart" : "on-failure" ou "always").
+            @recognizer : nom du service d'identification partagé (voir abandoned_objects.recognition), None pour ne pas identifier.
+            @recognizer_options : options du service d'identification.
+            @recognition_rate : nombre maximal d'images identifiées par seconde, toutes caméras confondues (None : pas de limite).
+            @recognition_burst : nombre d'images identifiables d'un coup après une période calme.
+            @recognition_workers : nombre maximal d'appels simultanés au service d'identification.
+            @pin_cpus : True pour attacher chaque caméra à un cœur (celui de "cpu", sinon les cœurs disponibles à tour de rôle).
+            @heartbeat_timeout : durée (en secondes) sans nouvelle frame au bout de laquelle un processus est considéré bloqué.
+            @restart_delay : délai (en secondes) avant la première relance ; il double à chaque échec rapproché.
+            @max_restart_delay : délai maximal (en secondes) avant une relance.
+            @stop_timeout : délai (en secondes) laissé à un processus pour s'arrêter après SIGTERM, avant SIGKILL.
+            @on_event : fonction (ou liste de fonctions) appelée, dans le processus du superviseur, pour chaque événement
+                        de chaque caméra : le dictionnaire de Detection(on_event=...) avec en plus "camera".
+        """
+        ids = [camera["id"] for camera in cameras]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Identifiants de caméras en double : {0}".format(", ".join(ids)))
+
+        # Les processus sont créés par "spawn" : un processus neuf, sans les threads ni l'état OpenCV du superviseur
+        self.context = multiprocessing.get_context("spawn")
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+        if on_event is None:
+            self.event_listeners = []
+        elif callable(on_event):
+            self.event_listeners = [on_event]
+        else:
+            self.event_listeners = list(on_event)
+
+        self.recognition = None
+        if recognizer is not None:
+            backend = create_recognizer(recognizer, **(recognizer_options or {}))
+            self.recognition = RecognitionService(backend, rate=recognition_rate, burst=recognition_burst,
+                                                  workers=recognition_workers)
+
+        cpus = sorted(os.sched_getaffinity(0)) if pin_cpus and hasattr(os, "sched_getaffinity") else []
+        self.workers = []
+        for idx, camera in enumerate(cameras):
+            cpu = camera.get("cpu", cpus[idx % len(cpus)] if cpus else None)
+            heartbeat = self.context.Array("d", 2, lock=False)
+            self.workers.append(CameraWorker(camera, cpu, heartbeat))
+
+        self.running = False
+        self.received = 0
+
+    def _start(self, worker):
+        # Chaque processus a ses propres connexions, créées à chaque lancement : un processus tué au milieu d'un
+        # envoi ne peut laisser un verrou pris ou un message à moitié écrit que dans des connexions abandonnées
+        self._release(worker)
+        events, child_events = self.context.Pipe(duplex=False)
+        recognition, child_recognition = self.context.Pipe() if self.recognition is not None else (None, None)
+
+        worker.heartbeat[0] = time.time()
+        worker.heartbeat[1] = 0
+        worker.process = self.context.Process(
+            target=_run_camera, name="camera-{0}".format(worker.id),
+            args=(worker.camera, worker.cpu, child_events, worker.heartbeat, child_recognition))
+        worker.process.start()
+        worker.started_at = time.time()
+
+        # Les extrémités du processus ne servent plus ici : sa fin est vue comme la fin des connexions
+        child_events.close()
+        worker.events = events
+        if recognition is not None:
+            child_recognition.close()
+            self.recognition.attach(worker.id, recognition)
+
+    def _drain(self, worker):
+        """ Transmet les événements déjà arrivés d'une caméra. Ferme la connexion quand le processus l'a fermée.
+        """
+        try:
+            while worker.events.poll():
+                self._dispatch(worker.events.recv())
+        except (EOFError, OSError):
+            # Processus terminé (un message interrompu par sa fin est perdu avec la connexion)
+            worker.events.close()
+            worker.events = None
+
+    def _release(self, worker):
+        """ Transmet les derniers événements de l'ancien processus d'une caméra, puis abandonne sa connexion.
+        """
+        if worker.events is None:
+            return
+        if worker.process is None or not worker.process.is_alive():
+            self._drain(worker)
+        if worker.events is not None:
+            worker.events.close()
+            worker.events = None
+
+    def _stop_process(self, process):
+        """ Arrête un processus : SIGTERM (la détection s'arrête proprement), puis SIGKILL s'il ne s'est pas arrêté à temps.
+        """
+        process.terminate()
+        process.join(timeout=self.stop_timeout)
+        if process.is_alive():
+            process.kill()
+            process.join(timeout=self.stop_timeout)
+
+    def start(self):
+        self.running = True
+        for worker in self.workers:
+            self._start(worker)
+        return self
+
+    def _check(self, worker, now):
+        """ Surveille une caméra : relance un processus terminé en erreur ou bloqué.
+        """
+        if worker.finished:
+            return
+        process = worker.process
+        if process is not None and process.is_alive():
+            if now - worker.heartbeat[0] <= self.heartbeat_timeout:
+                return
+            print(u"Caméra {0} bloquée depuis {1:.0f}s : arrêt du processus".format(worker.id, now - worker.heartbeat[0]))
+            self._stop_process(process)
+
+        if process is not None:
+            code = process.exitcode
+            worker.process = None
+            if code == 0 and worker.restart != RESTART_ALWAYS:
+                print(u"Caméra {0} : flux terminé".format(worker.id))
+                worker.finished = True
+                return
+            # Un processus qui a tourné longtemps repart avec le délai initial, sinon le délai double
+            if now - worker.started_at > self.max_restart_delay:
+                worker.delay = self.restart_delay
+            else:
+                worker.delay = min(max(worker.delay * 2, self.restart_delay), self.max_restart_delay)
+            worker.next_start = now + worker.delay
+            print(u"Caméra {0} arrêtée (code {1}) : relance dans {2:.0f}s".format(worker.id, code, worker.delay))
+
+        if now >= worker.next_start:
+            worker.restarts += 1
+            self._start(worker)
+
+    def _dispatch(self, event):
+        self.received += 1
+        for listener in self.event_listeners:
+            listener(event)
+
+    def run(self, duration=None, check_interval=1.0):
+        """ Boucle du superviseur : transmet les événements et surveille les caméras, jusqu'à stop(),
+            la fin de tous les flux, ou la fin de la durée (en secondes).
+        """
+        if not self.running:
+            self.start()
+        end = None if duration is None else time.monotonic() + duration
+        next_check = 0.0
+        try:
+            while self.running:
+                self._receive(timeout=min(check_interval, 0.5))
+                if time.monotonic() >= next_check:
+                    now = time.time()
+                    for worker in self.workers:
+                        self._check(worker, now)
+                    next_check = time.monotonic() + check_interval
+                    if all(worker.finished for worker in self.workers):
+                        break
+                if end is not None and time.monotonic() >= end:
+                    break
+        finally:
+            self.close()
+
+    def _receive(self, timeout):
+        """ Attend (au plus timeout secondes) et transmet les événements de toutes les caméras.
+        """
+        workers = dict((worker.events, worker) for worker in self.workers if worker.events is not None)
+        if not workers:
+            time.sleep(timeout)
+            return
+        for connection in multiprocessing.connection.wait(list(workers), timeout=timeout):
+            self._drain(workers[connection])
+
+    def stop(self):
+        self.running = False
+
+    def close(self, timeout=10.0):
+        """ Demande l'arrêt des détections (SIGTERM), attend qu'elles se terminent, puis transmet les derniers événements.
+        """
+        self.running = False
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        # Les événements sont lus pendant l'arrêt : un processus bloqué sur un envoi ne se terminerait pas
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(worker.process is not None and worker.process.is_alive()
+                                                  for worker in self.workers):
+            self._receive(timeout=0.1)
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            if worker.process.is_alive():
+                self._stop_process(worker.process)
+            self._release(worker)
+        if self.recognition is not None:
+            self.recognition.close()
+
+    def status(self):
+        status = {"cameras": [worker.status() for worker in self.workers], "events": self.received}
+        if self.recognition is not None:
+            status["recognition"] = self.recognition.stats()
+        return status
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+""" Balayage de paramètres (flou, seuil, dilatation, méthode de contour) sur de nombreuses paires d'images.
+
+    Utilisation (depuis le dossier IA_Sciences) :
+
+        python -m abandoned_objects.sweep --pairs paires.csv --blur-sizes 11 21 31 --thresholds 25 45 65 \\
+            --dilate-iterations 0 1 2 4 --output resultats.csv
+
+    Le fichier de paires contient une ligne par paire : image de référence, image à comparer et,
+    éventuellement, le nombre d'objets attendus (jeu étiqueté). On peut aussi donner une référence et
+    une liste d'images (--reference, --images) : chaque image est comparée à la référence.
+
+    C'est la démarche des expériences de chapitre_4.x.py, mais sans fenêtre : pour chaque paire, les
+    étapes communes sont calculées une seule fois (niveaux de gris, puis un flou par taille, une
+    différence par flou, un seuil par niveau) et la dilatation est incrémentale (2 itérations = 1
+    itération de plus sur le résultat à 1 itération). Les paires sont réparties sur plusieurs processus
+    et les mesures de chaque configuration sont écrites au fil de l'eau (CSV, JSON lines ou Parquet).
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+
+APPROX_METHODS = {
+    "simple": cv2.CHAIN_APPROX_SIMPLE,
+    "none": cv2.CHAIN_APPROX_NONE,
+    "tc89_l1": cv2.CHAIN_APPROX_TC89_L1,
+    "tc89_kcos": cv2.CHAIN_APPROX_TC89_KCOS,
+}
+
+FIELDS = ["pair", "reference", "image", "blur", "threshold", "dilate", "method", "min_area",
+          "contours", "objects", "total_area", "mean_area", "max_area", "points", "expected", "error",
+          "gray_ms", "blur_ms", "absdiff_ms", "threshold_ms", "dilate_ms", "contours_ms"]
+
+
+class Grid:
+    """ Grille des paramètres à balayer.
+    """
+
+    def __init__(self, blur_sizes=(11, 21, 31, 41), thresholds=(5, 25, 45, 65), dilate_iterations=(0, 1, 2),
+                 methods=("simple", "none"), min_areas=(200,), resize_width=500):
+        """ Paramètres :
+            @blur_sizes : tailles (impaires) du flou gaussien.
+            @thresholds : niveaux de seuil.
+            @dilate_iterations : nombres d'itérations de la dilatation.
+            @methods : méthodes d'approximation des contours (voir APPROX_METHODS).
+            @min_areas : aires minimales (en pixels) pour qu'une forme compte comme un objet.
+            @resize_width : largeur de réduction des images (comme dans Detection), None pour les garder telles quelles.
+        """
+        for blur in blur_sizes:
+            if blur % 2 == 0:
+                raise ValueError("La taille du flou doit être impaire : {0}".format(blur))
+        for method in methods:
+            if method not in APPROX_METHODS:
+                raise ValueError("Méthode de contour inconnue : {0}".format(method))
+        self.blur_sizes = sorted(blur_sizes)
+        self.thresholds = sorted(thresholds)
+        self.dilate_iterations = sorted(dilate_iterations)
+        self.methods = list(methods)
+        self.min_areas = sorted(min_areas)
+        self.resize_width = resize_width
+
+    def __len__(self):
+        return (len(self.blur_sizes) * len(self.thresholds) * len(self.dilate_iterations)
+                * len(self.methods) * len(self.min_areas))
+
+
+def load_image(path, resize_width=None):
+    """ Charge une image (BGR) et la réduit éventuellement.
+    """
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError("Image illisible : {0}".format(path))
+    if resize_width:
+        h, w = img.shape[:2]
+        img = cv2.resize(img, (resize_width, int(h * resize_width / float(w))), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def sweep_pair(task):
+    """ Mesure toutes les configurations de la grille sur une paire d'images.
+        Paramètres :
+        @task : (numéro de la paire, image de référence, image, nombre d'objets attendus ou None, grille).
+        Retourne la liste des lignes de résultats (une par configuration).
+    """
+    pair, reference_path, image_path, expected, grid = task
+
+    # Le décodage des fichiers n'est pas une étape de la détection : seule la conversion en niveaux de gris est mesurée
+    img1 = load_image(reference_path, grid.resize_width)
+    img2 = load_image(image_path, grid.resize_width)
+    start = time.perf_counter()
+    gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
+    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    gray_ms = (time.perf_counter() - start) * 1000
+
+    # Buffers réutilisés pour toutes les configurations de la paire
+    blur1 = np.empty_like(gray1)
+    blur2 = np.empty_like(gray1)
+    delta = np.empty_like(gray1)
+    thresholded = np.empty_like(gray1)
+    dilated = np.empty_like(gray1)
+
+    rows = []
+    for blur in grid.blur_sizes:
+        start = time.perf_counter()
+        cv2.GaussianBlur(gray1, (blur, blur), 0, dst=blur1)
+        cv2.GaussianBlur(gray2, (blur, blur), 0, dst=blur2)
+        blur_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        cv2.absdiff(blur1, blur2, dst=delta)
+        absdiff_ms = (time.perf_counter() - start) * 1000
+
+        for threshold in grid.thresholds:
+            start = time.perf_counter()
+            cv2.threshold(delta, threshold, 255, cv2.THRESH_BINARY, dst=thresholded)
+            threshold_ms = (time.perf_counter() - start) * 1000
+
+            # Dilatation incrémentale : on repart du résultat de l'itération précédente de la grille
+            np.copyto(dilated, thresholded)
+            done = 0
+            dilate_ms = 0.0
+            for iterations in grid.dilate_iterations:
+                if iterations > done:
+                    start = time.perf_counter()
+                    cv2.dilate(dilated, None, dst=dilated, iterations=iterations - done)
+                    dilate_ms += (time.perf_counter() - start) * 1000
+                    done = iterations
+
+                for method in grid.methods:
+                    start = time.perf_counter()
+                    (contours, _) = cv2.findContours(dilated, cv2.RETR_EXTERNAL, APPROX_METHODS[method])
+                    areas = np.array([cv2.contourArea(c) for c in contours], np.float64)
+                    points = sum(len(c) for c in contours)
+                    contours_ms = (time.perf_counter() - start) * 1000
+
+                    for min_area in grid.min_areas:
+                        kept = areas[areas >= min_area]
+                        objects = len(kept)
+                        rows.append({
+                            "pair": pair,
+                            "reference": reference_path,
+                            "image": image_path,
+                            "blur": blur,
+                            "threshold": threshold,
+                            "dilate": iterations,
+                            "method": method,
+                            "min_area": min_area,
+                            "contours": len(contours),
+                            "objects": objects,
+                            "total_area": float(kept.sum()),
+                            "mean_area": float(kept.mean()) if objects else 0.0,
+                            "max_area": float(kept.max()) if objects else 0.0,
+                            "points": points,
+                            "expected": expected,
+                            "error": objects - expected if expected is not None else None,
+                            # Les étapes communes sont comptées dans chaque configuration qui en dépend
+                            "gray_ms": gray_ms,
+                            "blur_ms": blur_ms,
+                            "absdiff_ms": absdiff_ms,
+                            "threshold_ms": threshold_ms,
+                            "dilate_ms": dilate_ms,
+                            "contours_ms": contours_ms,
+                        })
+    return rows
+
+
+# --- Lecture des paires ---
+
+def read_pairs(path):
+    """ Lit un fichier de paires (CSV : référence, image[, nombre d'objets attendus]).
+        Les chemins relatifs sont relatifs au dossier du fichier. Les lignes vides ou commençant par # sont ignorées.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path) as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#"):
+                continue
+            if row[0] == "reference":
+                continue
+            reference, image = [os.path.join(folder, p.strip()) for p in row[:2]]
+            expected = int(row[2]) if len(row) > 2 and row[2].strip() else None
+            pairs.append((reference, image, expected))
+    return pairs
+
+
+# --- Écriture des résultats ---
+
+class CsvWriter:
+    def __init__(self, f):
+        self.writer = csv.DictWriter(f, FIELDS)
+        self.writer.writeheader()
+        self.f = f
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.f.flush()
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, rows):
+        for row in rows:
+            self.f.write(json.dumps(row) + "\n")
+        self.f.flush()
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """ Écriture Parquet, une row group par paire. Nécessite pyarrow (pip install pyarrow).
+    """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("L'écriture Parquet nécessite pyarrow : pip install pyarrow")
+        self.pa = pyarrow
+        self.writer = None
+        self.path = path
+
+    def write(self, rows):
+        table = self.pa.Table.from_pylist(rows)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path):
+    """ Choisit le format d'après l'extension : .csv, .jsonl ou .parquet. Sans fichier, CSV sur la sortie standard.
+    """
+    if path is None:
+        return CsvWriter(sys.stdout), None
+    if path.endswith(".parquet"):
+        return ParquetWriter(path), None
+    f = open(path, "w", newline="")
+    if path.endswith(".jsonl"):
+        return JsonLinesWriter(f), f
+    return CsvWriter(f), f
+
+
+# --- Balayage ---
+
+def run_sweep(pairs, grid, writer, workers=None):
+    """ Balaye la grille sur toutes les paires et écrit les résultats au fur et à mesure.
+        Paramètres :
+        @pairs : liste de (référence, image, nombre d'objets attendus ou None).
+        @grid : la grille des paramètres.
+        @writer : objet avec une méthode write(lignes).
+        @workers : nombre de processus (None pour un par cœur, 1 pour tout faire dans ce processus).
+        Retourne, pour chaque configuration, { configuration : [nombre de paires, nombre de paires étiquetées,
+        somme des |erreurs| sur les paires étiquetées, somme des durées] }.
+    """
+    tasks = [(idx, reference, image, expected, grid) for idx, (reference, image, expected) in enumerate(pairs)]
+    totals = {}
+
+    def collect(rows):
+        writer.write(rows)
+        for row in rows:
+            key = (row["blur"], row["threshold"], row["dilate"], row["method"], row["min_area"])
+            total = totals.setdefault(key, [0, 0, 0, 0.0])
+            total[0] += 1
+            # Une paire sans nombre d'objets attendu ne dit rien de l'erreur : elle n'y compte pas
+            if row["error"] is not None:
+                total[1] += 1
+                total[2] += abs(row["error"])
+            total[3] += (row["gray_ms"] + row["blur_ms"] + row["absdiff_ms"] + row["threshold_ms"]
+                         + row["dilate_ms"] + row["contours_ms"])
+
+    if workers == 1:
+        for task in tasks:
+            collect(sweep_pair(task))
+    else:
+        # Les paires sont indépendantes : on récupère les résultats dans l'ordre où ils arrivent
+        with multiprocessing.Pool(workers) as pool:
+            for rows in pool.imap_unordered(sweep_pair, tasks):
+                collect(rows)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balayage des paramètres de détection sur des paires d'images")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pairs", help="fichier CSV : référence, image[, nombre d'objets attendus]")
+    source.add_argument("--reference", help="image de référence, comparée à chacune des images de --images")
+    parser.add_argument("--images", nargs="+", default=[], help="images à comparer à --reference")
+    parser.add_argument("--blur-sizes", nargs="+", type=int, default=[11, 21, 31, 41])
+    parser.add_argument("--thresholds", nargs="+", type=int, default=[5, 25, 45, 65])
+    parser.add_argument("--dilate-iterations", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument("--methods", nargs="+", default=["simple", "none"], choices=sorted(APPROX_METHODS))
+    parser.add_argument("--min-areas", nargs="+", type=int, default=[200])
+    parser.add_argument("--resize-width", type=int, default=500, help="largeur de réduction (0 pour garder la taille d'origine)")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus (par défaut, un par cœur)")
+    parser.add_argument("--output", help="fichier de résultats .csv, .jsonl ou .parquet (sinon, CSV sur la sortie standard)")
+    parser.add_argument("--top", type=int, default=5, help="nombre de meilleures configurations affichées à la fin")
+    args = parser.parse_args(argv)
+
+    if args.pairs:
+        pairs = read_pairs(args.pairs)
+    else:
+        pairs = [(args.reference, image, None) for image in args.images]
+    grid = Grid(args.blur_sizes, args.thresholds, args.dilate_iterations, args.methods, args.min_areas,
+                args.resize_width or None)
+
+    print(u"{0} paires x {1} configurations".format(len(pairs), len(grid)), file=sys.stderr)
+    start = time.perf_counter()
+    writer, f = open_writer(args.output)
+    try:
+        totals = run_sweep(pairs, grid, writer, args.workers)
+    finally:
+        writer.close()
+        if f is not None:
+            f.close()
+    print(u"Terminé en {0:.1f}s".format(time.perf_counter() - start), file=sys.stderr)
+
+    # Sur un jeu étiqueté, on affiche les configurations qui se trompent le moins (puis les plus rapides).
+    # L'erreur moyenne n'est calculée que sur les paires étiquetées.
+    labelled = sum(1 for _, _, expected in pairs if expected is not None)
+    if labelled:
+        ranking = sorted(totals.items(), key=lambda item: (item[1][2] / item[1][1], item[1][3] / item[1][0]))
+        print(u"Meilleures configurations sur {0} paire(s) étiquetée(s) sur {1} (flou, seuil, dilatation, méthode, aire min) :".format(
+            labelled, len(pairs)), file=sys.stderr)
+        for key, (count, labelled_count, errors, ms) in ranking[:args.top]:
+            print(u"  {0} : erreur moyenne {1:.2f} objet(s), {2:.1f} ms par paire".format(
+                key, float(errors) / labelled_count, ms / count), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
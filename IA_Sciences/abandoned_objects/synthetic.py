@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+""" Génération de scènes synthétiques pour tester et mesurer la détection sans Kinect.
+
+    Une scène est un fond fixe (dégradé texturé) sur lequel des objets rectangulaires
+    apparaissent, restent immobiles un moment puis disparaissent. Un léger bruit change
+    d'une frame à l'autre, comme pour une vraie caméra.
+"""
+
+import cv2
+import numpy as np
+
+
+class SyntheticScene:
+    """ Séquence de frames BGR (ou RGB) avec des objets qui apparaissent, restent immobiles et disparaissent.
+    """
+
+    def __init__(self, width=640, height=480, n_objects=5, frames=300,
+                 min_size=30, max_size=120, noise=4, rgb=False, seed=0):
+        """ Paramètres :
+            @width, @height : dimensions des frames.
+            @n_objects : nombre d'objets qui passent dans la scène.
+            @frames : nombre de frames de la séquence.
+            @min_size, @max_size : dimensions minimale et maximale des objets (en pixels).
+            @noise : amplitude du bruit ajouté à chaque frame (0 pour aucun bruit).
+            @rgb : True pour produire des frames en RGB (comme freenect.sync_get_video).
+            @seed : graine du générateur aléatoire : une même graine donne toujours la même scène.
+        """
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.rgb = rgb
+        random = np.random.default_rng(seed)
+
+        # Le fond : un dégradé avec une texture légèrement floutée
+        gx = np.linspace(40, 200, width, dtype=np.float32)
+        gy = np.linspace(0, 40, height, dtype=np.float32)[:, None]
+        texture = random.normal(0, 12, (height, width)).astype(np.float32)
+        texture = cv2.GaussianBlur(texture, (7, 7), 0)
+        base = np.clip(gx + gy + texture, 0, 255).astype(np.uint8)
+        self.background = cv2.merge([base, np.flipud(base), np.fliplr(base)])
+
+        # Quelques motifs de bruit qui seront utilisés à tour de rôle
+        self.noise = [random.integers(0, noise + 1, (height, width, 3), dtype=np.uint8) for _ in range(4)] if noise else []
+
+        # Les objets : position, taille, couleur, frame d'apparition et frame de disparition
+        self.objects = []
+        for _ in range(n_objects):
+            w = int(random.integers(min_size, max_size + 1))
+            h = int(random.integers(min_size, max_size + 1))
+            x = int(random.integers(0, max(width - w, 1)))
+            y = int(random.integers(0, max(height - h, 1)))
+            appear = int(random.integers(1, max(frames // 2, 2)))
+            disappear = int(random.integers(appear + 1, frames + 2))
+            color = tuple(int(c) for c in random.integers(0, 256, 3))
+            self.objects.append({"x": x, "y": y, "w": w, "h": h, "color": color,
+                                 "appear": appear, "disappear": disappear})
+
+    def __len__(self):
+        return self.frames
+
+    def render(self, idx, out=None):
+        """ Dessine la frame n°idx (dans le buffer out s'il est fourni) et la retourne.
+        """
+        if out is None:
+            out = np.empty_like(self.background)
+        if self.noise:
+            cv2.add(self.background, self.noise[idx % len(self.noise)], dst=out)
+        else:
+            np.copyto(out, self.background)
+        for obj in self.objects:
+            if obj["appear"] <= idx < obj["disappear"]:
+                cv2.rectangle(out, (obj["x"], obj["y"]),
+                              (obj["x"] + obj["w"] - 1, obj["y"] + obj["h"] - 1), obj["color"], -1)
+        if self.rgb:
+            cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+        return out
+
+    def __iter__(self):
+        for idx in range(self.frames):
+            yield self.render(idx)
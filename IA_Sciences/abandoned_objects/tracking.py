@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+""" Stockage compact des objets suivis et appariement par lot des formes détectées.
+
+    Les coordonnées et les temps de tous les objets sont rangés dans des tableaux NumPy
+    (une ligne par objet). Pour apparier les formes d'une frame avec les objets connus,
+    on ne compare pas chaque forme à chaque objet : les objets sont rangés dans une grille
+    dont la taille de case vaut le seuil de tolérance, et une forme n'est comparée qu'aux
+    objets des 9 cases qui l'entourent. Tout l'appariement d'une frame est fait en une fois.
+"""
+
+import numpy as np
+
+
+# Champs stockés dans les tableaux NumPy
+BOX_FIELDS = ("x", "y", "w", "h")
+TIME_FIELDS = ("first_seen", "last_seen")
+
+# Décalage utilisé pour construire une clé unique à partir des coordonnées (cx, cy) d'une case de la grille
+_GRID_KEY = 1 << 20
+
+
+class TrackedObject:
+    """ Un objet suivi.
+
+        Pour rester compatible avec le dictionnaire historique, on accède aux champs avec
+        obj["x"], obj["img"], obj["recognition"], ... Les coordonnées et les temps sont lus
+        et écrits directement dans les tableaux du ObjectStore. Si le ObjectStore a un
+        stockage d'images (voir abandoned_objects.crops), obj["img"] y est lue et écrite.
+        obj["found"] indique si l'objet a déjà été signalé comme objet immobile, et obj["zone"]
+        le nom de la zone d'intérêt où il a été vu pour la première fois (voir abandoned_objects.roi).
+    """
+    __slots__ = ("store", "row", "id", "img", "recognition", "found", "zone")
+
+    def __init__(self, store, row, id):
+        self.store = store
+        self.row = row
+        self.id = id
+        self.img = None
+        self.recognition = []
+        self.found = False
+        self.zone = None
+
+    def __getitem__(self, key):
+        if key in BOX_FIELDS:
+            return int(self.store.boxes[self.row, BOX_FIELDS.index(key)])
+        if key == "first_seen":
+            return float(self.store.first_seen[self.row])
+        if key == "last_seen":
+            return float(self.store.last_seen[self.row])
+        if key == "img" and self.store.crops is not None:
+            return self.store.crops.get(self.id)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in BOX_FIELDS:
+            self.store.boxes[self.row, BOX_FIELDS.index(key)] = value
+            self.store.index_dirty = True
+        elif key == "first_seen":
+            self.store.first_seen[self.row] = value
+        elif key == "last_seen":
+            self.store.last_seen[self.row] = value
+        elif key == "img" and self.store.crops is not None:
+            if value is None:
+                self.store.crops.discard(self.id)
+            else:
+                self.store.crops.put(self.id, value)
+        elif key in ("img", "recognition", "found", "zone"):
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+
+class ObjectStore:
+    """ Ensemble des objets suivis, qui se manipule comme le dictionnaire { id : objet } d'origine.
+    """
+
+    def __init__(self, movement_threshold=10, capacity=64, crops=None, max_movement_threshold=None):
+        """ Paramètres :
+            @movement_threshold : seuil de tolérance (en pixels) sur x, y, w et h pour considérer qu'une forme est un objet déjà connu.
+            @capacity : nombre de lignes allouées au départ. La capacité double quand elle est atteinte.
+            @crops : stockage des images des objets (abandoned_objects.crops.CropStore), None pour les garder dans les objets.
+            @max_movement_threshold : plus grand seuil passé à match() forme par forme (zones d'intérêt), s'il dépasse movement_threshold.
+        """
+        self.movement_threshold = movement_threshold
+        self.crops = crops
+        # La taille des cases de la grille doit couvrir le plus grand seuil utilisé
+        self.cell = max(int(max(movement_threshold, max_movement_threshold or 0)), 1)
+
+        self.boxes = np.zeros((capacity, 4), np.int32)
+        self.first_seen = np.zeros(capacity, np.float64)
+        self.last_seen = np.zeros(capacity, np.float64)
+        self.ids = np.zeros(capacity, np.int64)
+        self.alive = np.zeros(capacity, bool)
+
+        # Lignes libérées par les suppressions, réutilisées en priorité
+        self.free_rows = []
+        # Nombre de lignes déjà utilisées au moins une fois
+        self.top = 0
+
+        # Les objets, dans leur ordre d'apparition
+        self.records = {}
+
+        # Identifiant du dernier objet créé
+        self.last_id = 0
+
+        # Index de la grille (clés de cases triées), reconstruit quand un objet est ajouté ou supprimé
+        self.index_dirty = True
+        self.index_keys = None
+        self.index_rows = None
+
+    # --- Interface "dictionnaire" ---
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def __contains__(self, id):
+        return id in self.records
+
+    def __getitem__(self, id):
+        return self.records[id]
+
+    def get(self, id, default=None):
+        return self.records.get(id, default)
+
+    def keys(self):
+        return list(self.records.keys())
+
+    def values(self):
+        return list(self.records.values())
+
+    def items(self):
+        return list(self.records.items())
+
+    def __delitem__(self, id):
+        obj = self.records.pop(id)
+        if self.crops is not None:
+            self.crops.discard(id)
+        self.alive[obj.row] = False
+        self.free_rows.append(obj.row)
+        self.index_dirty = True
+
+    # --- Gestion des lignes ---
+
+    def _grow(self):
+        capacity = 2 * len(self.ids)
+        self.boxes = np.resize(self.boxes, (capacity, 4))
+        for name in ("first_seen", "last_seen", "ids"):
+            setattr(self, name, np.resize(getattr(self, name), capacity))
+        alive = np.zeros(capacity, bool)
+        alive[:len(self.alive)] = self.alive
+        self.alive = alive
+
+    def add(self, x, y, w, h, now):
+        """ Ajoute un nouvel objet et retourne son identifiant.
+        """
+        self.last_id += 1
+        self.insert(self.last_id, (x, y, w, h), now, now)
+        return self.last_id
+
+    def insert(self, id, box, first_seen, last_seen):
+        """ Ajoute un objet dont on connaît déjà l'identifiant et les moments d'apparition (reprise d'un checkpoint).
+            Retourne l'objet.
+        """
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.top == len(self.ids):
+                self._grow()
+            row = self.top
+            self.top += 1
+
+        self.boxes[row] = box
+        self.first_seen[row] = first_seen
+        self.last_seen[row] = last_seen
+        self.ids[row] = id
+        self.alive[row] = True
+        obj = self.records[id] = TrackedObject(self, row, id)
+        self.last_id = max(self.last_id, id)
+        self.index_dirty = True
+        return obj
+
+    def touch(self, ids, now):
+        """ Met à jour le moment de la dernière visualisation d'une liste d'objets.
+        """
+        rows = [self.records[id].row for id in ids if id in self.records]
+        self.last_seen[rows] = now
+
+    # --- Appariement ---
+
+    def _cell_keys(self, boxes):
+        cx = boxes[:, 0] // self.cell + 1
+        cy = boxes[:, 1] // self.cell + 1
+        return cx.astype(np.int64) * _GRID_KEY + cy
+
+    def _build_index(self):
+        rows = np.flatnonzero(self.alive[:self.top])
+        keys = self._cell_keys(self.boxes[rows])
+        order = np.argsort(keys, kind="stable")
+        self.index_keys = keys[order]
+        self.index_rows = rows[order]
+        self.index_dirty = False
+
+    def _candidate_pairs(self, boxes):
+        """ Retourne les couples (indice de forme, ligne d'objet) des objets situés dans les
+            9 cases de la grille autour de chaque forme.
+        """
+        if self.index_dirty:
+            self._build_index()
+        return self._grid_pairs(self.index_keys, self.index_rows, boxes)
+
+    def _grid_pairs(self, index_keys, index_rows, boxes):
+        """ Retourne les couples (indice de forme, valeur de index_rows) des éléments de l'index (clés de cases
+            triées) situés dans les 9 cases de la grille autour de chaque forme.
+        """
+        keys = self._cell_keys(boxes)
+        pair_boxes = []
+        pair_rows = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                query = keys + dx * _GRID_KEY + dy
+                lo = np.searchsorted(index_keys, query, "left")
+                hi = np.searchsorted(index_keys, query, "right")
+                counts = hi - lo
+                total = counts.sum()
+                if total == 0:
+                    continue
+                # Pour chaque forme, on énumère les positions lo..hi-1 de l'index
+                starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+                positions = starts + np.arange(total)
+                pair_boxes.append(np.repeat(np.arange(len(boxes)), counts))
+                pair_rows.append(index_rows[positions])
+
+        if not pair_boxes:
+            empty = np.empty(0, np.int64)
+            return empty, empty
+        return np.concatenate(pair_boxes), np.concatenate(pair_rows)
+
+    def match(self, boxes, now, thresholds=None):
+        """ Apparie toutes les formes d'une frame avec les objets connus.
+            Paramètres :
+            @boxes : tableau (n, 4) des coordonnées x, y, w, h des formes.
+            @now : le moment de la frame.
+            @thresholds : seuil de tolérance de chaque forme (tableau (n,)), None pour utiliser movement_threshold.
+
+            Chaque forme rafraîchit au plus un objet : le plus proche parmi ceux qui respectent le seuil de tolérance.
+            Les formes qui ne correspondent à aucun objet deviennent de nouveaux objets.
+            Retourne la liste des identifiants (un par forme).
+        """
+        boxes = np.asarray(boxes, np.int32).reshape(-1, 4)
+        ids = np.zeros(len(boxes), np.int64)
+        if len(boxes) == 0:
+            return ids
+
+        if thresholds is None:
+            thresholds = np.full(len(boxes), self.movement_threshold)
+        thresholds = np.asarray(thresholds)
+
+        matched = np.zeros(len(boxes), bool)
+        if self.records:
+            pair_boxes, pair_rows = self._candidate_pairs(boxes)
+            if len(pair_boxes):
+                distance = np.abs(self.boxes[pair_rows] - boxes[pair_boxes]).max(axis=1)
+                ok = distance <= thresholds[pair_boxes]
+                pair_boxes, pair_rows, distance = pair_boxes[ok], pair_rows[ok], distance[ok]
+                # Pour chaque forme, on garde l'objet le plus proche (à distance égale, le plus ancien)
+                order = np.lexsort((self.ids[pair_rows], distance, pair_boxes))
+                first = np.unique(pair_boxes[order], return_index=True)[1]
+                best_boxes = pair_boxes[order][first]
+                best_rows = pair_rows[order][first]
+                self.last_seen[best_rows] = now
+                ids[best_boxes] = self.ids[best_rows]
+                matched[best_boxes] = True
+
+        # Les formes restantes sont de nouveaux objets. Deux formes quasi identiques d'une même frame
+        # ne donnent qu'un seul objet : une forme rejoint le premier nouvel objet créé qui respecte son seuil.
+        # Les formes proches sont cherchées avec la même grille que les objets connus.
+        rest = np.flatnonzero(~matched)
+        if len(rest) == 0:
+            return ids.tolist()
+        keys = self._cell_keys(boxes[rest])
+        order = np.argsort(keys, kind="stable")
+        pair_a, pair_b = self._grid_pairs(keys[order], order, boxes[rest])
+        # On ne garde que les formes précédentes (b < a) qui respectent le seuil de la forme a
+        distance = np.abs(boxes[rest[pair_a]] - boxes[rest[pair_b]]).max(axis=1)
+        ok = (pair_b < pair_a) & (distance <= thresholds[rest[pair_a]])
+        pair_a, pair_b = pair_a[ok], pair_b[ok]
+        order = np.lexsort((pair_b, pair_a))
+        pair_a, pair_b = pair_a[order], pair_b[order]
+        bounds = np.searchsorted(pair_a, np.arange(len(rest) + 1))
+
+        # Formes (indices dans rest) qui ont créé un nouvel objet
+        created = np.zeros(len(rest), bool)
+        for a, i in enumerate(rest):
+            for b in pair_b[bounds[a]:bounds[a + 1]]:
+                if created[b]:
+                    ids[i] = ids[rest[b]]
+                    break
+            else:
+                ids[i] = self.add(*boxes[i].tolist(), now=now)
+                created[a] = True
+        return ids.tolist()
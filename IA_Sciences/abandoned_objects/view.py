@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" Affichage des fenêtres de débogage dans un thread dédié, à fréquence réduite.
+
+    Afficher neuf fenêtres à chaque frame coûte plus cher que la détection elle-même.
+    Ici, la boucle de détection se contente de confier (à la fréquence choisie) une copie
+    des images des fenêtres sélectionnées à un thread qui se charge de l'affichage.
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+# Modes d'affichage de la classe Detection
+DISPLAY_FULL = "full"            # toutes les fenêtres, à chaque frame, dans la boucle de détection
+DISPLAY_DEBUG = "debug"          # fenêtres sélectionnées, à fréquence réduite, dans un thread dédié
+DISPLAY_HEADLESS = "headless"    # aucun affichage ni dessin (serveurs sans écran)
+
+# Position de chaque fenêtre à l'écran
+WINDOW_POSITIONS = {
+    "frame": (0, 0),
+    "gray": (500, 0),
+    "gray blurred": (1000, 0),
+    "delta": (0, 400),
+    "threshold": (500, 400),
+    "dilated": (1000, 400),
+    "reference": (1400, 800),
+    "found objects": (0, 1000),
+}
+
+
+def show_windows(images):
+    """ Affiche chaque image { nom de fenêtre : image } à sa position.
+    """
+    for name, img in images.items():
+        cv2.imshow(name, img)
+        x, y = WINDOW_POSITIONS.get(name, (0, 0))
+        cv2.moveWindow(name, x, y)
+
+
+class DebugView:
+    """ Affiche les fenêtres sélectionnées dans un thread dédié.
+    """
+
+    def __init__(self, windows=("frame", "found objects"), fps=5):
+        """ Paramètres :
+            @windows : noms des fenêtres à afficher (voir WINDOW_POSITIONS).
+            @fps : nombre maximal de rafraîchissements par seconde.
+        """
+        self.windows = tuple(windows)
+        self.period = 1.0 / fps
+        self.last_publish = 0.0
+
+        # Copies des images à afficher, réutilisées d'un rafraîchissement à l'autre
+        self.images = {}
+        self.updated = False
+
+        # Passe à True quand l'utilisateur appuie sur la touche 'q' dans une fenêtre
+        self.quit = False
+
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="debug-view", daemon=True)
+        self.thread.start()
+
+    def due(self):
+        """ Indique s'il est temps de rafraîchir l'affichage.
+        """
+        return time.monotonic() - self.last_publish >= self.period
+
+    def publish(self, images):
+        """ Confie au thread d'affichage une copie des images des fenêtres sélectionnées.
+            Paramètres :
+            @images : dictionnaire { nom de fenêtre : image }. Les fenêtres non sélectionnées sont ignorées.
+        """
+        self.last_publish = time.monotonic()
+        with self.cond:
+            for name in self.windows:
+                img = images.get(name)
+                if img is None:
+                    continue
+                buf = self.images.get(name)
+                if buf is None or buf.shape != img.shape or buf.dtype != img.dtype:
+                    self.images[name] = img.copy()
+                else:
+                    np.copyto(buf, img)
+            self.updated = True
+            self.cond.notify()
+
+    def _run(self):
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: self.updated or not self.running, self.period)
+                if self.updated:
+                    show_windows(self.images)
+                    self.updated = False
+            # waitKey permet aussi à HighGUI de traiter ses événements
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord("q"):
+                self.quit = True
+        cv2.destroyAllWindows()
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout=1)
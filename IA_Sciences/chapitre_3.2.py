@@ -2,16 +2,16 @@
 # -*- coding: utf-8 -*-
 
 # On importe les dépendances nécessaires
-import freenect
 import cv2
 import numpy as np
 
-# Cette fonction va récupérer une frame depuis le flux vidéo.
-# La frame récupérée sera cette de l'instant T
-def get_video():
-    array,_ = freenect.sync_get_video()
-    array = cv2.cvtColor(array,cv2.COLOR_RGB2BGR)
-    return array
+# La fonction get_video va récupérer une frame depuis le flux vidéo du kinect.
+# La frame récupérée sera celle de l'instant T.
+# Elle est partagée par tous les scripts (et par abandoned-objects view) dans le paquet abandoned_objects.
+# Le kinect ne peut être ouvert que par un seul processus : pour regarder le flux pendant que la détection tourne,
+# on lance le démon "abandoned-objects bus --source kinect --name kinect", puis on remplace get_video par
+# abandoned_objects.sources.open_source("bus:kinect") (voir abandoned_objects.bus).
+from abandoned_objects.sources import get_video
 
 # La partie du code appelée quand on lance le script python
 if __name__ == "__main__":
@@ -2,18 +2,15 @@
 # -*- coding: utf-8 -*-
 
 # On importe les librairies nécessaires
-import freenect
 import cv2
 import numpy as np
 import time
 import sys
 
-# Cette fonction va récupérer une frame depuis le flux vidéo.
-# La frame récupérée sera celle de l'instant T
-def get_image():
-    array,_ = freenect.sync_get_video()
-    array = cv2.cvtColor(array,cv2.COLOR_RGB2BGR)
-    return array
+# La fonction get_video va récupérer une frame depuis le flux vidéo du kinect.
+# La frame récupérée sera celle de l'instant T.
+# Elle est partagée par tous les scripts (et par abandoned-objects capture) dans le paquet abandoned_objects.
+from abandoned_objects.sources import get_video as get_image
 
 # On gère un éventuel paramètre optionnel pour construire le nom du fichier cible
 if len(sys.argv) == 2:
@@ -27,7 +24,9 @@ else:
 frame = get_image()
 cv2.imshow("image", frame)
 
-# On sauvegarde l'image dans le fichier
+# On sauvegarde l'image dans le fichier.
+# Pour constituer un jeu d'images (rafale ou timelapse, écriture en tâche de fond, manifeste), voir
+# abandoned-objects capture --count 100 --interval 0.5 --manifest manifest.jsonl (abandoned_objects.snapshots).
 cv2.imwrite(img_file, frame)
 
 # On attend que l'utilisateur appuie sur une touche et on ferme la fenêtre
@@ -1,12 +1,15 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import imutils
 import time
 import cv2
 import numpy as np
 import sys
 
+# Ce script permet de visualiser les étapes sur une paire d'images.
+# Pour comparer de nombreux réglages (flou, seuil, dilatation, méthode de contour) sur de nombreuses paires,
+# voir le balayage de paramètres : python -m abandoned_objects.sweep --help
+
 if __name__ == "__main__":
     # On teste le nombre de paramètres
     if len(sys.argv) < 3:
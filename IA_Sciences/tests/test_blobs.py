@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Tests de l'extraction des formes (abandoned_objects.blobs) : les deux modes donnent les mêmes cadres.
+"""
+
+import cv2
+import numpy as np
+
+from abandoned_objects.blobs import BlobExtractor, BLOB_COMPONENTS, BLOB_CONTOURS
+
+
+def synthetic_mask():
+    mask = np.zeros((240, 320), np.uint8)
+    cv2.rectangle(mask, (10, 10), (60, 50), 255, -1)
+    cv2.circle(mask, (150, 60), 30, 255, -1)
+    cv2.ellipse(mask, (260, 180), (40, 20), 30, 0, 360, 255, -1)
+    pts = np.array([[40, 200], [90, 120], [130, 230]], np.int32)
+    cv2.fillPoly(mask, [pts], 255)
+    # Deux carrés qui ne se touchent que par un coin : une seule forme en 8-connexité
+    cv2.rectangle(mask, (200, 20), (229, 49), 255, -1)
+    cv2.rectangle(mask, (230, 50), (259, 79), 255, -1)
+    # Une forme en anneau, sans rien dans son trou
+    cv2.circle(mask, (170, 170), 35, 255, 8)
+    # Du bruit : de petites formes sous l'aire minimale
+    random = np.random.default_rng(0)
+    for x, y in random.integers(0, 230, (40, 2)):
+        mask[y:y + 2, x + 80:x + 82] = 255
+    return mask
+
+
+def sorted_boxes(boxes):
+    return sorted(map(tuple, boxes.tolist()))
+
+
+def test_contours_and_components_give_the_same_boxes():
+    mask = synthetic_mask()
+    contours = BlobExtractor(BLOB_CONTOURS, min_area=100)
+    components = BlobExtractor(BLOB_COMPONENTS, min_area=100)
+    boxes_contours, areas_contours = contours.extract(mask, with_areas=True)
+    boxes_components, areas_components = components.extract(mask, with_areas=True)
+    assert len(boxes_contours) == 6
+    assert sorted_boxes(boxes_contours) == sorted_boxes(boxes_components)
+    assert boxes_components.dtype == boxes_contours.dtype == np.int32
+
+    # L'aire en pixels est un peu plus grande que l'aire du polygone du contour, sauf pour l'anneau :
+    # l'aire de son contour externe comprend son trou
+    polygon = areas_contours[np.lexsort(boxes_contours.T[::-1])]
+    pixels = areas_components[np.lexsort(boxes_components.T[::-1])]
+    assert np.count_nonzero(pixels >= polygon) == 5
+    full = pixels >= polygon
+    assert (pixels[full] <= polygon[full] * 1.1).all()
+
+
+def test_empty_mask():
+    mask = np.zeros((20, 30), np.uint8)
+    for mode in (BLOB_CONTOURS, BLOB_COMPONENTS):
+        boxes, areas = BlobExtractor(mode).extract(mask, with_areas=True)
+        assert boxes.shape == (0, 4) and areas.shape == (0,)
+
+
+def test_documented_differences():
+    mask = np.zeros((100, 100), np.uint8)
+    cv2.rectangle(mask, (10, 10), (89, 89), 255, -1)
+    cv2.rectangle(mask, (25, 25), (74, 74), 0, -1)
+    # Une forme dans le trou d'une autre : ignorée par les contours externes, gardée par les composantes
+    cv2.rectangle(mask, (40, 40), (59, 59), 255, -1)
+    contours = BlobExtractor(BLOB_CONTOURS, min_area=50).extract(mask)
+    components = BlobExtractor(BLOB_COMPONENTS, min_area=50).extract(mask)
+    assert sorted_boxes(contours) == [(10, 10, 80, 80)]
+    assert sorted_boxes(components) == [(10, 10, 80, 80), (40, 40, 20, 20)]
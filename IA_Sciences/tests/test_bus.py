@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+""" Tests du bus de frames en mémoire partagée (abandoned_objects.bus).
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from abandoned_objects.bus import FrameBusWriter
+
+
+# Un lecteur lancé à part (comme abandoned-objects detect --source bus:...), avec son propre resource tracker
+READER = """
+import sys
+from abandoned_objects.bus import FrameBusReader
+reader = FrameBusReader(sys.argv[1], timeout=5)
+print(int(reader.read()[0][0, 0, 0]))
+reader.stop()
+"""
+
+
+def read_in_process(name):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.check_output([sys.executable, "-c", READER, name], cwd=root, timeout=60).strip()
+
+
+def test_reader_process_exit_keeps_the_bus():
+    name = "test_bus_{0}".format(os.getpid())
+    writer = FrameBusWriter(name, (4, 4, 3), slots=4)
+    try:
+        writer.publish(np.full((4, 4, 3), 7, np.uint8))
+        assert read_in_process(name) == b"7"
+        # Le lecteur est parti : le bus existe toujours pour les suivants
+        writer.publish(np.full((4, 4, 3), 8, np.uint8))
+        assert read_in_process(name) == b"8"
+    finally:
+        writer.close()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+""" Tests de la capture dans un thread dédié (abandoned_objects.capture).
+"""
+
+import numpy as np
+import pytest
+
+from abandoned_objects.capture import ThreadedCapture, POLICY_BLOCK
+
+
+def test_frames_are_read_in_order_with_block_policy():
+    frames = iter([np.full((4, 4, 3), i, np.uint8) for i in range(5)] + [None])
+    capture = ThreadedCapture(lambda: next(frames), buffers=2, policy=POLICY_BLOCK)
+    values = []
+    while True:
+        frame, _ = capture.read(timeout=2)
+        if frame is None:
+            break
+        values.append(int(frame[0, 0, 0]))
+    assert values == [0, 1, 2, 3, 4]
+    assert capture.dropped == 0
+
+
+def test_callback_exception_reaches_the_reader():
+    calls = []
+
+    def get_frame():
+        calls.append(1)
+        if len(calls) > 2:
+            raise IOError("kinect débranché")
+        return np.zeros((4, 4, 3), np.uint8)
+
+    capture = ThreadedCapture(get_frame, buffers=4, policy=POLICY_BLOCK)
+    assert capture.read(timeout=2)[0] is not None
+    assert capture.read(timeout=2)[0] is not None
+    # Sans la transmission de l'exception, cette lecture attendrait indéfiniment
+    with pytest.raises(IOError):
+        capture.read(timeout=None)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+""" Tests de la sauvegarde et de la reprise de l'état de la détection (abandoned_objects.checkpoint).
+"""
+
+import numpy as np
+import pytest
+
+from abandoned_objects.checkpoint import load_checkpoint, save_checkpoint
+from abandoned_objects.crops import CropStore
+from abandoned_objects.detection import Detection
+from abandoned_objects.sources import ReplaySource
+from abandoned_objects.synthetic import SyntheticScene
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "state.npz")
+    crop = np.arange(5 * 7 * 3, dtype=np.uint8).reshape(5, 7, 3)
+    state = {
+        "saved_at": 12.5,
+        "last_id": 9,
+        "input_shape": [240, 320, 3],
+        "reference": np.full((240, 320), 7, np.uint8),
+        "ids": [3, 9],
+        "boxes": np.array([[1, 2, 3, 4], [5, 6, 7, 8]]),
+        "first_seen": np.array([1.0, 2.0]),
+        "last_seen": np.array([10.0, 12.0]),
+        "found": [True, False],
+        "crops": [crop, None],
+        "recognition": {"3": [u"sac", u"rouge"], "9": []},
+        "zones": {"3": u"entrée"},
+    }
+    save_checkpoint(path, state)
+    loaded = load_checkpoint(path)
+    assert loaded["ids"] == [3, 9]
+    assert loaded["last_id"] == 9
+    assert loaded["input_shape"] == (240, 320, 3)
+    assert np.array_equal(loaded["reference"], state["reference"])
+    assert np.array_equal(loaded["boxes"], state["boxes"])
+    assert loaded["found"] == [True, False]
+    assert np.array_equal(loaded["crops"][0], crop)
+    assert loaded["crops"][1] is None
+    assert loaded["recognition"]["3"] == [u"sac", u"rouge"]
+    assert loaded["zones"] == {"3": u"entrée"}
+
+
+def test_snapshot_survives_spill_compaction(tmp_path):
+    store = CropStore(budget_bytes=300, spill_path=str(tmp_path / "spill.bin"), spill_budget_bytes=1200)
+    for key in range(3):
+        store.put(key, np.full((10, 10, 3), key, np.uint8))
+    snapshot = store.snapshot([0, None, 2])
+    # Les images suivantes forcent une compaction, qui réécrit le fichier de débordement
+    for key in range(3, 12):
+        store.put(key, np.full((10, 10, 3), key, np.uint8))
+    data, shape, encoded = snapshot.read(0)
+    assert not encoded and data.reshape(shape)[0, 0, 0] == 0
+    assert snapshot.read(1) is None
+    assert snapshot.read(2)[0].reshape(shape)[0, 0, 0] == 2
+    snapshot.close()
+    store.close()
+
+
+def run_scene(frames, path, **options):
+    source = ReplaySource(frames, fps=len(frames) / 40.0)
+    detection = Detection(source, display="headless", clock=source.clock, checkpoint_path=path,
+                          checkpoint_interval=3600, **options)
+    detection.detect_objects()
+    return detection
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"crop_compression": "jpg"},
+    {"crop_compression": "png", "crop_budget_bytes": 1, "crop_spill_path": "spill.bin"},
+])
+def test_detection_round_trip(tmp_path, options):
+    if "crop_spill_path" in options:
+        options = dict(options, crop_spill_path=str(tmp_path / options["crop_spill_path"]))
+    path = str(tmp_path / "state.npz")
+    scene = SyntheticScene(320, 240, n_objects=4, frames=100, seed=3)
+    frames = list(scene)
+    # La scène s'arrête avant que les objets disparaissent : ils sont sauvegardés à la fermeture
+    first = run_scene(frames[:60], path, **options)
+    found = dict((id, (obj["x"], obj["y"], obj["w"], obj["h"])) for id, obj in first.objects.items() if obj["found"])
+    assert found
+
+    # Le checkpoint ne doit ni décoder ni relire les images dans la boucle de détection
+    restored = Detection(ReplaySource([], fps=1.0), display="headless", checkpoint_path=path, **options)
+    restored.crops._unpack = None
+    restored.checkpoint_state()["crops"].close()
+    del restored.crops._unpack
+
+    for id, box in found.items():
+        obj = restored.objects[id]
+        assert obj["found"]
+        assert (obj["x"], obj["y"], obj["w"], obj["h"]) == box
+        img = obj["img"]
+        assert img is not None and img.shape == (box[3], box[2], 3)
+    assert restored.objects.last_id == first.objects.last_id
+    restored.close()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+""" Tests de l'enregistrement des clips vidéo (abandoned_objects.clips).
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from abandoned_objects.clips import ClipRecorder
+
+
+FPS = 10.0
+
+
+def frame(value):
+    return np.full((48, 64, 3), value % 256, np.uint8)
+
+
+def recorder(tmp_path, cls=ClipRecorder, frames=80, **options):
+    options.setdefault("budget_bytes", frames * frame(0).nbytes)
+    return cls(str(tmp_path), pre_seconds=1.0, post_seconds=1.0, codec="MJPG", extension=".avi", fps=FPS, **options)
+
+
+def count_frames(path):
+    capture = cv2.VideoCapture(path)
+    count = 0
+    while capture.read()[0]:
+        count += 1
+    capture.release()
+    return count
+
+
+def test_ring_keeps_the_last_frames(tmp_path):
+    clips = recorder(tmp_path, frames=8)
+    for idx in range(1, 21):
+        clips.add(frame(idx), idx / FPS)
+    assert clips.capacity == 8 and clips.seq == 20
+    # Les 8 dernières frames, chacune à sa place dans l'anneau
+    assert sorted(clips.slot_seq.tolist()) == list(range(13, 21))
+    assert clips._read(20) == 2.0 and clips.scratch[0, 0, 0] == 20
+    # Une frame écrasée n'est plus lisible
+    assert clips._read(12) is None
+    clips.add(np.zeros((10, 10, 3), np.uint8), 2.1)
+    assert clips.ignored == 1
+    clips.close()
+
+
+def test_clip_covers_pre_and_post_seconds(tmp_path):
+    clips = recorder(tmp_path)
+    t = 0.0
+    for idx in range(30):
+        t = idx / FPS
+        clips.add(frame(idx), t)
+    path = clips.trigger(1, t)
+    for idx in range(30, 60):
+        clips.add(frame(idx), idx / FPS)
+    clips.close()
+    assert clips.written == 1 and clips.lost == 0
+    # 1s avant (10 frames et celle de l'événement), puis 1s après
+    assert count_frames(path) == 21
+
+
+def test_trigger_extends_an_open_clip(tmp_path):
+    clips = recorder(tmp_path)
+    for idx in range(20):
+        clips.add(frame(idx), idx / FPS)
+    with clips.cond:
+        first = clips.trigger(1, 1.9)
+        second = clips.trigger(2, 2.5)
+    assert first == second
+    assert clips.pending == 1 and clips.clips[0].ids == [1, 2]
+    assert clips.clips[0].end_time == 3.5
+    for idx in range(20, 50):
+        clips.add(frame(idx), idx / FPS)
+    clips.close()
+    assert clips.written == 1
+    # De 0.9s (1s avant le premier événement) à 3.5s (1s après le second)
+    assert count_frames(first) == 27
+
+
+class SlowRecorder(ClipRecorder):
+    """ Le clip encodé reste dans la liste jusqu'à ce que le test le libère.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.encoded = threading.Event()
+        self.release = threading.Event()
+        ClipRecorder.__init__(self, *args, **kwargs)
+
+    def _encode(self, clip):
+        ClipRecorder._encode(self, clip)
+        self.encoded.set()
+        self.release.wait(5)
+
+
+def test_closed_clip_is_not_extended(tmp_path):
+    clips = recorder(tmp_path, cls=SlowRecorder)
+    for idx in range(20):
+        clips.add(frame(idx), idx / FPS)
+    first = clips.trigger(1, 1.9)
+    for idx in range(20, 31):
+        clips.add(frame(idx), idx / FPS)
+    # L'encodage est terminé (la frame à 3.0s dépasse la fin du clip) mais le clip n'est pas encore retiré
+    assert clips.encoded.wait(5)
+    assert clips.clips[0].closed
+    second = clips.trigger(2, 3.0)
+    assert second is not None and second != first
+    assert clips.pending == 2
+    clips.release.set()
+    for idx in range(31, 50):
+        clips.add(frame(idx), idx / FPS)
+    clips.close()
+    assert clips.written == 2
+    # Le second clip a bien sa seconde après l'événement
+    assert count_frames(second) == 21
+
+
+def test_frames_overwritten_before_encoding_are_counted_as_lost(tmp_path):
+    clips = recorder(tmp_path, frames=8)
+    for idx in range(8):
+        clips.add(frame(idx), idx / FPS)
+    path = clips.trigger(1, 0.7)
+    # Le thread d'encodage est bloqué pendant que l'anneau fait plus d'un tour
+    with clips.cond:
+        for idx in range(8, 20):
+            clips.add(frame(idx), idx / FPS)
+    # Puis il rattrape son retard : les frames de 0.2s à 1.1s sont perdues, celles de 1.2s à 1.7s écrites
+    time.sleep(0.2)
+    clips.close()
+    assert clips.lost == 10
+    assert count_frames(path) == 6
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+""" Tests du stockage des images des objets (abandoned_objects.crops).
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from abandoned_objects.crops import CropStore
+
+
+def crop(value, size=10):
+    return np.full((size, size, 3), value, np.uint8)
+
+
+def test_copies_are_compact_and_counted():
+    store = CropStore(budget_bytes=10000)
+    frame = np.zeros((100, 100, 3), np.uint8)
+    store.put(1, frame[10:20, 10:20])
+    assert store.bytes == 300
+    frame[:] = 255
+    assert store.get(1).max() == 0
+    store.put(1, crop(1))
+    assert store.bytes == 300
+    store.discard(1)
+    assert store.bytes == 0
+    assert 1 not in store
+
+
+def test_eviction_without_spill_keeps_the_budget():
+    store = CropStore(budget_bytes=1000)
+    for key in range(5):
+        store.put(key, crop(key))
+    assert store.bytes <= 1000
+    assert store.memory_usage()["entries"] == 3
+    assert store.evicted == 2
+    assert store.get(0) is None
+    assert store.get(4)[0, 0, 0] == 4
+
+
+def test_spill_accounting_follows_discards(tmp_path):
+    store = CropStore(budget_bytes=600, spill_path=str(tmp_path / "spill.bin"))
+    for key in range(6):
+        store.put(key, crop(key))
+    assert store.memory_usage()["spilled_entries"] == 4
+    assert store.spill_bytes == 1200
+    assert store.get(0)[0, 0, 0] == 0
+    store.discard(0)
+    store.discard(1)
+    assert store.spill_bytes == 600
+    assert len(store) == 4
+    store.close()
+
+
+def test_spill_file_is_compacted_on_its_size(tmp_path):
+    path = str(tmp_path / "spill.bin")
+    store = CropStore(budget_bytes=300, spill_path=path, spill_budget_bytes=1500)
+    for key in range(40):
+        store.put(key, crop(key))
+        # Les objets disparaissent : leurs images sont oubliées
+        if key >= 2:
+            store.discard(key - 2)
+    assert os.path.getsize(path) <= 1500
+    assert store.spill_bytes == sum(length for _, length, _, _ in store.spilled.values())
+    assert store.get(39)[0, 0, 0] == 39
+    store.close()
+
+
+@pytest.mark.parametrize("compression", ["jpg", "png"])
+def test_compressed_crops_round_trip(compression):
+    store = CropStore(compression=compression, quality=95)
+    img = crop(120, 32)
+    store.put(1, img)
+    assert store.bytes < img.nbytes
+    assert np.abs(store.get(1).astype(int) - 120).max() <= 2
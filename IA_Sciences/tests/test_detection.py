@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+""" Tests de la boucle de détection (abandoned_objects.detection) sur des scènes synthétiques.
+"""
+
+import cv2
+import numpy as np
+
+from abandoned_objects.detection import Detection
+from abandoned_objects.sources import ReplaySource
+from abandoned_objects.synthetic import SyntheticScene
+
+
+def test_reference_average_gets_every_frame_while_gated():
+    scene = SyntheticScene(320, 240, n_objects=0, frames=1, noise=0)
+    dark = scene.render(0)
+    bright = cv2.add(dark, (60, 60, 60, 0))
+    source = ReplaySource([dark] * 5 + [bright] * 60, fps=30.0)
+    detection = Detection(source, display="headless", clock=source.clock,
+                          motion_gate=True, gate_max_skip=30, rebaseline=True)
+    updates = []
+    update = detection.rebaseliner.update
+    detection.rebaseliner.update = lambda blurred, now: updates.append(now) or update(blurred, now)
+    detection.detect_objects()
+    # Le changement global est vu sur la première frame claire, puis chaque frame claire nourrit la moyenne
+    assert len(updates) == 60
+
+
+class RecordingStream:
+    """ Serveur de flux factice : garde une copie de chaque image affichée.
+    """
+
+    def __init__(self):
+        self.frames = []
+
+    def due(self):
+        return True
+
+    def publish(self, images, objects):
+        self.frames.append(images["frame"].copy())
+
+    def stop(self):
+        pass
+
+
+def displayed_frames(frames, motion_gate):
+    source = ReplaySource(frames, fps=1.0)
+    stream = RecordingStream()
+    detection = Detection(source, display="headless", stream_server=stream, clock=source.clock,
+                          motion_gate=motion_gate, gate_max_skip=100)
+    detection.detect_objects()
+    return detection, stream.frames
+
+
+def test_skipped_frames_are_displayed_like_processed_ones():
+    scene = SyntheticScene(320, 240, n_objects=0, frames=1, noise=0)
+    empty = scene.render(0)
+    with_object = empty.copy()
+    cv2.rectangle(with_object, (100, 80), (160, 140), (20, 200, 240), -1)
+    # L'objet reste immobile assez longtemps pour être trouvé : son cadre et ses délais sont affichés
+    frames = [empty] * 3 + [with_object] * 20
+
+    gated, gated_frames = displayed_frames(frames, motion_gate=True)
+    assert gated.motion_gate.skipped_total >= 15
+    _, processed_frames = displayed_frames(frames, motion_gate=False)
+    assert len(gated_frames) == len(processed_frames)
+    for gated_frame, processed_frame in zip(gated_frames, processed_frames):
+        assert np.array_equal(gated_frame, processed_frame)
+    # Tant que les délais ne sont pas affichés, les frames sautées donnent exactement la même image
+    assert np.array_equal(gated_frames[3], gated_frames[5])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+""" Tests du journal des événements (abandoned_objects.events) : format des segments, index et reprise après un arrêt brutal.
+"""
+
+import os
+
+import numpy as np
+
+from abandoned_objects.events import (EventLog, INDEX_DTYPE, EVENT_APPEAR, EVENT_STATIONARY, EVENT_RECOGNIZED,
+                                      EVENT_DISAPPEAR, decode_crop)
+
+
+def crop(value):
+    return np.full((16, 24, 3), value, np.uint8)
+
+
+def write_events(folder, count, start=0.0, **options):
+    log = EventLog(folder, **options)
+    for idx in range(count):
+        log.append(EVENT_STATIONARY if idx % 2 else EVENT_APPEAR, start + idx, idx + 1, (idx, idx + 1, 10, 20),
+                   tags=["objet {0}".format(idx)] if idx % 2 else None, crop=crop(idx * 10) if idx % 2 else None)
+    log.close()
+    return log
+
+
+def test_round_trip(tmp_path):
+    folder = str(tmp_path)
+    write_events(folder, 6)
+    log = EventLog(folder, readonly=True)
+    events = list(log.events())
+    assert [event.object_id for event in events] == [1, 2, 3, 4, 5, 6]
+    assert [event.type for event in events] == [EVENT_APPEAR, EVENT_STATIONARY] * 3
+    assert events[3].box == (3, 4, 10, 20)
+    assert events[3].tags == ["objet 3"] and events[2].tags == []
+    assert events[2].crop == b"" and decode_crop(events[2].crop) is None
+    image = decode_crop(events[3].crop)
+    assert image.shape == (16, 24, 3) and abs(int(image.mean()) - 30) <= 2
+
+    # Recherche par plage de temps [start, end[, par objet et par type
+    assert log.query(start=2, end=4)["object_id"].tolist() == [3, 4]
+    assert log.query(object_id=5)["ts"].tolist() == [4.0]
+    assert log.query(types=[EVENT_STATIONARY])["object_id"].tolist() == [2, 4, 6]
+    log.close()
+
+
+def test_sessions_and_segments(tmp_path):
+    folder = str(tmp_path)
+    # Des segments minuscules : un événement avec image par segment
+    write_events(folder, 6, segment_bytes=256)
+    write_events(folder, 2, start=10.0, segment_bytes=256)
+    assert len([name for name in os.listdir(folder) if name.startswith("segment_")]) > 2
+    log = EventLog(folder, readonly=True)
+    # Les ids repartent de 1 à chaque session : la session les distingue
+    assert log.query(object_id=1)["session"].tolist() == [1, 2]
+    assert [event.ts for event in log.events(session=2)] == [10.0, 11.0]
+    assert len(list(log.events())) == 8
+    log.close()
+
+
+def test_unsorted_index_is_filtered_entirely(tmp_path):
+    folder = str(tmp_path)
+    log = EventLog(folder)
+    for ts in (5.0, 6.0, 1.0, 7.0):
+        log.append(EVENT_DISAPPEAR, ts, int(ts))
+    log.close()
+    log = EventLog(folder, readonly=True)
+    assert log.query(start=1.0, end=6.0)["object_id"].tolist() == [5, 1]
+    assert not log.index_sorted
+    log.close()
+
+
+def test_recovery_after_a_crash(tmp_path):
+    folder = str(tmp_path)
+    write_events(folder, 6)
+    index_path = os.path.join(folder, "index.bin")
+    segment_path = os.path.join(folder, "segment_000001.log")
+    index = np.fromfile(index_path, INDEX_DTYPE)
+    last = index[-1]
+
+    # Arrêt brutal : le dernier événement est à moitié écrit dans le segment, et les lignes d'index
+    # des deux derniers événements manquent (la dernière est même coupée en deux)
+    with open(segment_path, "r+b") as f:
+        f.truncate(int(last["offset"]) + int(last["length"]) // 2)
+    with open(index_path, "r+b") as f:
+        f.truncate(4 * INDEX_DTYPE.itemsize + INDEX_DTYPE.itemsize // 2)
+
+    # À l'ouverture, le 5e événement (complet) est réindexé, le 6e coupé ; la nouvelle session écrit à la suite
+    log = EventLog(folder)
+    assert len(log.query()) == 5
+    assert os.path.getsize(segment_path) == int(last["offset"])
+    log.append(EVENT_RECOGNIZED, 20.0, 1, tags=["sac"], crop=crop(200))
+    log.close()
+
+    log = EventLog(folder, readonly=True)
+    events = list(log.events())
+    assert [(event.session, event.object_id) for event in events] == [(1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (2, 1)]
+    assert events[4].box == (4, 5, 10, 20) and events[3].tags == ["objet 3"]
+    assert events[-1].tags == ["sac"] and decode_crop(events[-1].crop).shape == (16, 24, 3)
+    assert log.query()["offset"][-1] == last["offset"]
+    log.close()
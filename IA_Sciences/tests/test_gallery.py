@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+""" Tests de la mise en page de la galerie des objets trouvés (abandoned_objects.gallery).
+"""
+
+import numpy as np
+
+from abandoned_objects.gallery import Gallery
+
+
+def items(count, size=120):
+    white = np.full((size, size, 3), 255, np.uint8)
+    return [(idx, white, ["sac", "rouge", "cuir", "fermé", "posé"]) for idx in range(count)]
+
+
+def content_bottom(gallery, rows):
+    # Dernière ligne de pixels de la dernière rangée (l'espace entre les cases n'en fait pas partie)
+    return rows * gallery.cell_height - gallery.padding
+
+
+def test_default_size_fits_two_rows():
+    gallery = Gallery(1500, 500)
+    assert gallery.cell_height == 248
+    assert (gallery.columns, gallery.rows) == (11, 2)
+    assert content_bottom(gallery, gallery.rows) <= 500
+    gallery.update(items(22))
+    assert gallery.pages == 1
+    # Rien n'est dessiné sous la dernière rangée
+    assert not gallery.image[content_bottom(gallery, 2):].any()
+
+
+def test_page_label_has_its_own_band():
+    gallery = Gallery(1500, 500)
+    gallery.update(items(30))
+    # Avec plusieurs pages, les rangées laissent la place du numéro de page
+    rows = gallery.paged_rows
+    assert gallery.per_page == gallery.columns * rows and gallery.pages == 3
+    band = 500 - Gallery.PAGE_HEIGHT
+    assert content_bottom(gallery, rows) <= band
+    # Les cases s'arrêtent au-dessus de la bande, et le numéro de page y est entièrement dessiné
+    assert not gallery.image[content_bottom(gallery, rows):band].any()
+    assert gallery.image[band:].any() and not gallery.image[band:, :1300].any()
+
+
+def test_taller_gallery_pages_with_label():
+    gallery = Gallery(800, 800, thumb_size=80)
+    assert gallery.cell_height == 208
+    assert (gallery.rows, gallery.paged_rows) == (3, 3)
+    gallery.update(items(40, size=80))
+    assert gallery.columns == 7
+    assert gallery.per_page == 21 and gallery.pages == 2
+    assert content_bottom(gallery, 3) <= 800 - Gallery.PAGE_HEIGHT
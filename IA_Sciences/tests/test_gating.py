@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+""" Tests de la détection des frames inchangées (abandoned_objects.gating).
+"""
+
+import cv2
+import numpy as np
+
+from abandoned_objects.detection import Detection
+from abandoned_objects.gating import MotionGate
+from abandoned_objects.sources import ReplaySource
+from abandoned_objects.synthetic import SyntheticScene
+
+
+def test_rgb_frames_use_rgb_luma_weights():
+    bgr = np.zeros((64, 64, 3), np.uint8)
+    changed = bgr.copy()
+    # Du rouge apparaît : il pèse bien plus lourd en luminance que le bleu
+    changed[..., 2] = 200
+    bgr_gate = MotionGate(threshold=0.0)
+    bgr_gate.check(bgr)
+    bgr_gate.check(changed)
+    rgb_gate = MotionGate(threshold=0.0, input_rgb=True)
+    rgb_gate.check(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    rgb_gate.check(cv2.cvtColor(changed, cv2.COLOR_BGR2RGB))
+    assert rgb_gate.score == bgr_gate.score
+    assert rgb_gate.score > 50
+
+
+def test_motion_outside_the_rect_is_ignored():
+    gate = MotionGate(threshold=2.0)
+    frame = np.full((120, 160, 3), 100, np.uint8)
+    rect = (0, 0, 80, 120)
+    assert gate.check(frame, rect)
+    outside = frame.copy()
+    outside[:, 100:] = 255
+    assert not gate.check(outside, rect)
+    inside = frame.copy()
+    inside[:, :40] = 255
+    assert gate.check(inside, rect)
+
+
+def test_detection_gate_only_watches_the_zones():
+    scene = SyntheticScene(320, 240, n_objects=0, frames=1, noise=0)
+    background = scene.render(0)
+    frames = []
+    # Quelqu'un passe et repasse dans la moitié droite de l'image, hors de la zone surveillée
+    for idx in range(30):
+        frame = background.copy()
+        x = 240 + (idx % 3) * 20
+        cv2.rectangle(frame, (x, 40), (x + 30, 200), (0, 0, 0), -1)
+        frames.append(frame)
+    source = ReplaySource(frames, fps=10.0)
+    zones = [{"name": "quai", "polygon": [[0, 0], [200, 0], [200, 375], [0, 375]]}]
+    detection = Detection(source, display="headless", clock=source.clock, resize_width=500,
+                          motion_gate=True, gate_max_skip=100, zones=zones)
+    detection.detect_objects()
+    # La première frame sert de référence, la deuxième de point de comparaison au filtre : toutes les autres sont sautées
+    assert detection.motion_gate.skipped_total == len(frames) - 2
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+""" Tests de l'export périodique des métriques (abandoned_objects.metrics).
+"""
+
+import os
+import time
+
+from abandoned_objects.metrics import MetricsExporter
+
+
+class BrokenOnceMetrics:
+    """ Métriques dont le premier export échoue.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def to_json(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise OSError("disque plein")
+        return "{}"
+
+
+def test_export_error_does_not_stop_the_exporter(tmp_path):
+    path = str(tmp_path / "metrics.json")
+    exporter = MetricsExporter(BrokenOnceMetrics(), path, interval=0.01, format="json").start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    exporter.stop()
+    assert exporter.failures >= 1
+    assert os.path.exists(path)
+    assert exporter.thread is not None
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+""" Tests de la file d'attente d'identification (abandoned_objects.recognition).
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from abandoned_objects.recognition import RecognitionQueue
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FlakyBackend:
+    """ Service qui lève une exception inattendue au premier appel, puis répond normalement.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, images):
+        self.calls += 1
+        if self.calls == 1:
+            raise KeyError("outputs")
+        return [["objet"] for _ in images]
+
+
+def test_unexpected_backend_error_does_not_kill_the_workers():
+    results = {}
+    rq = RecognitionQueue(FlakyBackend(), lambda id, tags: results.__setitem__(id, tags),
+                          workers=1, batch_size=1, retries=0)
+    img = np.zeros((8, 8, 3), np.uint8)
+    rq.submit(1, img)
+    assert wait_until(lambda: rq.failed == 1)
+    rq.submit(2, img)
+    assert wait_until(lambda: 2 in results)
+    assert all(thread.is_alive() for thread in rq.threads)
+    rq.close()
+
+
+def test_callback_error_does_not_kill_the_workers():
+    calls = []
+
+    def on_result(id, tags):
+        calls.append(id)
+        if id == 1:
+            raise ValueError("callback")
+
+    rq = RecognitionQueue(FlakyBackend(), on_result, workers=1, batch_size=1, retries=1)
+    img = np.zeros((8, 8, 3), np.uint8)
+    rq.submit(1, img)
+    assert wait_until(lambda: calls == [1])
+    rq.submit(2, img)
+    assert wait_until(lambda: calls == [1, 2])
+    rq.close()
+
+
+class SlowBackend:
+    def __init__(self, latency):
+        self.latency = latency
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def predict(self, images):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+        return [["objet"] for _ in images]
+
+
+def test_timed_out_calls_still_count_against_the_worker_limit():
+    backend = SlowBackend(0.3)
+    rq = RecognitionQueue(backend, lambda id, tags: None, workers=2, batch_size=1, timeout=0.05, retries=3)
+    img = np.zeros((8, 8, 3), np.uint8)
+    for id in range(6):
+        rq.submit(id, img)
+    assert wait_until(lambda: rq.depth == 0 and backend.running == 0, timeout=10)
+    assert backend.max_running <= 2
+    rq.close()
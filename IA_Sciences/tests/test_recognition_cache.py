@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+""" Tests du cache des identifications (abandoned_objects.recognition_cache).
+"""
+
+from abandoned_objects.recognition_cache import RecognitionCache
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = RecognitionCache(path=path)
+    cache.put(0x1234, ["sac", "rouge"])
+    cache.save()
+    assert RecognitionCache(path=path).get(0x1234) == ["sac", "rouge"]
+
+
+def test_truncated_cache_file_starts_empty(tmp_path):
+    path = tmp_path / "cache.json"
+    cache = RecognitionCache(path=str(path))
+    cache.put(0x1234, ["sac"])
+    cache.save()
+    path.write_text(path.read_text()[:-5])
+    cache = RecognitionCache(path=str(path))
+    assert len(cache) == 0
+
+
+def test_malformed_cache_file_starts_empty(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text('[["zz", [["sac"], 0]]]')
+    assert len(RecognitionCache(path=str(path))) == 0
+    path.write_text('{"a": 1}')
+    assert len(RecognitionCache(path=str(path))) == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_on_the_given_clock():
+    clock = FakeClock()
+    cache = RecognitionCache(ttl=10, clock=clock)
+    cache.put(0x1234, ["sac"])
+    clock.now = 9.0
+    assert cache.get(0x1234) == ["sac"]
+    clock.now = 11.0
+    assert cache.get(0x1234) is None
+    assert len(cache) == 0
+
+
+def test_expired_nearest_entry_does_not_hide_a_valid_one():
+    clock = FakeClock()
+    cache = RecognitionCache(ttl=10, max_distance=6, clock=clock)
+    cache.put(0b111, ["ancien"])
+    clock.now = 8.0
+    cache.put(0b111000, ["récent"])
+    clock.now = 12.0
+    # L'entrée la plus proche (1 bit) a expiré, la suivante (5 bits) est encore valide
+    assert cache.get(0b110) == ["récent"]
+    assert len(cache) == 1
+    assert cache.hits == 1 and cache.misses == 0
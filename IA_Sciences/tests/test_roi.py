@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+""" Tests des zones d'intérêt (abandoned_objects.roi) et du traitement limité à leur rectangle (abandoned_objects.preprocess).
+"""
+
+import numpy as np
+import pytest
+
+from abandoned_objects.preprocess import Preprocessor
+from abandoned_objects.roi import RegionsOfInterest
+
+
+def square(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def two_zones(margin=0):
+    # "gauche" et "droite" partagent le bord x = 100 ; "droite" exige de plus grands objets
+    roi = RegionsOfInterest([{"name": "gauche", "polygon": square(0, 0, 100, 100)},
+                             {"name": "droite", "polygon": square(100, 0, 200, 100), "min_object_area": 500,
+                              "movement_threshold": 30}],
+                            min_object_area=100, movement_threshold=10, margin=margin)
+    roi.layout((150, 250))
+    return roi
+
+
+def assign(roi, boxes, areas):
+    boxes, zones, thresholds = roi.assign(np.array(boxes, np.int32).reshape(-1, 4), np.array(areas, np.float64))
+    return boxes.tolist(), [roi.names[zone] for zone in zones], thresholds.tolist()
+
+
+def test_box_straddling_two_zones_goes_to_its_centre():
+    roi = two_zones()
+    # Le cadre déborde sur les deux zones : son centre (x = 69) est à gauche, celui du second (x = 130) à droite
+    boxes, zones, thresholds = assign(roi, [(40, 10, 58, 20), (70, 50, 120, 20)], [1000, 1000])
+    assert zones == ["gauche", "droite"]
+    assert thresholds == [10, 30]
+
+
+def test_centre_on_a_shared_edge_goes_to_the_last_zone():
+    roi = two_zones()
+    # Les bords sont dans la zone, et sur un bord commun la dernière zone l'emporte
+    _, zones, _ = assign(roi, [(90, 10, 20, 20), (0, 90, 20, 20)], [1000, 1000])
+    assert zones == ["droite", "gauche"]
+    # Centre sur le bord extérieur (y = 100) : encore dans la zone ; juste au-delà (y = 101, dans la marge) :
+    # hors zone, la forme est ignorée
+    roi = two_zones(margin=8)
+    _, zones, _ = assign(roi, [(10, 90, 20, 20), (10, 91, 20, 20)], [1000, 1000])
+    assert zones == ["gauche"]
+
+
+def test_zone_minimum_area():
+    roi = two_zones()
+    _, zones, _ = assign(roi, [(10, 10, 20, 20), (150, 10, 20, 20)], [300, 300])
+    assert zones == ["gauche"]
+
+
+def test_margin_is_clipped_at_the_frame_border():
+    roi = two_zones(margin=8)
+    # À gauche et en haut, la marge sort de l'image ; à droite et en bas, elle y reste
+    assert roi.rect == (0, 0, 209, 109)
+    assert roi.mask.shape == (109, 209)
+    assert roi.mask[:101, :201].all() and not roi.mask[101:].any() and not roi.mask[:, 201:].any()
+    # Les cadres sont retournés en coordonnées de la frame réduite
+    roi = RegionsOfInterest([{"name": "coin", "polygon": square(200, 100, 249, 149)}], margin=8)
+    assert roi.layout((150, 250)) == (192, 92, 58, 58)
+    boxes, zones, _ = assign(roi, [(10, 10, 30, 30)], [1000])
+    assert boxes == [[202, 102, 30, 30]] and zones == ["coin"]
+
+
+def test_zones_outside_the_frame_are_rejected():
+    roi = RegionsOfInterest([{"name": "ailleurs", "polygon": square(600, 600, 700, 700)}])
+    with pytest.raises(ValueError):
+        roi.layout((150, 250))
+
+
+@pytest.mark.parametrize("input_rgb", [False, True])
+def test_cropped_resize_matches_the_full_frame(input_rgb):
+    random = np.random.default_rng(0)
+    frame = random.integers(0, 256, (300, 500, 3), dtype=np.uint8)
+    zones = [{"name": "quai", "polygon": square(60, 40, 180, 120)}]
+    # Rien à dessiner : seul le rectangle des zones est réduit ; full_frame : toute la frame est réduite
+    cropped = Preprocessor(width=250, input_rgb=input_rgb, copy_frame=False, roi=RegionsOfInterest(zones, margin=7))
+    full = Preprocessor(width=250, input_rgb=input_rgb, copy_frame=False, roi=RegionsOfInterest(zones, margin=7),
+                        full_frame=True)
+    cropped.prepare(frame)
+    full.prepare(frame)
+    assert cropped.source_rect == cropped.input_rect == (106, 66, 376, 256)
+    assert full.source_rect is None
+    assert cropped.gray.shape == (95, 135)
+    assert np.array_equal(cropped.gray, full.gray)
+
+    # Hors des zones, rien n'est détecté
+    cropped.set_reference()
+    changed = np.full_like(frame, 255)
+    cropped.prepare(changed)
+    dilated = cropped.diff()
+    mask = cropped.roi.mask
+    assert np.array_equal(cropped.threshold[mask == 0], np.zeros(np.count_nonzero(mask == 0), np.uint8))
+    assert dilated[mask > 0].any()
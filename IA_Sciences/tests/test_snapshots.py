@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+""" Tests de la capture d'images en rafale (abandoned_objects.snapshots).
+"""
+
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from abandoned_objects.snapshots import ImageWriter, capture_images
+
+
+def frames_source(frames):
+    frames = iter(frames)
+    return lambda: next(frames, None)
+
+
+class BlockedWriter(ImageWriter):
+    """ Les écritures attendent que le test les libère.
+    """
+
+    def __init__(self, *args, **kwargs):
+        ImageWriter.__init__(self, *args, **kwargs)
+        self.release = threading.Event()
+
+    def _write(self, buf, path, timestamp, index):
+        self.release.wait(5)
+        ImageWriter._write(self, buf, path, timestamp, index)
+
+
+def test_pending_images_are_bounded_by_the_buffer_pool(tmp_path):
+    writer = BlockedWriter(max_pending=2, workers=2)
+    frames = [np.full((8, 8, 3), value, np.uint8) for value in range(6)]
+    done = threading.Event()
+
+    def capture():
+        capture_images(frames_source(frames), writer, os.path.join(str(tmp_path), "image_{index}.png"), count=0)
+        done.set()
+    threading.Thread(target=capture, daemon=True).start()
+    # La capture attend un buffer libre : pas plus de 2 images en mémoire
+    assert not done.wait(0.2)
+    assert writer.allocated == 2 and writer.stalls >= 1
+    writer.release.set()
+    assert done.wait(5)
+    writer.close()
+    assert writer.allocated == 2 and writer.written == 6
+    # Les buffers sont réutilisés : chaque fichier a bien la frame copiée au moment de la capture
+    for value in range(6):
+        image = cv2.imread(os.path.join(str(tmp_path), "image_{0}.png".format(value)))
+        assert (image == value).all()
+
+
+def test_manifest_describes_each_kept_image(tmp_path):
+    manifest = os.path.join(str(tmp_path), "manifest.jsonl")
+    writer = ImageWriter("jpg", manifest=manifest)
+    black = np.zeros((32, 32, 3), np.uint8)
+    white = np.full((32, 32, 3), 255, np.uint8)
+    # Les images identiques à la dernière gardée sont ignorées
+    stats = capture_images(frames_source([black, black, white, white, black]), writer,
+                           os.path.join(str(tmp_path), "image_{index}.png"), count=0, dedup_threshold=2.0)
+    writer.close()
+    assert (stats["captured"], stats["kept"], stats["skipped"]) == (5, 3, 2)
+    with open(manifest) as f:
+        entries = sorted((json.loads(line) for line in f), key=lambda entry: entry["index"])
+    assert [entry["index"] for entry in entries] == [0, 1, 2]
+    for entry in entries:
+        # Le format du writer impose l'extension
+        assert entry["path"].endswith("image_{0}.jpg".format(entry["index"]))
+        assert os.path.getsize(entry["path"]) == entry["bytes"]
+
+
+def test_encoding_errors_are_counted(tmp_path):
+    writer = ImageWriter("jpg")
+    # 5 canaux : cv2.imencode lève cv2.error
+    writer.submit(np.zeros((8, 8, 5), np.uint8), os.path.join(str(tmp_path), "image.jpg"))
+    writer.close()
+    assert writer.failed == 1 and writer.written == 0
+
+
+def test_several_images_need_a_placeholder(tmp_path):
+    writer = ImageWriter()
+    with pytest.raises(ValueError):
+        capture_images(frames_source([]), writer, os.path.join(str(tmp_path), "image.png"), count=3)
+    stats = capture_images(frames_source([np.zeros((8, 8, 3), np.uint8)]), writer,
+                           os.path.join(str(tmp_path), "image.png"), count=1)
+    writer.close()
+    assert stats["kept"] == 1
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+""" Tests des sources de frames (abandoned_objects.sources).
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from abandoned_objects.sources import BackgroundReader, ImageDirectorySource
+
+
+def write_images(folder, names):
+    for value, name in enumerate(names):
+        cv2.imwrite(os.path.join(str(folder), name), np.full((4, 4, 3), value * 10, np.uint8))
+
+
+def test_capture_timestamps_give_clock_and_order(tmp_path):
+    write_images(tmp_path, ["image_1507456790.5.png", "image_1507456789.25.png", "image_1507456789.png"])
+    source = ImageDirectorySource(str(tmp_path))
+    assert [stamp for stamp, _ in source.files] == [1507456789.0, 1507456789.25, 1507456790.5]
+
+
+def test_numbered_frames_use_fps(tmp_path):
+    write_images(tmp_path, ["frame_0002.png", "frame_0001.png", "frame_0003.png"])
+    source = ImageDirectorySource(str(tmp_path), fps=4.0)
+    assert [stamp for stamp, _ in source.files] == [0.0, 0.25, 0.5]
+    assert [os.path.basename(path) for _, path in source.files] == ["frame_0001.png", "frame_0002.png", "frame_0003.png"]
+
+
+@pytest.mark.parametrize("names", [
+    ["image_1.png", "frame_2.png"],             # un seul fichier sans timestamp suffit à revenir à fps
+    ["image_1.png", "image_2_left.png"],
+    ["cam2_image_1.png", "cam2_image_2.png"],
+])
+def test_mixed_or_foreign_names_use_fps(tmp_path, names):
+    write_images(tmp_path, names)
+    source = ImageDirectorySource(str(tmp_path), fps=2.0)
+    assert [stamp for stamp, _ in source.files] == [0.0, 0.5]
+
+
+def test_reader_without_frames_fails_at_construction():
+    class NoFrames(BackgroundReader):
+        pass
+
+    with pytest.raises(TypeError):
+        NoFrames()
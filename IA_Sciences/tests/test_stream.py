@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+""" Tests du serveur MJPEG (abandoned_objects.stream).
+"""
+
+import socket
+import threading
+import time
+
+import numpy as np
+
+from abandoned_objects.stream import StreamServer
+
+
+def test_unpublished_window_does_not_spin():
+    server = StreamServer(port=0, windows=("frame", "gray"), fps=1000).start()
+    calls = []
+    wait_frame = server.wait_frame
+    server.wait_frame = lambda *args: calls.append(1) or wait_frame(*args)
+
+    client = socket.create_connection(("127.0.0.1", server.port))
+    client.sendall(b"GET /stream/gray.mjpg HTTP/1.0\r\n\r\n")
+    # Seule la fenêtre "frame" est publiée, 20 fois en 0.5 s
+    for _ in range(20):
+        server.publish({"frame": np.zeros((8, 8, 3), np.uint8)})
+        time.sleep(0.025)
+    client.close()
+    server.stop()
+    # Un appel par image publiée (plus quelques délais dépassés), et non des milliers
+    assert 0 < len(calls) <= 40
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+""" Tests du seau à jetons et de l'identification partagée entre caméras (abandoned_objects.supervisor).
+"""
+
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from abandoned_objects.recognition import RecognitionError
+from abandoned_objects.supervisor import RecognitionService, RemoteRecognizer, Supervisor, TokenBucket
+
+
+class FakeClock:
+    """ Horloge dont le temps n'avance que par sleep().
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_charges_batches_larger_than_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=8, burst=4, clock=clock, sleep=clock.sleep)
+    # 4 jetons disponibles d'emblée, les 46 autres arrivent à 8 par seconde
+    bucket.acquire(50)
+    assert clock.now == pytest.approx(5.75)
+    # Le seau est vide : une image de plus attend un huitième de seconde
+    bucket.acquire(1)
+    assert clock.now == pytest.approx(5.875)
+
+
+def test_token_bucket_rate_over_many_batches():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        bucket.acquire(6)
+    # 60 images, dont 2 d'avance : 58 / 4 secondes
+    assert clock.now == pytest.approx(14.5)
+    assert bucket.waited == pytest.approx(14.5)
+
+
+def test_remote_recognizer_ignores_responses_of_another_session():
+    service_end, camera_end = multiprocessing.Pipe()
+    recognizer = RemoteRecognizer(camera_end, camera=0, timeout=5)
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("tags", recognizer.predict(["img"])))
+    thread.start()
+    call_id, _, _ = service_end.recv()
+    assert call_id[1] == 1
+    # Une réponse d'une autre session ne répond pas à l'appel
+    service_end.send((("autre", 1), [["ancien"]], None))
+    time.sleep(0.05)
+    assert "tags" not in result
+    service_end.send((call_id, [["nouveau"]], None))
+    thread.join(timeout=5)
+    assert result["tags"] == [["nouveau"]]
+    service_end.close()
+    recognizer.close()
+
+
+class EchoBackend:
+    def predict(self, images):
+        return [[image] for image in images]
+
+
+class BrokenBackend:
+    def predict(self, images):
+        raise KeyError("outputs")
+
+
+def test_recognition_service_answers_unexpected_errors():
+    service = RecognitionService(BrokenBackend(), workers=1)
+    service_end, camera_end = multiprocessing.Pipe()
+    service.attach(0, service_end)
+    recognizer = RemoteRecognizer(camera_end, camera=0, timeout=5)
+    start = time.monotonic()
+    with pytest.raises(RecognitionError, match="outputs"):
+        recognizer.predict(["img"])
+    # La caméra a reçu l'erreur tout de suite, sans attendre son délai
+    assert time.monotonic() - start < 1
+    assert service.failed == 1
+    recognizer.close()
+    service.close()
+
+
+def test_recognition_service_survives_a_half_written_request():
+    service = RecognitionService(EchoBackend(), workers=1)
+    # Processus tué au milieu d'un envoi : l'en-tête annonce 1000 octets, seuls 3 sont écrits
+    dead_service_end, dead_camera_end = multiprocessing.Pipe()
+    service.attach(0, dead_service_end)
+    os.write(dead_camera_end.fileno(), struct.pack("!i", 1000) + b"abc")
+    dead_camera_end.close()
+
+    # La caméra relancée a sa propre connexion, et la première caméra n'est pas dérangée
+    service_end, camera_end = multiprocessing.Pipe()
+    service.attach(0, service_end)
+    other_service_end, other_camera_end = multiprocessing.Pipe()
+    service.attach(1, other_service_end)
+    recognizer = RemoteRecognizer(camera_end, camera=0, timeout=5)
+    other = RemoteRecognizer(other_camera_end, camera=1, timeout=5)
+    assert recognizer.predict(["a"]) == [["a"]]
+    assert other.predict(["b"]) == [["b"]]
+    recognizer.close()
+    other.close()
+    service.close()
+
+
+def write_scene(folder, count=40):
+    """ Une scène fixe, puis un objet posé qui ne bouge plus.
+    """
+    for idx in range(count):
+        frame = np.full((120, 160, 3), 90, np.uint8)
+        if idx >= 10:
+            cv2.rectangle(frame, (60, 40), (100, 80), (20, 200, 240), -1)
+        cv2.imwrite(os.path.join(str(folder), "frame_{0:04d}.png".format(idx)), frame)
+
+
+def test_hung_camera_is_replaced_with_new_connections(tmp_path):
+    write_scene(tmp_path)
+    camera = {"id": "hall", "source": "images:" + str(tmp_path), "restart": "always"}
+    supervisor = Supervisor([camera], recognizer="fake", pin_cpus=False, heartbeat_timeout=1, restart_delay=0,
+                            stop_timeout=0.5)
+    worker = supervisor.workers[0]
+    supervisor._start(worker)
+    process, events = worker.process, worker.events
+    # Processus gelé : il n'avance plus
+    os.kill(process.pid, signal.SIGSTOP)
+    worker.heartbeat[0] = time.time() - 10
+    supervisor._check(worker, time.time())
+    assert process.exitcode is not None and process.exitcode < 0
+    assert events.closed
+    assert worker.process is not process and worker.events is not None
+    supervisor.close()
+    assert not worker.process.is_alive()
+
+
+def test_events_of_all_cameras_are_merged(tmp_path):
+    write_scene(tmp_path)
+    cameras = [{"id": name, "source": "images:" + str(tmp_path), "detection": {"min_object_area": 100}}
+               for name in ("quai", "hall")]
+    received = []
+    supervisor = Supervisor(cameras, pin_cpus=False, on_event=received.append)
+    supervisor.run(duration=60)
+    assert all(worker.finished for worker in supervisor.workers)
+    assert set(event["camera"] for event in received) == {"quai", "hall"}
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+""" Tests de l'appariement des formes avec les objets suivis (abandoned_objects.tracking).
+"""
+
+import numpy as np
+
+from abandoned_objects.tracking import ObjectStore
+
+
+def naive_match(objects, boxes, threshold, next_id):
+    """ Appariement de référence, forme par forme, comme la boucle historique de Detection.
+        @objects : liste de [id, box] (modifiée).
+    """
+    known = list(objects)
+    ids = []
+    new = []
+    for box in boxes:
+        best = None
+        for id, obj_box in known:
+            distance = np.abs(np.asarray(obj_box) - box).max()
+            if distance <= threshold and (best is None or distance < best[0]):
+                best = (distance, id)
+        if best is not None:
+            ids.append(best[1])
+            continue
+        for id, new_box in new:
+            if np.abs(np.asarray(new_box) - box).max() <= threshold:
+                ids.append(id)
+                break
+        else:
+            ids.append(next_id)
+            new.append((next_id, box))
+            objects.append([next_id, box])
+            next_id += 1
+    return ids, next_id
+
+
+def test_shape_refreshes_the_nearest_known_object():
+    store = ObjectStore(movement_threshold=10)
+    a = store.add(100, 100, 50, 50, now=0)
+    b = store.add(106, 100, 50, 50, now=0)
+    ids = store.match([[105, 100, 50, 50]], now=1)
+    assert ids == [b]
+    assert store[b]["last_seen"] == 1
+    assert store[a]["last_seen"] == 0
+
+
+def test_shape_beyond_threshold_creates_an_object():
+    store = ObjectStore(movement_threshold=10)
+    a = store.add(100, 100, 50, 50, now=0)
+    ids = store.match([[111, 100, 50, 50]], now=1)
+    assert ids != [a]
+    assert len(store) == 2
+    assert store[ids[0]]["first_seen"] == 1
+
+
+def test_near_identical_new_shapes_share_one_object():
+    store = ObjectStore(movement_threshold=10)
+    ids = store.match([[10, 10, 20, 20], [500, 500, 20, 20], [12, 11, 20, 20], [18, 18, 22, 20]], now=0)
+    assert ids[0] == ids[2] == ids[3]
+    assert ids[1] != ids[0]
+    assert len(store) == 2
+
+
+def test_per_shape_thresholds():
+    store = ObjectStore(movement_threshold=5, max_movement_threshold=30)
+    a = store.add(100, 100, 50, 50, now=0)
+    ids = store.match([[120, 100, 50, 50], [300, 300, 10, 10]], now=1, thresholds=[30, 5])
+    assert ids[0] == a
+    assert len(store) == 2
+
+
+def test_matches_naive_reference_on_random_frames():
+    rng = np.random.RandomState(0)
+    store = ObjectStore(movement_threshold=10, capacity=4)
+    objects = []
+    next_id = 1
+    for frame in range(20):
+        # Des formes groupées autour de quelques centres, pour avoir des doublons et des objets proches
+        centers = rng.randint(0, 400, (15, 2))
+        boxes = np.concatenate([centers + rng.randint(-12, 13, (15, 2)), rng.randint(10, 30, (15, 2))], axis=1)
+        boxes = np.concatenate([boxes, boxes[:5] + rng.randint(-6, 7, (5, 4))])
+        expected, next_id = naive_match(objects, boxes, 10, next_id)
+        assert store.match(boxes, now=frame) == expected
+
+
+def test_many_new_shapes_are_deduplicated():
+    store = ObjectStore(movement_threshold=10)
+    grid = np.array([[x, y, 20, 20] for x in range(0, 2000, 40) for y in range(0, 2000, 40)])
+    boxes = np.concatenate([grid, grid + 3])
+    ids = store.match(boxes, now=0)
+    assert len(store) == len(grid)
+    assert ids[:len(grid)] == ids[len(grid):]